@@ -0,0 +1,3 @@
+"""
+Benchmarks for letter - see bench.run
+"""
@@ -0,0 +1,226 @@
+"""
+Benchmark letter's hot paths.
+
+Run from the root of the repository:
+
+    $ python -m bench.run > before.json
+    $ python -m bench.run --iterations 5000 --only deliver
+
+Each benchmark reports, as JSON on stdout:
+
+    ops_per_sec  calls (messages, lookups, renders...) per second
+    p50_ms       median latency of one call
+    p99_ms       99th percentile latency of one call
+    peak_rss_kb  peak resident set size of the process so far
+
+Delivery is measured end to end against the in-process SMTP sink from
+the test suite, so the numbers include SMTP round trips on loopback.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import letter
+from test.smtpsink import SMTPSink
+
+ATTACHMENT_SIZES = (1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process, in kilobytes.
+
+    Return: int
+    Exceptions: None
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def percentile(timings, pct):
+    """
+    Return the PCT percentile of the sorted list TIMINGS.
+
+    Arguments:
+    - `timings`: [float]
+    - `pct`: int
+
+    Return: float
+    Exceptions: None
+    """
+    return timings[min(len(timings) - 1, int(len(timings) * pct / 100.0))]
+
+
+def measure(fn, iterations):
+    """
+    Call FN ITERATIONS times, and summarise how long it took.
+
+    Arguments:
+    - `fn`: callable
+    - `iterations`: int
+
+    Return: dict
+    Exceptions: None
+    """
+    fn()  # Warm up any caches, as a long running process would have.
+    timings = []
+    clock = time.perf_counter
+    start = clock()
+    for i in range(iterations):
+        t = clock()
+        fn()
+        timings.append(clock() - t)
+    elapsed = clock() - start
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 4),
+        'p99_ms': round(percentile(timings, 99) * 1000, 4),
+        'peak_rss_kb': peak_rss_kb(),
+        }
+
+
+def setup_templates(tmpdir, count=200):
+    """
+    Write a template directory of COUNT templates to TMPDIR, so that
+    lookups have something to search through.
+
+    Return: str
+    Exceptions: None
+    """
+    tpls = os.path.join(tmpdir, 'templates')
+    os.mkdir(tpls)
+    for i in range(count):
+        with open(os.path.join(tpls, 'filler{0}.txt'.format(i)), 'w') as fh:
+            fh.write('Filler')
+    with open(os.path.join(tpls, 'newsletter.txt'), 'w') as fh:
+        fh.write('Hi {{ name }},\n{% for item in items %}* {{ item }}\n{% endfor %}')
+    with open(os.path.join(tpls, 'newsletter.html'), 'w') as fh:
+        fh.write('<h1>Hi {{ name }}</h1><ul>{% for item in items %}'
+                 '<li>{{ item }}</li>{% endfor %}</ul>')
+    return tpls
+
+
+def bench_find_tpl(tmpdir, iterations):
+    postie = letter.BasePostman(setup_templates(tmpdir))
+    return {'find_tpl': measure(lambda: postie._find_tpl('newsletter', extension='.html'),
+                                iterations)}
+
+
+def bench_body(tmpdir, iterations):
+    postie = letter.BasePostman(setup_templates(tmpdir))
+    context = {'name': 'Larry', 'items': ['Item {0}'.format(i) for i in range(20)]}
+    with postie.template('newsletter'):
+        return {'body': measure(lambda: postie.body(**context), iterations)}
+
+
+def bench_mime(tmpdir, iterations):
+    mailer = letter.BaseSMTPMailer()
+    plain, html = 'Hai Larry\n' * 50, '<p>Hai Larry</p>\n' * 50
+
+    def build():
+        msg, to = mailer.message('bill@example.com', 'larry@example.com', 'Hi',
+                                 plain=plain, html=html)
+        msg.as_string()
+    return {'mime': measure(build, iterations)}
+
+
+def bench_prepared(tmpdir, iterations):
+    path = os.path.join(tmpdir, 'brochure.pdf')
+    with open(path, 'wb') as fh:
+        fh.write(os.urandom(100 * 1024))
+    mailer = letter.BaseSMTPMailer()
+    plain, html = 'Hai Larry\n' * 50, '<p>Hai Larry</p>\n' * 50
+
+    def build():
+        msg, to = mailer.message('bill@example.com', 'larry@example.com', 'Hi',
+                                 plain=plain, html=html, attach=path)
+        letter._flatten(msg)
+    prepared = mailer.prepare('bill@example.com', 'Hi', attach=path)
+    return {
+        'mime_attachment': measure(build, iterations),
+        'prepared_attachment': measure(
+            lambda: prepared.render('larry@example.com', plain=plain, html=html, wire=True),
+            iterations),
+        }
+
+
+def bench_attachment(tmpdir, iterations):
+    results = {}
+    for size in ATTACHMENT_SIZES:
+        path = os.path.join(tmpdir, 'attachment-{0}.bin'.format(size))
+        with open(path, 'wb') as fh:
+            fh.write(os.urandom(size))
+        attachment = letter.Attachment(path)
+        # Scale down so that the big files don't take all day.
+        n = max(1, iterations * 1024 // max(size, 1024) // 10)
+        results['attachment_{0}'.format(size)] = measure(attachment.as_msg, n)
+    return results
+
+
+def bench_deliver(tmpdir, iterations):
+    with SMTPSink() as sink:
+        mailer = letter.SMTPMailer(sink.host, sink.port)
+        try:
+            result = measure(lambda: mailer.send('bill@example.com', 'larry@example.com',
+                                                 'Hi', plain='Hai Larry'), iterations)
+        finally:
+            mailer.close()
+    return {'deliver': result}
+
+
+BENCHMARKS = {
+    'find_tpl': bench_find_tpl,
+    'body': bench_body,
+    'mime': bench_mime,
+    'prepared': bench_prepared,
+    'attachment': bench_attachment,
+    'deliver': bench_deliver,
+    }
+
+
+def run(names=None, iterations=1000):
+    """
+    Run the benchmarks NAMES (all of them by default).
+
+    Arguments:
+    - `names`: [str]
+    - `iterations`: int
+
+    Return: dict
+    Exceptions: KeyError - for an unknown benchmark
+    """
+    results = {}
+    for name in names or sorted(BENCHMARKS):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            results.update(BENCHMARKS[name](tmpdir, iterations))
+        finally:
+            shutil.rmtree(tmpdir)
+    return {
+        'python': sys.version.split()[0],
+        'letter': letter.__version__,
+        'results': results,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark letter')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='Run just this benchmark (may be repeated)')
+    args = parser.parse_args(argv)
+    json.dump(run(args.only, args.iterations), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
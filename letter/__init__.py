@@ -5,22 +5,28 @@ We assume you're likely to want to send emails from templates.
 Let's make that as easy as possible.
 """
 from letter._version import __version__
+from letter import instrument
+from letter.instrument import listeners as _listeners
 
+import base64
+import collections
 import contextlib
+import contextvars
+import copy
 import email
+import email.utils
 from email import encoders
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.audio import MIMEAudio
-from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
+import importlib
+import io
 import itertools
-import mimetypes
-import smtplib
+import os
+import random
+import re
+import socket
+import threading
+import time
 import types
 
-import ffs
-from ffs.contrib import mold
 from six import u, string_types, text_type
 
 __all__ = [
@@ -32,6 +38,42 @@ __all__ = [
     'teardown_test_environment'
     ]
 
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Stand in for the module NAME, importing it the first time one of its
+    attributes is used.
+
+    Short-lived programs that only build a message or two then don't pay
+    for importing Jinja2, smtplib and friends unless they need them.
+    """
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name__), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(importlib.import_module(self.__name__), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(importlib.import_module(self.__name__), attr)
+
+
+ffs       = _LazyModule('ffs')
+jinja2    = _LazyModule('jinja2')
+mimetypes = _LazyModule('mimetypes')
+smtplib   = _LazyModule('smtplib')
+uuid      = _LazyModule('uuid')
+
+# The email package's MIME classes and generator bring email.policy,
+# headerregistry and friends with them.
+_generator = _LazyModule('email.generator')
+_audio     = _LazyModule('email.mime.audio')
+_base      = _LazyModule('email.mime.base')
+_image     = _LazyModule('email.mime.image')
+_multipart = _LazyModule('email.mime.multipart')
+_text      = _LazyModule('email.mime.text')
+_wire      = _LazyModule('letter._wire')
+
 flatten = lambda x: [item for sublist in x for item in sublist]
 stringy = lambda x: isinstance(x, string_types)
 listy   = lambda x: isinstance(x, (list, tuple))
@@ -39,6 +81,18 @@ listy   = lambda x: isinstance(x, (list, tuple))
 OUTBOX = []
 SMTP   = None
 
+_BARE_EOL    = re.compile(br'\r(?!\n)|(?<!\r)\n')
+_LEADING_DOT = re.compile(br'(?m)^\.')
+
+# A bare address we are prepared to put in an envelope, and an RFC 5322
+# group ("name: member, member;") - whose members may be empty.
+_ADDRESS = re.compile(r'^[^@\s"<>()\[\],;:\\]+@'
+                      r'(?:\[[^\]\s]+\]|[^@\s"<>()\[\],;:\\.]+(?:\.[^@\s"<>()\[\],;:\\.]+)*)$')
+_GROUP   = re.compile(r'^\s*[^:<>"@,]+:(.*);\s*$')
+
+# How we report addresses that never made it into the envelope.
+_BAD_ADDRESS = (553, b'5.1.3 Bad recipient address syntax')
+
 class Error(Exception): pass
 class NoTemplateError(Error): pass
 class NoContentError(Error): pass
@@ -61,19 +115,355 @@ def _stringlist(*args):
     """
     return list(itertools.chain.from_iterable(itertools.repeat(x,1) if stringy(x) else x for x in args if x))
 
+def _frozen(addrs):
+    """
+    Copy ADDRS, a string or list of strings, into something immutable.
+
+    Return: str, tuple or None
+    Exceptions: None
+    """
+    if not addrs:
+        return None
+    return addrs if stringy(addrs) else tuple(addrs)
+
+def _thawed(addrs):
+    """
+    The inverse of _frozen(), for code that wants a string or list.
+
+    Return: str, list or None
+    Exceptions: None
+    """
+    return list(addrs) if isinstance(addrs, tuple) else addrs
+
+def _smtp_bytes(data):
+    """
+    Convert the serialised message DATA into what we send after an
+    SMTP DATA command: CRLF line endings and leading dots doubled.
+
+    Data that needs neither change is returned as it is, uncopied.
+
+    Arguments:
+    - `data`: bytes-like
+
+    Return: bytes-like
+    Exceptions: None
+    """
+    if _BARE_EOL.search(data):
+        data = re.sub(br'(?:\r\n|\n|\r(?!\n))', b'\r\n', data)
+    if _LEADING_DOT.search(data):
+        data = _LEADING_DOT.sub(b'..', data)
+    return data
+
+
+def _flatten(message):
+    """
+    Serialise MESSAGE with CRLF line endings, straight into one buffer.
+
+    Multiparts without a boundary are given a random one.
+
+    Arguments:
+    - `message`: email.message.Message
+
+    Return: memoryview
+    Exceptions: None
+    """
+    buf = io.BytesIO()
+    policy = message.policy.clone(linesep='\r\n')
+    if policy.cte_type == '7bit':
+        # The stock generator may need to re-encode parts as it goes.
+        _generator.BytesGenerator(buf, mangle_from_=False, policy=policy).flatten(message)
+        return buf.getbuffer()
+    for part in message.walk():
+        if part.is_multipart() and part.get_boundary() is None:
+            part.set_boundary('=' * 15 + uuid.uuid4().hex + '==')
+    _wire.WireGenerator(buf, mangle_from_=False, policy=policy).flatten(message)
+    return buf.getbuffer()
+
+
+def _smtp_terminator(data):
+    """
+    Return what must follow DATA to end an SMTP DATA command.
+
+    Arguments:
+    - `data`: bytes-like
+
+    Return: bytes
+    Exceptions: None
+    """
+    return b'.\r\n' if data[-2:] == b'\r\n' else b'\r\n.\r\n'
+
+
+def _smtp_chunks(message, wire=True):
+    """
+    Serialise MESSAGE as the bytes we send after an SMTP DATA command:
+    CRLF line endings and leading dots doubled.  If WIRE is False, leave
+    the dots alone - giving the message as it is.
+
+    The message is serialised once, and handed out as slices of that
+    one buffer rather than copies.  Attachments marked for streaming
+    (see Attachment.as_msg) are read and base64 encoded a chunk at a
+    time as we go, so we never hold more than one chunk of them in
+    memory.
+
+    Arguments:
+    - `message`: email.message.Message
+    - `wire`: bool
+
+    Return: generator of bytes-like
+    Exceptions: None
+    """
+    streams = dict((part.get_payload().encode('ascii'), part.letter_stream)
+                   for part in message.walk() if getattr(part, 'letter_stream', None))
+    data = _flatten(message)
+    data = memoryview(_smtp_bytes(data) if wire else data)
+    if not streams:
+        yield data
+        return
+    markers = re.compile(b'|'.join(re.escape(m) for m in streams))
+    pos = 0
+    for match in markers.finditer(data):
+        if match.start() > pos:
+            yield data[pos:match.start()]
+        # Base64 never starts a line with a dot, so needs no stuffing.
+        for chunk in streams[match.group()].iter_base64():
+            yield chunk
+        pos = match.end()
+    if pos < len(data):
+        yield data[pos:]
+
+
+def _merged(refused, left_out):
+    """
+    Add the addresses LEFT_OUT of a send to those the server REFUSED.
+
+    Arguments:
+    - `refused`: dict or None
+    - `left_out`: dict
+
+    Return: dict or None
+    Exceptions: None
+    """
+    if not left_out:
+        return refused
+    return dict(refused or {}, **left_out)
+
+
+def _counted(chunks, tally):
+    """
+    Pass CHUNKS through, adding up their length in TALLY[0].
+
+    Arguments:
+    - `chunks`: iterable of bytes
+    - `tally`: [int]
+
+    Return: generator of bytes
+    Exceptions: None
+    """
+    for chunk in chunks:
+        tally[0] += len(chunk)
+        yield chunk
+
+
+def _on_wire(s):
+    """
+    Is S a real SMTP session, that we can write to the socket of - rather
+    than a mocked out smtplib (see setup_test_environment())?
+
+    Arguments:
+    - `s`: smtplib.SMTP
+
+    Return: bool
+    Exceptions: None
+    """
+    return isinstance(getattr(s, 'sock', None), socket.socket)
+
+
+def _transient(err):
+    """
+    Is ERR, raised while delivering a message, worth trying again?
+
+    4xx replies and lost connections are; 5xx replies and anything
+    else are not.  Recipients refused outright are only worth another
+    try if every one of them was a 4xx.
+
+    Arguments:
+    - `err`: Exception
+
+    Return: bool
+    Exceptions: None
+    """
+    if isinstance(err, smtplib.SMTPRecipientsRefused):
+        codes = [reply[0] for reply in err.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(err, smtplib.SMTPResponseException):
+        return 400 <= err.smtp_code < 500
+    return isinstance(err, (smtplib.SMTPServerDisconnected, socket.error))
+
+
+def _reusable(err):
+    """
+    Can we carry on using the SMTP session that ERR was raised on?
+
+    Refusals leave the session reset and ready for the next message;
+    anything else might have left it in any state.
+
+    Arguments:
+    - `err`: Exception
+
+    Return: bool
+    Exceptions: None
+    """
+    return (isinstance(err, (smtplib.SMTPSenderRefused, smtplib.SMTPRecipientsRefused,
+                             smtplib.SMTPDataError)) and
+            getattr(err, 'smtp_code', None) != 421)
+
+
+def _backoff(attempt, base, cap):
+    """
+    Return how long to wait before retry number ATTEMPT: a random time
+    up to BASE seconds doubled each attempt, and never more than CAP.
+
+    Arguments:
+    - `attempt`: int - starting from 1
+    - `base`: float
+    - `cap`: float
+
+    Return: float
+    Exceptions: None
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _pipelining(s):
+    """
+    Does the server at the other end of S support ESMTP PIPELINING?
+
+    Arguments:
+    - `s`: smtplib.SMTP
+
+    Return: bool
+    Exceptions: smtplib.SMTPException
+    """
+    s.ehlo_or_helo_if_needed()
+    return s.has_extn('pipelining')
+
+
+def _sendchunks(s, sender, to, chunks):
+    """
+    Like smtplib.SMTP.sendmail, but send the message as CHUNKS of bytes
+    that are already CRLF terminated and dot-stuffed, as they come,
+    without copying them.
+
+    If the server supports PIPELINING, MAIL, every RCPT and DATA go
+    out together, and we then read their replies - one round trip for
+    the envelope however many recipients there are.
+
+    Arguments:
+    - `s`: smtplib.SMTP
+    - `sender`: str
+    - `to`: [str]
+    - `chunks`: iterable of bytes-like
+
+    Return: dict - of refused recipients to (code, msg)
+    Exceptions: smtplib.SMTPSenderRefused
+                smtplib.SMTPRecipientsRefused
+                smtplib.SMTPDataError
+    """
+    commands = [('mail', 'FROM:' + smtplib.quoteaddr(sender))]
+    commands += [('rcpt', 'TO:' + smtplib.quoteaddr(addr)) for addr in to]
+    commands.append(('data', ''))
+    if _pipelining(s):
+        s.send(''.join('{0} {1}\r\n'.format(*c).replace(' \r\n', '\r\n')
+                       for c in commands))
+        replies = [s.getreply() for c in commands]
+    else:
+        replies = []
+        for cmd, args in commands:
+            s.putcmd(cmd, args)
+            replies.append(s.getreply())
+            if cmd == 'mail' and replies[-1][0] != 250:
+                break
+    mail = replies[0]
+    refused = dict((addr, reply) for addr, reply in zip(to, replies[1:-1])
+                   if reply[0] not in (250, 251))
+    data = replies[-1] if len(replies) == len(commands) else (503, b'')
+    if data[0] == 354 and (mail[0] != 250 or len(refused) == len(to)):
+        # A pipelined DATA the server shouldn't have accepted - finish it empty.
+        s.send(b'.\r\n')
+        s.getreply()
+    if mail[0] != 250:
+        s.rset()
+        raise smtplib.SMTPSenderRefused(mail[0], mail[1], sender)
+    if len(refused) == len(to):
+        s.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    if data[0] != 354:
+        s.rset()
+        raise smtplib.SMTPDataError(*data)
+    # Hold each chunk back until we know whether it is the last, so that
+    # for small messages the terminator goes out in the same write.
+    last = b''
+    for chunk in chunks:
+        if last:
+            s.send(last)
+        last = chunk
+    end = _smtp_terminator(last)
+    if len(last) < 64 * 1024:
+        s.send(b''.join((last, end)))
+    else:
+        s.send(last)
+        s.send(end)
+    code, resp = s.getreply()
+    if code != 250:
+        s.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
 
 class Attachment(object):
     """
     A file we're attaching to an email.
     """
+    # Read files to be streamed this many bytes at a time.  A multiple
+    # of 57 so that each chunk encodes to whole 76 character lines.
+    chunk_size = 57 * 1024
+
     def __init__(self, path):
         self.path = ffs.Path(path)
 
-    def as_msg(self):
+    def iter_base64(self):
+        """
+        Read our file a chunk at a time, yielding it base64 encoded in
+        CRLF terminated lines (bar the last).
+
+        Return: generator of bytes
+        Exceptions: IOError
+        """
+        with open(str(self.path), 'rb') as fh:
+            pending = None
+            while True:
+                raw = fh.read(self.chunk_size)
+                if not raw:
+                    break
+                if pending is not None:
+                    yield pending
+                pending = base64.encodebytes(raw).replace(b'\n', b'\r\n')
+            if pending is not None:
+                yield pending[:-2]
+
+    def as_msg(self, stream=False):
         """
         Convert ourself to be a message part of the appropriate
         MIME type.
 
+        If STREAM is True, don't read the file now.  The part's payload
+        is a placeholder, and the part has a LETTER_STREAM attribute
+        pointing back to us, so a mailer can encode the file straight
+        onto the wire at delivery time.
+
+        Arguments:
+        - `stream`: bool
+
         Return: MIMEBase
         Exceptions: None
         """
@@ -89,22 +479,24 @@ class Attachment(object):
             # use a generic bag-of-bits type.
             ctype = 'application/octet-stream'
         maintype, subtype = ctype.split('/', 1)
-        if maintype == 'text':
+        if stream:
+            msg = _base.MIMEBase(maintype, subtype)
+            msg['Content-Transfer-Encoding'] = 'base64'
+            msg.set_payload('letter-stream-' + uuid.uuid4().hex)
+            msg.letter_stream = self
+        elif maintype == 'text':
             # Note: we should handle calculating the charset
-            msg = MIMEText(self.path.read(), _subtype=subtype)
+            msg = _text.MIMEText(self.path.read(), _subtype=subtype)
         elif maintype == 'image':
-            fp = self.path.open('rb')
-            msg = MIMEImage(fp.read(), _subtype=subtype)
-            fp.close()
+            with open(str(self.path), 'rb') as fp:
+                msg = _image.MIMEImage(fp.read(), _subtype=subtype)
         elif maintype == 'audio':
-            fp = self.path.open('rb')
-            msg = MIMEAudio(fp.read(), _subtype=subtype)
-            fp.close()
+            with open(str(self.path), 'rb') as fp:
+                msg = _audio.MIMEAudio(fp.read(), _subtype=subtype)
         else:
-            fp = self.path.open('rb')
-            msg = MIMEBase(maintype, subtype)
-            msg.set_payload(fp.read())
-            fp.close()
+            with open(str(self.path), 'rb') as fp:
+                msg = _base.MIMEBase(maintype, subtype)
+                msg.set_payload(fp.read())
             # Encode the payload using Base64
             encoders.encode_base64(msg)
 
@@ -113,6 +505,324 @@ class Attachment(object):
         return msg
 
 
+class AttachmentCache(object):
+    """
+    A least-recently-used cache of encoded attachment parts, keyed by
+    path, size and modification time.
+
+    Sending the same file to many people then only reads and encodes
+    it once.  We hold at most MAX_BYTES of encoded payload; parts
+    bigger than that are never cached.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size      = 0
+        self._parts    = collections.OrderedDict()
+        self._lock     = threading.Lock()
+
+    def get(self, attachment, stat=None):
+        """
+        Return a MIME part for ATTACHMENT, encoding it only if we don't
+        already have an up to date copy.
+
+        Each call returns a fresh copy of the part, which the caller is
+        free to attach to a message.
+
+        Arguments:
+        - `attachment`: Attachment
+        - `stat`: os.stat_result for ATTACHMENT, if the caller has one
+
+        Return: MIMEBase
+        Exceptions: OSError
+        """
+        if stat is None:
+            stat = os.stat(str(attachment.path))
+        key = (str(attachment.path), stat.st_size, stat.st_mtime)
+        with self._lock:
+            part = self._parts.pop(key, None)
+            if part is not None:
+                self._parts[key] = part
+        if part is None:
+            part = attachment.as_msg()
+            self._put(key, part)
+        return copy.deepcopy(part)
+
+    def _put(self, key, part):
+        """
+        Remember PART as KEY, evicting the least recently used parts to
+        stay within our byte budget.
+
+        Arguments:
+        - `key`: tuple
+        - `part`: MIMEBase
+
+        Return: None
+        Exceptions: None
+        """
+        cost = len(part.get_payload())
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            # Any other version of this file is now stale.
+            for stale in [k for k in self._parts if k[0] == key[0]]:
+                self.size -= len(self._parts.pop(stale).get_payload())
+            self._parts[key] = part
+            self.size += cost
+            while self.size > self.max_bytes:
+                old_key, old = self._parts.popitem(last=False)
+                self.size -= len(old.get_payload())
+
+    def clear(self):
+        """
+        Forget every part we have encoded.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self._parts.clear()
+            self.size = 0
+
+
+class Recipients(object):
+    """
+    The To, Cc and Bcc addresses of a message, each parsed once.
+
+    Addresses are de-duplicated across all three - an address in both
+    To and Bcc is only delivered to once.  Domains are compared without
+    regard to case, local parts as they are.  Malformed addresses are
+    left out, and reported in REJECTED, which maps each one to the
+    (code, msg) a server refusing it would give.
+
+    TO and CC are as they should appear in headers, BCC and ENVELOPE are
+    bare addresses.
+    """
+    def __init__(self, to=None, cc=None, bcc=None):
+        self.to       = []
+        self.cc       = []
+        self.bcc      = []
+        self.envelope = []
+        self.rejected = collections.OrderedDict()
+        self._seen    = set()
+        for field, addrs in (('to', to), ('cc', cc), ('bcc', bcc)):
+            for raw in _stringlist(addrs):
+                self._add(getattr(self, field), raw, field == 'bcc')
+
+    def __len__(self):
+        return len(self.envelope)
+
+    def _add(self, field, raw, bare):
+        """
+        Parse the address, or addresses, RAW, and add them to FIELD and
+        our envelope.
+
+        Arguments:
+        - `field`: list
+        - `raw`: str
+        - `bare`: bool - add just the address to FIELD, without any name
+
+        Return: None
+        Exceptions: None
+        """
+        group = _GROUP.match(raw)
+        if group:
+            if not bare:
+                field.append(raw)
+            field, raw, bare = [], group.group(1), True
+        if _ADDRESS.match(raw):
+            # Most addresses are bare - don't pay for the full parser.
+            pairs = [('', raw)]
+        else:
+            pairs = email.utils.getaddresses([raw]) if raw.strip() else []
+        for name, addr in pairs:
+            if not _ADDRESS.match(addr):
+                whole = len(pairs) == 1 or ',' not in raw
+                self.rejected[raw if whole else addr or raw] = _BAD_ADDRESS
+                continue
+            local, _, domain = addr.rpartition('@')
+            key = local + '@' + domain.lower()
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self.envelope.append(addr)
+            field.append(addr if bare or not name else email.utils.formataddr((name, addr)))
+
+    def chunks(self, size):
+        """
+        Split our envelope into lists of at most SIZE addresses - one for
+        each transaction a server limiting recipients to SIZE will take.
+
+        Arguments:
+        - `size`: int
+
+        Return: [[str]]
+        Exceptions: None
+        """
+        return [self.envelope[i:i + size] for i in range(0, len(self.envelope), size)]
+
+
+class PreparedMessage(object):
+    """
+    The parts of a message that are the same for every recipient -
+    headers, attachments, the multipart structure - serialised once,
+    so that each send only serialises its To: header and bodies.
+
+    Build these with BaseSMTPMailer.prepare().
+    """
+    def __init__(self, sender, subject, cc=None, bcc=None, replyto=None, attachments=()):
+        self.sender = sender
+        self.cc     = cc
+        self.bcc    = bcc
+        skeleton = _multipart.MIMEMultipart('mixed')
+        skeleton.set_boundary('=' * 15 + uuid.uuid4().hex + '==')
+        skeleton['Subject'] = u(subject)
+        skeleton['From']    = u(sender)
+        skeleton['To']      = ''
+        if cc:
+            skeleton['Cc']  = ', '.join(Recipients(cc=cc).cc)
+        if replyto:
+            skeleton.add_header('reply-to', replyto)
+        self.policy = skeleton.policy.clone(linesep='\r\n')
+        boundary = skeleton.get_boundary().encode('ascii')
+        headers = list(skeleton.raw_items())
+        split = [h for h, v in headers].index('To')
+        self._delimiter = b'\r\n--' + boundary + b'\r\n'
+        self._head = self._static(b''.join(self.policy.fold_binary(h, v)
+                                           for h, v in headers[:split]))
+        self._tail = self._static(b''.join(self.policy.fold_binary(h, v)
+                                           for h, v in headers[split + 1:]) +
+                                  b'\r\n--' + boundary + b'\r\n')
+        self._attachments = []
+        for part in attachments:
+            self._attachments.append(self._static(self._delimiter))
+            self._attachments.append(self._static(_flatten(part).tobytes()))
+        self._end = self._static(b'\r\n--' + boundary + b'--\r\n')
+
+    def _static(self, data):
+        """
+        Return DATA as it is, and as we send it after an SMTP DATA
+        command - usually the same object.
+
+        Return: (bytes, bytes)
+        Exceptions: None
+        """
+        return data, _smtp_bytes(data)
+
+    def render(self, to, plain=None, html=None, wire=False):
+        """
+        Assemble the message to TO with the bodies PLAIN and HTML.
+
+        If WIRE is True, the chunks are ready to send after an SMTP DATA
+        command, otherwise they are the message as it is.
+
+        Arguments:
+        - `to`: str or [str]
+        - `plain`: str
+        - `html`: str
+        - `wire`: bool
+
+        Return: ([bytes, ...], [str, ...], dict) - the message, its
+                recipients, and any addresses that were left out for
+                being malformed, mapped to (code, msg)
+        Exceptions: NoContentError
+        """
+        if not plain and not html:
+            raise NoContentError()
+        start = instrument.clock() if _listeners else None
+        i = 1 if wire else 0
+        addrs = Recipients(to, self.cc, self.bcc)
+        chunks = [self._head[i], self.policy.fold_binary('To', ', '.join(addrs.to)),
+                  self._tail[i]]
+        bodies = []
+        if plain:
+            bodies.append(_flatten(_text.MIMEText(u(plain), 'plain')).tobytes())
+        if html:
+            bodies.append(_flatten(_text.MIMEText(u(html), 'html')).tobytes())
+        for n, body in enumerate(bodies):
+            if n:
+                chunks.append(self._delimiter)
+            chunks.append(_smtp_bytes(body) if wire else body)
+        chunks.extend(c[i] for c in self._attachments)
+        chunks.append(self._end[i])
+        if start is not None:
+            instrument.emit('build', start, sum(len(c) for c in chunks))
+        return chunks, addrs.envelope, addrs.rejected
+
+
+class MessageRecord(object):
+    """
+    Everything needed to send a message - addresses, subject, bodies,
+    attachment paths and any extra headers - without the MIME tree.
+
+    Records are small and of a predictable size, so they are what we
+    hold on to while a message waits in a queue or a batch.  MIME is
+    only built when the record is sent.
+
+    Bodies are referenced rather than copied, so records rendering the
+    same text share it.  Address and attachment lists are copied into
+    tuples, so that changing them after the fact can't change the
+    message.
+    """
+    __slots__ = ('sender', 'to', 'subject', 'plain', 'html', 'cc', 'bcc', 'replyto',
+                 'attach', 'headers')
+
+    def __init__(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+                 replyto=None, attach=None, headers=None):
+        if hasattr(headers, 'items'):
+            headers = headers.items()
+        self.sender  = sender
+        self.to      = _frozen(to)
+        self.subject = subject
+        self.plain   = plain
+        self.html    = html
+        self.cc      = _frozen(cc)
+        self.bcc     = _frozen(bcc)
+        self.replyto = replyto
+        self.attach  = _frozen(attach)
+        self.headers = tuple(headers) if headers else None
+
+    def __repr__(self):
+        return '<MessageRecord {0!r} -> {1!r}: {2!r}>'.format(self.sender, self.to, self.subject)
+
+    def message(self, mailer):
+        """
+        Build our MIME message with MAILER.
+
+        Arguments:
+        - `mailer`: BaseSMTPMailer
+
+        Return: (MIMEMultipart, [str])
+        Exceptions: NoContentError, OSError
+        """
+        msg, recipients = mailer.message(
+            self.sender, _thawed(self.to), self.subject, plain=self.plain, html=self.html,
+            cc=_thawed(self.cc), bcc=_thawed(self.bcc), replyto=self.replyto,
+            attach=_thawed(self.attach))
+        for name, value in self.headers or ():
+            msg[name] = value
+        return msg, recipients
+
+    def send(self, mailer):
+        """
+        Send ourself through MAILER.
+
+        Arguments:
+        - `mailer`: a mailer
+
+        Return: whatever MAILER's send() returns
+        Exceptions: NoContentError, NotImplementedError - if we have extra
+                    headers and MAILER doesn't build MIME messages
+        """
+        if hasattr(mailer, 'message'):
+            msg, recipients = self.message(mailer)
+            return mailer.send_message(msg, recipients)
+        if self.headers:
+            raise NotImplementedError('Extra headers need a mailer that builds MIME messages')
+        return mailer.send(self.sender, _thawed(self.to), self.subject, plain=self.plain,
+                           html=self.html, cc=_thawed(self.cc), bcc=_thawed(self.bcc),
+                           replyto=self.replyto, attach=_thawed(self.attach))
+
+
 class BaseMailer(object):
     """
     Mailers either handle the construction and delivery of message
@@ -131,36 +841,830 @@ class BaseMailer(object):
         """
         return ', '.join(isinstance(to, list) and [u(x) for x in to] or [u(to)])
 
-    def sanity_check(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None):
-        """
-        Sanity check the message.
+    def sanity_check(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None):
+        """
+        Sanity check the message.
+
+        If we have PLAIN and HTML versions, send a multipart alternative
+        MIME message, else send whichever we do have.
+
+        If we have neither, raise NoContentError
+
+        Arguments:
+        - `sender`: str
+        - `to`: list
+        - `subject`: str
+        - `plain`: str
+        - `html`: str
+
+        Return: None
+        Exceptions: NoContentError
+        """
+        if not plain and not html:
+            raise NoContentError()
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Hold whatever delivery resources we use open for the
+        duration of the block, so that many messages may be sent
+        without setting them up each time.
+
+        Return: None
+        Exceptions: None
+        """
+        yield
+
+
+class SMTPConnectionPool(object):
+    """
+    A pool of open SMTP sessions to a single relay.
+
+    Sessions are handed out by CONNECT, a callable returning a ready
+    smtplib.SMTP instance (connected, and authenticated if need be).
+    Idle sessions are checked with RSET before reuse, retired after
+    MAX_MESSAGES messages, and closed by a background timer once they
+    have sat idle for more than IDLE_TIMEOUT seconds.  At most SIZE idle
+    sessions are kept.
+    """
+    def __init__(self, connect, size=2, max_messages=100, idle_timeout=30):
+        self.connect      = connect
+        self.size         = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._idle   = []
+        self._sent   = {}
+        self._reaper = None
+        self._lock   = threading.Lock()
+
+    def _close(self, conn):
+        """
+        Politely close CONN, ignoring any errors from an already dead session.
+
+        Arguments:
+        - `conn`: smtplib.SMTP
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self._sent.pop(id(conn), None)
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, socket.error):
+            try:
+                conn.close()
+            except socket.error:
+                pass
+
+    def _healthy(self, conn):
+        """
+        Predicate function to determine whether CONN is still usable.
+
+        Arguments:
+        - `conn`: smtplib.SMTP
+
+        Return: bool
+        Exceptions: None
+        """
+        try:
+            code = conn.rset()[0]
+        except (smtplib.SMTPException, socket.error):
+            return False
+        return code == 250
+
+    def prune(self):
+        """
+        Close any idle sessions that have passed our idle timeout.
+
+        Return: None
+        Exceptions: None
+        """
+        now = time.time()
+        with self._lock:
+            stale = [c for c, t in self._idle if now - t > self.idle_timeout]
+            self._idle = [(c, t) for c, t in self._idle if now - t <= self.idle_timeout]
+        for conn in stale:
+            self._close(conn)
+
+    def _schedule(self):
+        """
+        Start a timer to prune our idle sessions when the oldest of them
+        expires, unless one is already running.
+
+        Must be called with SELF._lock held.
+
+        Return: None
+        Exceptions: None
+        """
+        if self._reaper is not None or not self._idle:
+            return
+        oldest = min(t for c, t in self._idle)
+        delay = max(oldest + self.idle_timeout - time.time(), 0)
+        self._reaper = threading.Timer(delay, self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        """
+        Timer callback. Prune idle sessions, and keep watching any that
+        remain.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self._reaper = None
+        self.prune()
+        with self._lock:
+            self._schedule()
+
+    def acquire(self):
+        """
+        Return a live SMTP session, reusing an idle one if we can.
+
+        Return: smtplib.SMTP
+        Exceptions: smtplib.SMTPException, socket.error
+        """
+        self.prune()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, _ = self._idle.pop()
+            if self._healthy(conn):
+                return conn
+            self._close(conn)
+        conn = self.connect()
+        with self._lock:
+            self._sent[id(conn)] = 0
+        return conn
+
+    def record(self, conn):
+        """
+        Note that a message has been sent over CONN.
+
+        Arguments:
+        - `conn`: smtplib.SMTP
+
+        Return: int - messages sent over CONN so far
+        Exceptions: None
+        """
+        with self._lock:
+            sent = self._sent.get(id(conn), 0) + 1
+            self._sent[id(conn)] = sent
+        return sent
+
+    def release(self, conn, broken=False):
+        """
+        Return CONN to the pool.
+
+        If BROKEN is True, or CONN has hit its message limit, or the
+        pool is full, close it instead.
+
+        Arguments:
+        - `conn`: smtplib.SMTP
+        - `broken`: bool
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            sent = self._sent.get(id(conn), 0)
+            if not broken and sent < self.max_messages and len(self._idle) < self.size:
+                self._idle.append((conn, time.time()))
+                self._schedule()
+                return
+        self._close(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Check out a session for the duration of the block.
+
+        Sessions that raise inside the block are discarded rather than
+        returned to the pool, unless the error was a refusal that leaves
+        them usable.
+
+        Return: smtplib.SMTP
+        Exceptions: smtplib.SMTPException, socket.error
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception as err:
+            self.release(conn, broken=not _reusable(err))
+            raise
+        self.record(conn)
+        self.release(conn)
+
+    def close(self):
+        """
+        Close all idle sessions.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for conn, _ in idle:
+            self._close(conn)
+
+
+class BaseSMTPMailer(BaseMailer):
+    """
+    Construct the message
+
+    Attachments of at least STREAM_THRESHOLD bytes are streamed at
+    delivery time rather than read into memory - only mailers whose
+    deliver() knows how to do that set it.  Smaller attachments are
+    encoded once and kept in an AttachmentCache of up to
+    ATTACHMENT_CACHE_BYTES, shared by every send through this mailer.
+
+    Set SUPPRESSIONS to a suppression list (see letter.suppress) to
+    leave the addresses on it out of every send.
+    """
+    stream_threshold       = None
+    attachment_cache_bytes = 32 * 1024 * 1024
+    max_recipients         = 100
+    suppressions           = None
+
+    @property
+    def attachments(self):
+        """
+        Our AttachmentCache, created on first use.
+        """
+        cache = self.__dict__.get('_attachments')
+        if cache is None:
+            cache = self._attachments = AttachmentCache(self.attachment_cache_bytes)
+        return cache
+
+    def send(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+             replyto=None, attach=None):
+        """
+        Send the message.
+
+        If we have PLAIN and HTML versions, send a multipart alternative
+        MIME message, else send whichever we do have.
+
+        If we have neither, raise NoContentError
+
+        Arguments:
+        - `sender`: str
+        - `to`: list
+        - `subject`: str
+        - `plain`: str
+        - `html`: str
+        - `cc`: str or [str]
+        - `bcc`: str or [str]
+        - `replyto`: str
+        - `attach`: str or [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: NoContentError
+        """
+        msg, recipients = self.message(sender, to, subject, plain=plain, html=html,
+                                       cc=cc, bcc=bcc, replyto=replyto, attach=attach)
+        return self.send_message(msg, recipients)
+
+    def send_message(self, message, recipients):
+        """
+        Deliver MESSAGE, as built by message(), to RECIPIENTS.
+
+        More than MAX_RECIPIENTS are split across transactions.  Addresses
+        message() could not parse, or that we suppress, are reported as
+        refused.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `recipients`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPRecipientsRefused - if every recipient was refused
+        """
+        recipients, left_out = self._envelope(recipients,
+                                              getattr(message, 'letter_rejected', None))
+        if len(recipients) > self.max_recipients:
+            refused = self.deliver_bulk(message, recipients)
+            if len(refused) == len(recipients):
+                raise smtplib.SMTPRecipientsRefused(dict(refused, **left_out))
+        else:
+            refused = self.deliver(message, recipients)
+        return _merged(refused, left_out)
+
+    def send_bulk(self, sender, recipients, subject, plain=None, html=None, to=None,
+                  replyto=None, attach=None):
+        """
+        Send one message to many RECIPIENTS, with as few transfers as
+        possible.
+
+        RECIPIENTS only appear in the envelope, not the headers - the
+        message's To: header is TO, or an empty group if that's None.
+
+        Arguments:
+        - `sender`: str
+        - `recipients`: [str]
+        - `subject`: str
+        - `plain`: str
+        - `html`: str
+        - `to`: str or [str]
+        - `replyto`: str
+        - `attach`: str or [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: NoContentError
+        """
+        msg, _ = self.message(sender, to or 'undisclosed-recipients:;', subject,
+                              plain=plain, html=html, replyto=replyto, attach=attach)
+        recipients = Recipients(bcc=recipients)
+        try:
+            envelope, left_out = self._envelope(recipients.envelope, recipients.rejected)
+        except smtplib.SMTPRecipientsRefused as err:
+            return err.recipients
+        refused = self.deliver_bulk(msg, envelope)
+        refused.update(left_out)
+        return refused
+
+    def suppress(self, recipients):
+        """
+        Leave anyone on our suppression list out of RECIPIENTS.
+
+        Arguments:
+        - `recipients`: [str]
+
+        Return: ([str], dict) - the recipients to send to, and the
+                suppressed ones mapped to (code, msg)
+        Exceptions: None
+        """
+        if self.suppressions is None or not recipients:
+            return recipients, {}
+        return self.suppressions.filter(recipients)
+
+    def _envelope(self, recipients, rejected=None):
+        """
+        Work out who a message to RECIPIENTS actually goes to: everyone
+        not on our suppression list.  The suppressed, and REJECTED -
+        addresses that never made it into RECIPIENTS - are reported as
+        refused.
+
+        Every send goes through here - wrappers and async mailers
+        included - so none of them skips our suppression list.
+
+        Arguments:
+        - `recipients`: [str]
+        - `rejected`: dict of str to (code, msg)
+
+        Return: ([str], dict) - the recipients to send to, and everyone
+                else mapped to (code, msg)
+        Exceptions: smtplib.SMTPRecipientsRefused - if that leaves nobody to send to
+        """
+        recipients, left_out = self.suppress(recipients)
+        if rejected:
+            left_out = dict(rejected, **left_out)
+        if left_out and not recipients:
+            raise smtplib.SMTPRecipientsRefused(left_out)
+        return recipients, left_out
+
+    def deliver_bulk(self, message, to):
+        """
+        Deliver MESSAGE to everyone in TO, MAX_RECIPIENTS to a
+        transaction.
+
+        Batches where every recipient is refused don't stop the rest
+        from going out - they are simply reported with the others.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPException
+        """
+        refused = {}
+        with self.session():
+            for i in range(0, len(to), self.max_recipients):
+                try:
+                    refused.update(self.deliver(message, to[i:i + self.max_recipients]))
+                except smtplib.SMTPRecipientsRefused as err:
+                    refused.update(err.recipients)
+        return refused
+
+    def prepare(self, sender, subject, cc=None, bcc=None, replyto=None, attach=None):
+        """
+        Build the parts of a message that will be the same for every
+        recipient, for send_prepared().
+
+        Attachments are never streamed, but are held encoded in memory
+        for as long as the PreparedMessage is.
+
+        Arguments:
+        - `sender`: str
+        - `subject`: str
+        - `cc`: str or [str]
+        - `bcc`: str or [str]
+        - `replyto`: str
+        - `attach`: str or [str]
+
+        Return: PreparedMessage
+        Exceptions: OSError
+        """
+        parts = [self.attachments.get(Attachment(p)) for p in _stringlist(attach)]
+        return PreparedMessage(sender, subject, cc=cc, bcc=bcc, replyto=replyto,
+                               attachments=parts)
+
+    def message(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+                replyto=None, attach=None):
+        """
+        Construct the MIME message for a send, and the list of addresses
+        it should be delivered to.
+
+        Arguments are as for send().
+
+        Return: (MIMEMultipart, [str])
+        Exceptions: NoContentError
+        """
+        self.sanity_check(sender, to, subject, plain=plain, html=html)
+        start = instrument.clock() if _listeners else None
+        # Create message container - the correct MIME type is multipart/alternative.
+        msg = _multipart.MIMEMultipart('mixed')
+        msg['Subject'] = u(subject)
+        msg['From']    = u(sender)
+        addrs = Recipients(to, cc, bcc)
+        msg['To']      = ', '.join(addrs.to)
+        if addrs.cc:
+            msg['Cc']      = ', '.join(addrs.cc)
+        if addrs.rejected:
+            msg.letter_rejected = addrs.rejected
+
+        recipients = addrs.envelope
+
+        if replyto:
+            msg.add_header('reply-to', replyto)
+
+        # Attach parts into message container.
+        # According to RFC 2046, the last part of a multipart message, in this case
+        # the HTML message, is best and preferred.
+        if plain:
+            msg.attach(_text.MIMEText(u(plain), 'plain'))
+        if html:
+            msg.attach(_text.MIMEText(u(html), 'html'))
+
+        # Deal with attachments.
+        if attach:
+            for p in _stringlist(attach):
+                attachment = Attachment(p)
+                stat = os.stat(str(attachment.path))
+                if self.stream_threshold is not None and stat.st_size >= self.stream_threshold:
+                    msg.attach(attachment.as_msg(stream=True))
+                else:
+                    msg.attach(self.attachments.get(attachment, stat=stat))
+
+        if start is not None:
+            instrument.emit('build', start)
+        return msg, recipients
+
+
+class SMTPMailer(BaseSMTPMailer):
+    """
+    Use SMTP to deliver our message.
+
+    Sessions are kept open in an SMTPConnectionPool and reused
+    between messages.  Attachments of a megabyte or more are streamed.
+    Relays that support PIPELINING get each envelope in one round trip.
+
+    Deliveries that fail with a 4xx reply or a lost connection are tried
+    up to MAX_ATTEMPTS times, with jittered exponential backoff from
+    BACKOFF seconds, until RETRY_BUDGET seconds have passed.  5xx
+    replies fail straight away.
+    """
+    stream_threshold = 1024 * 1024
+    backoff          = 1
+    max_backoff      = 30
+
+    def __init__(self, host, port, pool_size=2, max_messages=100, idle_timeout=30,
+                 max_attempts=3, retry_budget=60):
+        """
+        Store vars
+        """
+        self.host = host
+        self.port = port
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+        self.pool = SMTPConnectionPool(self.connect, size=pool_size,
+                                       max_messages=max_messages,
+                                       idle_timeout=idle_timeout)
+        self._local = threading.local()
+
+    def _retry(self, fn, *args):
+        """
+        Call FN with ARGS, retrying transient failures as our retry
+        settings allow.
+
+        Arguments:
+        - `fn`: callable
+        - `*args`: objects
+
+        Return: whatever FN returns
+        Exceptions: whatever FN last raised
+        """
+        deadline = time.time() + self.retry_budget
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except Exception as err:
+                attempt += 1
+                if attempt >= self.max_attempts or not _transient(err):
+                    raise
+                delay = _backoff(attempt, self.backoff, self.max_backoff)
+                if time.time() + delay > deadline:
+                    raise
+                time.sleep(delay)
+
+    def connect(self):
+        """
+        Open a new session to our relay.
+
+        Return: smtplib.SMTP
+        Exceptions: smtplib.SMTPException, socket.error
+        """
+        start = instrument.clock() if _listeners else None
+        s = smtplib.SMTP(self.host, self.port)
+        if _on_wire(s):
+            # We write whole messages and wait for the reply - don't let
+            # Nagle's algorithm hold the end of one back.
+            s.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if start is not None:
+            instrument.emit('connect', start)
+        return s
+
+    def deliver(self, message, to):
+        """
+        Deliver our message
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPException
+        """
+        return self._retry(self._deliver, message, to)
+
+    def _deliver(self, message, to):
+        with self.connection() as s:
+            start, tally = (instrument.clock() if _listeners else None), [0]
+            if _on_wire(s):
+                chunks = _smtp_chunks(message)
+                if start is not None:
+                    chunks = _counted(chunks, tally)
+                refused = _sendchunks(s, message['From'], to, chunks)
+            else:
+                # A mocked out smtplib - see setup_test_environment()
+                data = b''.join(_smtp_chunks(message, wire=False))
+                tally[0] = len(data)
+                refused = s.sendmail(message['From'], to, data)
+            if start is not None:
+                instrument.emit('send', start, tally[0])
+            return refused
+
+    def deliver_bytes(self, sender, to, data):
+        """
+        Deliver a message that has already been serialised to DATA.
+
+        Arguments:
+        - `sender`: str
+        - `to`: [str]
+        - `data`: bytes
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPException
+        """
+        return self._retry(self._deliver_bytes, sender, to, data)
+
+    def _deliver_bytes(self, sender, to, data):
+        with self.connection() as s:
+            start = instrument.clock() if _listeners else None
+            if _on_wire(s):
+                refused = _sendchunks(s, sender, to, [_smtp_bytes(data)])
+            else:
+                refused = s.sendmail(sender, to, data)
+            if start is not None:
+                instrument.emit('send', start, len(data))
+            return refused
+
+    def send_prepared(self, prepared, to, plain=None, html=None):
+        """
+        Send the PreparedMessage PREPARED to TO, with the bodies PLAIN
+        and HTML.
+
+        Arguments:
+        - `prepared`: PreparedMessage
+        - `to`: str or [str]
+        - `plain`: str
+        - `html`: str
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: NoContentError, smtplib.SMTPException
+        """
+        return self._retry(self._send_prepared, prepared, to, plain, html)
+
+    def _send_prepared(self, prepared, to, plain, html):
+        with self.connection() as s:
+            wire = _on_wire(s)
+            chunks, recipients, rejected = prepared.render(to, plain=plain, html=html,
+                                                           wire=wire)
+            recipients, left_out = self._envelope(recipients, rejected)
+            start = instrument.clock() if _listeners else None
+            if wire:
+                refused = _sendchunks(s, prepared.sender, recipients, chunks)
+            else:
+                # A mocked out smtplib - see setup_test_environment()
+                refused = s.sendmail(prepared.sender, recipients, b''.join(chunks))
+            if start is not None:
+                instrument.emit('send', start, sum(len(c) for c in chunks))
+            return _merged(refused, left_out)
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Deliver every message sent from this thread inside the block
+        over the same SMTP session.
+
+        Return: None
+        Exceptions: None
+        """
+        if getattr(self._local, 'session', False):
+            yield
+            return
+        self._local.session, self._local.conn = True, None
+        try:
+            yield
+        finally:
+            conn = self._local.conn
+            self._local.session, self._local.conn = False, None
+            if conn is not None:
+                self.pool.release(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Check out an SMTP session to send one message over.
+
+        Inside session() this is the session's connection, otherwise
+        a pooled one.
+
+        Return: smtplib.SMTP
+        Exceptions: smtplib.SMTPException, socket.error
+        """
+        if not getattr(self._local, 'session', False):
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        conn = self._local.conn
+        if conn is None:
+            conn = self._local.conn = self.pool.acquire()
+        try:
+            yield conn
+        except Exception as err:
+            if not _reusable(err):
+                self._local.conn = None
+                self.pool.release(conn, broken=True)
+            raise
+        if self.pool.record(conn) >= self.pool.max_messages:
+            self._local.conn = None
+            self.pool.release(conn)
+
+    def close(self):
+        """
+        Close any pooled sessions.
+
+        Return: None
+        Exceptions: None
+        """
+        self.pool.close()
+
+
+class SMTPAuthenticatedMailer(SMTPMailer):
+    """
+    Use authenticated SMTP to deliver our message
+    """
+    def __init__(self, host, port, user, pw, **kwargs):
+        self.user = user
+        self.pw = pw
+        super(SMTPAuthenticatedMailer, self).__init__(host, port, **kwargs)
+
+    def connect(self):
+        """
+        Open a new session to our relay, and authenticate it.
+
+        Return: smtplib.SMTP
+        Exceptions: smtplib.SMTPException, socket.error
+        """
+        s = super(SMTPAuthenticatedMailer, self).connect()
+        try:
+            start = instrument.clock() if _listeners else None
+            s.ehlo()
+            s.starttls()
+            if start is not None:
+                instrument.emit('tls', start)
+                start = instrument.clock()
+            s.login(self.user, self.pw)
+            if start is not None:
+                instrument.emit('auth', start)
+        except Exception:
+            s.close()
+            raise
+        return s
+
+
+class DjangoMailer(BaseMailer):
+    """
+    Send email using whatever is configured in our Django project's
+    email settings etc etc
+
+    BACKEND and any other keyword arguments are passed on to
+    django.core.mail.get_connection().  Inside session(), every message
+    goes over one open backend connection.
+
+    Attachments are encoded once and cached, as for BaseSMTPMailer.
+    Django's backends serialise each message whole, so attachments of
+    at least STREAM_THRESHOLD bytes can't go to the wire a chunk at a
+    time - instead they are encoded from the file a chunk at a time,
+    so only their encoded form is ever held in memory, and not cached.
+    """
+    stream_threshold       = 1024 * 1024
+    attachment_cache_bytes = BaseSMTPMailer.attachment_cache_bytes
+    attachments            = BaseSMTPMailer.attachments
+
+    def __init__(self, backend=None, **kwargs):
+        self.backend = backend
+        self.kwargs  = kwargs
+        self._local  = threading.local()
+
+    def attachment(self, path):
+        """
+        Return the MIME part to attach the file at PATH with.
+
+        Arguments:
+        - `path`: str
+
+        Return: MIMEBase
+        Exceptions: OSError
+        """
+        attachment = Attachment(path)
+        stat = os.stat(str(attachment.path))
+        if self.stream_threshold is None or stat.st_size < self.stream_threshold:
+            return self.attachments.get(attachment, stat=stat)
+        part = attachment.as_msg(stream=True)
+        del part.letter_stream
+        part.set_payload(b''.join(attachment.iter_base64()).decode('ascii'))
+        return part
+
+    def email_message(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+                      attach=None, replyto=None):
+        """
+        Construct the Django email message for a send.
+
+        Arguments are as for send().
+
+        Return: EmailMultiAlternatives
+        Exceptions: NoContentError, OSError
+        """
+        headers = {}
+        if replyto:
+            headers['Reply-To'] = replyto
+
+        self.sanity_check(sender, to, subject, plain=plain, html=html,
+                          cc=cc, bcc=bcc)
 
-        If we have PLAIN and HTML versions, send a multipart alternative
-        MIME message, else send whichever we do have.
+        if not cc:
+            cc = []
+        if not bcc:
+            bcc = []
 
-        If we have neither, raise NoContentError
+        # This comes straight from the docs at
+        # https://docs.djangoproject.com/en/dev/topics/email/
+        from django.core.mail import EmailMultiAlternatives
 
-        Arguments:
-        - `sender`: str
-        - `to`: list
-        - `subject`: str
-        - `plain`: str
-        - `html`: str
+        if not plain:
+            plain = ''
 
-        Return: None
-        Exceptions: NoContentError
-        """
-        if not plain and not html:
-            raise NoContentError()
+        msg = EmailMultiAlternatives(u(subject), u(plain), u(sender), _stringlist(to),
+                                     bcc=bcc, cc=cc, headers=headers)
 
+        if html:
+            msg.attach_alternative(ensure_unicode(html), "text/html")
 
-class BaseSMTPMailer(BaseMailer):
-    """
-    Construct the message
-    """
+        for path in _stringlist(attach):
+            msg.attach(self.attachment(path))
+        return msg
 
     def send(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
-             replyto=None, attach=None):
+             attach=None, replyto=None):
         """
         Send the message.
 
@@ -175,171 +1679,310 @@ class BaseSMTPMailer(BaseMailer):
         - `subject`: str
         - `plain`: str
         - `html`: str
-        - `cc`: str or [str]
-        - `bcc`: str or [str]
+        - `attach`: str or iterable of str
         - `replyto`: str
-        - `attach`: str or [str]
 
         Return: None
         Exceptions: NoContentError
         """
-        self.sanity_check(sender, to, subject, plain=plain, html=html)
-        # Create message container - the correct MIME type is multipart/alternative.
-        msg = MIMEMultipart('mixed')
-        msg['Subject'] = u(subject)
-        msg['From']    = u(sender)
-        msg['To']      = self.tolist(to)
-        if cc:
-            msg['Cc']      = self.tolist(cc)
+        msg = self.email_message(sender, to, subject, plain=plain, html=html, cc=cc, bcc=bcc,
+                                 attach=attach, replyto=replyto)
+        self.send_messages([msg])
+        return
 
-        recipients = _stringlist(to, cc, bcc)
+    def send_messages(self, messages):
+        """
+        Send the Django email MESSAGES over one backend connection - our
+        session's, if we're in one.
 
-        if replyto:
-            msg.add_header('reply-to', replyto)
+        Arguments:
+        - `messages`: [EmailMessage]
 
-        # Attach parts into message container.
-        # According to RFC 2046, the last part of a multipart message, in this case
-        # the HTML message, is best and preferred.
-        if plain:
-            msg.attach(MIMEText(u(plain), 'plain'))
-        if html:
-            msg.attach(MIMEText(u(html), 'html'))
+        Return: int - the number of messages sent
+        Exceptions: whatever our backend raises
+        """
+        with self.session():
+            return self._local.connection.send_messages(messages) or 0
 
-        # Deal with attachments.
-        if attach:
-            for p in _stringlist(attach):
-                msg.attach(Attachment(p).as_msg())
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Send every message from this thread inside the block over the
+        same backend connection.
 
-        self.deliver(msg, recipients)
+        Return: None
+        Exceptions: whatever our backend raises on opening
+        """
+        if getattr(self._local, 'connection', None) is not None:
+            yield
+            return
+        from django.core.mail import get_connection
+        connection = get_connection(self.backend, **self.kwargs)
+        connection.open()
+        self._local.connection = connection
+        try:
+            yield
+        finally:
+            self._local.connection = None
+            connection.close()
 
 
-class SMTPMailer(BaseSMTPMailer):
+class TemplateCache(object):
     """
-    Use SMTP to deliver our message.
+    A least-recently-used cache of compiled Jinja2 templates, keyed
+    by path and modification time.
+
+    Templates are read and compiled the first time they are rendered.
+    If CHECK is True we stat the file on every render and recompile it
+    when it changes, which is handy in development.  Otherwise we
+    trust what we have until it is evicted or the cache is cleared.
     """
+    def __init__(self, size=128, check=False):
+        self.size  = size
+        self.check = check
+        self._tpls = collections.OrderedDict()
+        self._lock = threading.Lock()
 
-    def __init__(self, host, port):
-        """
-        Store vars
+    def get(self, path, check=None):
         """
-        self.host = host
-        self.port = port
+        Return the compiled template at PATH.
 
-    def deliver(self, message, to):
+        If CHECK is given, it overrides SELF.check for this call.
+
+        Arguments:
+        - `path`: Path
+        - `check`: bool
+
+        Return: jinja2.Template
+        Exceptions: None
         """
-        Deliver our message
+        if check is None:
+            check = self.check
+        key = str(path)
+        with self._lock:
+            entry = self._tpls.pop(key, None)
+            if entry is not None:
+                self._tpls[key] = entry
+        if entry is not None and not check:
+            return entry[1]
+        mtime = os.path.getmtime(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        tpl = jinja2.Template(ffs.Path(key).contents)
+        with self._lock:
+            self._tpls.pop(key, None)
+            self._tpls[key] = (mtime, tpl)
+            while len(self._tpls) > self.size:
+                self._tpls.popitem(last=False)
+        return tpl
+
+    def render(self, path, **context):
+        """
+        Render the template at PATH with CONTEXT.
 
         Arguments:
-        - `message`: MIMEMultipart
+        - `path`: Path
+        - `**context`: objects
+
+        Return: unicode
+        Exceptions: None
+        """
+        return self.get(path).render(**context)
+
+    def clear(self):
+        """
+        Forget every template we have compiled.
 
         Return: None
         Exceptions: None
         """
-        # Send the message via local SMTP server.
-        s = smtplib.SMTP(self.host, self.port)
-        # sendmail function takes 3 arguments: sender's address, recipient's address
-        # and message to send - here it is sent as one string.
-        s.sendmail(message['From'], to, message.as_string())
-        s.quit()
-        return
+        with self._lock:
+            self._tpls.clear()
 
 
-class SMTPAuthenticatedMailer(BaseSMTPMailer):
+class TemplateIndex(object):
     """
-    Use authenticated SMTP to deliver our message
+    An index of the template files in a set of directories.
+
+    We list each directory once, and remember what each template name
+    resolved to.  Before answering we check the modification times of
+    the directories involved - each template directory, plus the
+    subdirectory named in NAME if there is one - re-listing and
+    forgetting our answer if any of them has changed.  Call refresh()
+    to start again from scratch.
     """
-    def __init__(self, host, port, user, pw):
-        self.host = host
-        self.port = port
-        self.user = user
-        self.pw = pw
+    def __init__(self):
+        self._listings = {}
+        self._found    = {}
+        self._lock     = threading.Lock()
+
+    def _mtime(self, loc):
+        """
+        Return the modification time of the directory LOC, or None if
+        we can't stat it.
 
+        Arguments:
+        - `loc`: Path
 
-    def deliver(self, message, to):
+        Return: float or None
+        Exceptions: None
         """
-        Deliver our message
+        try:
+            return os.stat(str(loc)).st_mtime
+        except OSError:
+            return None
+
+    def _stamps(self, dirs, name):
+        """
+        Return the modification times that our answers for NAME in
+        DIRS depend on.
 
         Arguments:
-        - `message`: MIMEMultipart
+        - `dirs`: tuple of Path
+        - `name`: str
 
-        Return: None
+        Return: tuple
         Exceptions: None
         """
-        # Send the message via local SMTP server.
-        s = smtplib.SMTP(self.host, self.port)
-        s.ehlo()
-        s.starttls()
-        s.login(self.user, self.pw)
-        # sendmail function takes 3 arguments: sender's address, recipient's address
-        # and message to send - here it is sent as one string.
-        s.sendmail(message['From'], to, message.as_string())
-        s.quit()
-        return
+        locs = list(dirs)
+        subdir = os.path.dirname(name)
+        if subdir:
+            locs.extend(loc + subdir for loc in dirs)
+        return tuple(self._mtime(loc) for loc in locs)
 
+    def _find(self, dirs, stamps, name, extension):
+        """
+        Search DIRS for NAME, using our cached directory listings.
 
-class DjangoMailer(BaseMailer):
-    """
-    Send email using whatever is configured in our Django project's
-    email settings etc etc
-    """
+        Arguments:
+        - `dirs`: tuple of Path
+        - `stamps`: tuple of mtimes, one per dir
+        - `name`: str
+        - `extension`: str
 
-    def send(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
-             attach=None, replyto=None):
+        Return: Path or None
+        Exceptions: None
         """
-        Send the message.
+        found = None
+        for loc, mtime in zip(dirs, stamps):
+            if mtime is None and not loc:
+                continue
+            listing = self._listings.get(loc)
+            if listing is None or listing[0] != mtime:
+                listing = self._listings[loc] = (mtime, list(loc.ls()))
+            contents = [f for f in listing[1] if f.find(name) != -1 and f.endswith(extension)]
+            if contents:
+                found = contents[0]
+                break
+            exact = loc + (name + extension)
+            if exact.is_file:
+                found = exact
+        return found
 
-        If we have PLAIN and HTML versions, send a multipart alternative
-        MIME message, else send whichever we do have.
+    def _lookup(self, dirs, name, extensions):
+        """
+        Return the templates for NAME with each of EXTENSIONS, statting
+        the directories involved just once.
 
-        If we have neither, raise NoContentError
+        Arguments:
+        - `dirs`: [Path, ...]
+        - `name`: str
+        - `extensions`: [str, ...]
+
+        Return: [Path or None, ...]
+        Exceptions: None
+        """
+        start = instrument.clock() if _listeners else None
+        dirs = tuple(dirs)
+        stamps = self._stamps(dirs, name)
+        found = []
+        with self._lock:
+            for extension in extensions:
+                key = (dirs, name, extension)
+                entry = self._found.get(key)
+                if entry is None or entry[0] != stamps:
+                    entry = self._found[key] = (
+                        stamps, self._find(dirs, stamps[:len(dirs)], name, extension))
+                found.append(entry[1])
+        if start is not None:
+            instrument.emit('lookup', start)
+        return found
+
+    def find(self, dirs, name, extension='.jinja2'):
+        """
+        Return a Path object representing the template NAME with
+        EXTENSION, searching DIRS in order, or None.
 
         Arguments:
-        - `sender`: str
-        - `to`: list
-        - `subject`: str
-        - `plain`: str
-        - `html`: str
-        - `attach`: str or iterable of str
-        - `replyto`: str
+        - `dirs`: [Path, ...]
+        - `name`: str
+        - `extension`: str
 
-        Return: None
-        Exceptions: NoContentError
+        Return: Path or None
+        Exceptions: None
         """
-        headers = {}
-        if attach:
-            raise NotImplementedError('Attachments not implemented for Django yet!')
-        if replyto:
-            headers['Reply-To'] = replyto
+        return self._lookup(dirs, name, [extension])[0]
 
-        self.sanity_check(sender, to, subject, plain=plain, html=html,
-                          cc=cc, bcc=bcc)
+    def lookup(self, dirs, name):
+        """
+        Return the plain, html and jinja2 templates for NAME.
 
-        if not cc:
-            cc = []
-        if not bcc:
-            bcc = []
+        Arguments:
+        - `dirs`: [Path, ...]
+        - `name`: str
 
-        # This comes straight from the docs at
-        # https://docs.djangoproject.com/en/dev/topics/email/
-        from django.core.mail import EmailMultiAlternatives
+        Return: (Path or None, Path or None, Path or None)
+        Exceptions: None
+        """
+        return tuple(self._lookup(dirs, name, ['.txt', '.html', '.jinja2']))
 
-        if not plain:
-            plain = ''
+    def refresh(self):
+        """
+        Forget everything we know about our directories.
 
-        msg = EmailMultiAlternatives(u(subject), u(plain), u(sender), _stringlist(to),
-                                     bcc=bcc, cc=cc, headers=headers)
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self._listings.clear()
+            self._found.clear()
 
-        if html:
-            msg.attach_alternative(ensure_unicode(html), "text/html")
 
-        msg.send()
-        return
+class SendResult(collections.namedtuple('SendResult', 'to error refused')):
+    """
+    The outcome of sending one message from a batch.
+
+    ERROR is the exception that stopped the message being sent, if any.
+    REFUSED maps any addresses the server would not accept to its
+    (code, msg) reply - the message still went to everyone else.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None and not self.refused
+
+
+# The templates made active by postie.template(...), keyed by Postman.  We
+# keep them per thread (and per asyncio task), so that a Postman shared
+# between threads never sees anyone else's template.
+_active = contextvars.ContextVar('letter_templates', default={})
 
 
 class BasePostman(object):
     """
     Implement common postman-esque methods
+
+    Compiled templates are cached - set CHECK_TEMPLATES (on the class
+    or on an instance, at any time) to pick up changes to template files
+    without restarting.
+
+    The active template is bound to the current thread, not to us, so
+    one Postman - and its caches - may be shared by any number of
+    threads, each with its own template.
     """
+    template_cache_size = 128
+    check_templates     = False
 
     def __init__(self, templatedir):
         """
@@ -349,6 +1992,8 @@ class BasePostman(object):
             self.tpls = [ffs.Path(t) for t in templatedir]
         else:
             self.tpls = [ffs.Path(templatedir)]
+        self.templates = TemplateCache(self.template_cache_size)
+        self.index = TemplateIndex()
         return
 
     def _find_tpl(self, name, extension='.jinja2'):
@@ -362,18 +2007,7 @@ class BasePostman(object):
         Return: Path or None
         Exceptions: None
         """
-        found = None
-        for loc in self.tpls:
-            if not loc:
-                continue
-            contents = [f for f in loc.ls() if f.find(name) != -1 and f.endswith(extension)]
-            if contents:
-                found = contents[0]
-                break
-            exact = loc + (name + extension)
-            if exact.is_file:
-                found = exact
-        return found
+        return self.index.find(self.tpls, name, extension=extension)
 
     def _find_tpls(self, name):
         """
@@ -400,13 +2034,66 @@ class BasePostman(object):
         - `bcc`: str or [str]
         ` `replyto`: str
 
-        Return: None
+        Return: whatever our mailer's send() returns
         Exceptions: None
         """
-        self.mailer.send(sender, to, subject, plain=message, cc=cc, bcc=bcc, attach=attach, replyto=replyto)
-        return
+        return self.mailer.send(sender, to, subject, plain=message, cc=cc, bcc=bcc,
+                                attach=attach, replyto=replyto)
+
+    def _bind(self, plain, html):
+        active = dict(_active.get())
+        if plain is None and html is None:
+            active.pop(self, None)
+        else:
+            active[self] = (plain, html)
+        _active.set(active)
+
+    @property
+    def plain(self):
+        return _active.get().get(self, (None, None))[0]
+
+    @plain.setter
+    def plain(self, value):
+        self._bind(value, self.html)
+
+    @property
+    def html(self):
+        return _active.get().get(self, (None, None))[1]
+
+    @html.setter
+    def html(self, value):
+        self._bind(self.plain, value)
+
+    def send(self, *args, **kwargs):
+        """
+        Send a Letter - either MESSAGE, or the active template rendered
+        with KWARGS as the context.
+
+        Return: whatever our mailer's send() returns
+        Exceptions: None
+        """
+        if self in _active.get():
+            return self._sendtpl(*args, **kwargs)
+        return self._send(*args, **kwargs)
+
+    def send_template(self, name, sender, to, subject, /, cc=None, bcc=None,
+                      attach=None, replyto=None, **kwargs):
+        """
+        Send the template NAME, rendered with KWARGS as the context,
+        without touching the active template.  The first four arguments
+        are positional-only, so the context may use their names.
+
+        >>> postie.send_template('welcome', 'me@example.com', 'you@example.com', 'Hi', name='You')
+
+        Arguments are as for _sendtpl(), plus:
+        - `name`: str
 
-    send = _send
+        Return: whatever our mailer's send() returns
+        Exceptions: None
+        """
+        with self.template(name):
+            return self._sendtpl(sender, to, subject, cc=cc, bcc=bcc, attach=attach,
+                                 replyto=replyto, **kwargs)
 
     def _sendtpl(self, sender, to, subject, cc=None, bcc=None, attach=None, replyto=None, **kwargs):
         """
@@ -422,13 +2109,93 @@ class BasePostman(object):
         - `replyto`: str
         - `**kwargs`: objects
 
-        Return: None
+        Return: whatever our mailer's send() returns
         Exceptions: None
         """
         plain, html = self.body(**kwargs)
-        self.mailer.send(sender, to, subject, plain=plain, html=html, cc=cc, bcc=bcc,
-                         replyto=replyto, attach=attach)
-        return
+        return self.mailer.send(sender, to, subject, plain=plain, html=html, cc=cc, bcc=bcc,
+                                replyto=replyto, attach=attach)
+
+    def send_many(self, sender, subject, recipients, cc=None, bcc=None, attach=None,
+                  replyto=None):
+        """
+        Send the current template to many recipients, each with their
+        own context.
+
+        RECIPIENTS is an iterable of (to, context) pairs, which we consume
+        lazily, rendering and sending one message at a time over a
+        single mailer session.  A failure for one recipient is recorded
+        and does not stop the rest of the batch.
+
+        If our mailer can send_prepared(), the headers and attachments
+        common to every message are only built once.
+
+        If our mailer delivers in the background, we wait for every
+        delivery to finish so that the results are complete.
+
+        >>> with postie.template('newsletter'):
+        ...     results = postie.send_many('me@example.com', 'News', people)
+
+        Arguments:
+        - `sender`: unicode
+        - `subject`: unicode
+        - `recipients`: iterable of (str or [str], dict)
+        - `cc`: str or [str]
+        - `bcc`: str or [str]
+        - `attach`: str or [str]
+        - `replyto`: str
+
+        Return: [SendResult, ...]
+        Exceptions: NoTemplateError
+        """
+        if not self.plain and not self.html:
+            raise NoTemplateError()
+        prepared = None
+        if hasattr(type(self.mailer), 'send_prepared'):
+            prepared = self.mailer.prepare(sender, subject, cc=cc, bcc=bcc, replyto=replyto,
+                                           attach=attach)
+        sent = []
+        with self.mailer.session():
+            for to, context in recipients:
+                try:
+                    plain, html = self.body(**context)
+                    if prepared is not None:
+                        outcome = self.mailer.send_prepared(prepared, to, plain=plain, html=html)
+                    else:
+                        outcome = self.mailer.send(sender, to, subject, plain=plain, html=html,
+                                                   cc=cc, bcc=bcc, replyto=replyto,
+                                                   attach=attach)
+                except Exception as err:
+                    outcome = err
+                sent.append((to, outcome))
+
+        results = []
+        for to, outcome in sent:
+            # Background mailers hand us a Future rather than the refused dict.
+            if hasattr(outcome, 'result'):
+                try:
+                    outcome = outcome.result()
+                except Exception as err:
+                    outcome = err
+            if isinstance(outcome, Exception):
+                results.append(SendResult(to, outcome, {}))
+            else:
+                results.append(SendResult(to, None, outcome or {}))
+        return results
+
+    def session(self):
+        """
+        Hold our mailer's connection open for the duration of the block,
+        so that several sends - of Letters, say - share it.
+
+        >>> with postie.session():
+        ...     for letter in letters:
+        ...         letter.send()
+
+        Return: context manager
+        Exceptions: None
+        """
+        return self.mailer.session()
 
     def body(self, **kwargs):
         """
@@ -437,17 +2204,22 @@ class BasePostman(object):
         Return: tuple
         Exceptions: None
         """
+        start = instrument.clock() if _listeners else None
+        plain, html = _active.get().get(self, (None, None))
         text_content, html_content = None, None
-        if self.plain:
-            text_content = mold.cast(self.plain, **kwargs)
-        if self.html:
-            html_content = mold.cast(self.html, **kwargs)
+        if plain:
+            text_content = self.templates.get(plain, check=self.check_templates).render(**kwargs)
+        if html:
+            html_content = self.templates.get(html, check=self.check_templates).render(**kwargs)
+        if start is not None:
+            instrument.emit('render', start,
+                            len(text_content or '') + len(html_content or ''))
         return text_content, html_content
 
     @contextlib.contextmanager
     def template(self, name):
         """
-        Set an active template to use with our Postman.
+        Set an active template to use with our Postman, in this thread.
 
         This changes the call signature of send.
 
@@ -457,35 +2229,41 @@ class BasePostman(object):
         Return: None
         Exceptions: None
         """
-        self.plain, self.html = self._find_tpls(name)
-        if not self.plain:
-            self.plain = self._find_tpl(name)
+        plain, html, jinja = self.index.lookup(self.tpls, name)
+        active = dict(_active.get())
+        active[self] = (plain or jinja, html)
+        token = _active.set(active)
         try:
-            self.send = self._sendtpl
             yield
         finally:
-            self.plain, self.html = None, None
-            self.send = self._send
+            _active.reset(token)
 
 
 class SMTPPostman(BasePostman):
     """
     The SMTP Postman is a utility class for using SMTP as
     a delivery method for our messages.
+
+    Extra keyword arguments (POOL_SIZE, MAX_MESSAGES, IDLE_TIMEOUT) are
+    passed to SMTPMailer.
     """
-    def __init__(self, templatedir=None, host='localhost', port=25):
+    def __init__(self, templatedir=None, host='localhost', port=25, **kwargs):
         super(SMTPPostman, self).__init__(templatedir)
-        self.mailer = SMTPMailer(host, port)
+        self.mailer = SMTPMailer(host, port, **kwargs)
 
 
 class SMTPAuthenticatedPostman(BasePostman):
     """
     The SMTP Postman is a utility class for using SMTP as
     a delivery method for our messages.
+
+    Extra keyword arguments (POOL_SIZE, MAX_MESSAGES, IDLE_TIMEOUT) are
+    passed to SMTPAuthenticatedMailer.
     """
-    def __init__(self, templatedir=None, host='localhost', port=25, user=None, pw=None):
+    def __init__(self, templatedir=None, host='localhost', port=25, user=None, pw=None,
+                 **kwargs):
         super(SMTPAuthenticatedPostman, self).__init__(templatedir)
-        self.mailer = SMTPAuthenticatedMailer(host, port, user, pw)
+        self.mailer = SMTPAuthenticatedMailer(host, port, user, pw, **kwargs)
 
 
 class Postman(SMTPPostman):
@@ -495,16 +2273,30 @@ class Postman(SMTPPostman):
     Set up an SMTP mailer at HOST:PORT using TEMPLATEDIR as the place
     to look for templates.
 
-    If BLOCKING is True, use the blocking mailer.
+    If BLOCKING is True, use the blocking mailer.  Otherwise sends
+    return a Future straight away, and the message is delivered by a
+    pool of WORKERS threads, with at most QUEUE_SIZE messages waiting.
 
     Arguments:
     - `templatedir`: str
     - `host`: str
     - `port`: int
+    - `blocking`: bool
+    - `workers`: int
+    - `queue_size`: int
 
     Return: None
     Exceptions: None
     """
+    def __init__(self, templatedir=None, host='localhost', port=25, blocking=True,
+                 workers=2, queue_size=1000):
+        if blocking:
+            super(Postman, self).__init__(templatedir, host=host, port=port)
+            return
+        # Keep one idle session per worker.
+        super(Postman, self).__init__(templatedir, host=host, port=port, pool_size=workers)
+        from letter.background import BackgroundMailer
+        self.mailer = BackgroundMailer(self.mailer, workers=workers, maxsize=queue_size)
 
 
 class DjangoPostman(BasePostman):
@@ -515,7 +2307,6 @@ class DjangoPostman(BasePostman):
         """
         Do Django imports...
         """
-        self.html, self.plain = None, None
         from django.conf import settings
         from django.utils.functional import empty
         if settings._wrapped is empty:
@@ -530,13 +2321,24 @@ class GmailPostman(SMTPAuthenticatedPostman):
     OK, so we're sending emails via Google's SMTP servers.
 
     >>> postie = GmailPostman('.', user='username', pw='password')
+
+    Set PER_MINUTE and PER_DAY to your account's sending limits, and
+    sends will wait rather than run into them - see letter.throttle.
     """
-    def __init__(self, templatedir='.', user=None, pw=None):
+    def __init__(self, templatedir='.', user=None, pw=None, per_minute=None, per_day=None):
         super(GmailPostman, self).__init__(templatedir=templatedir,
                                            host='smtp.gmail.com',
                                            port=587,
                                            user=user,
                                            pw=pw)
+        limits = []
+        if per_minute:
+            limits.append((per_minute, 60))
+        if per_day:
+            limits.append((per_day, 24 * 60 * 60))
+        if limits:
+            from letter.throttle import ThrottledMailer
+            self.mailer = ThrottledMailer(self.mailer, per_user=limits)
 
 
 class Letter(object):
@@ -551,7 +2353,7 @@ class Letter(object):
         if stringy(to):
             to = [to]
         if getattr(klass, 'Body', None):
-            klass.Postie.send(
+            return klass.Postie.send(
                 klass.From,
                 to,
                 subject,
@@ -561,10 +2363,9 @@ class Letter(object):
                 replyto=getattr(klass, 'ReplyTo', None),
                 attach=getattr(klass, 'Attach', None),
                 )
-            return
 
         with klass.Postie.template(klass.Template):
-            klass.Postie.send(
+            return klass.Postie.send(
                 klass.From,
                 to,
                 subject,
@@ -586,13 +2387,16 @@ def _parse_outgoing_mail(sender, to, msgstring):
     Arguments:
     - `sender`: str
     - `to`: str
-    - `msgstring`: str
+    - `msgstring`: str or bytes-like
 
     Return: None
     Exceptions: None
     """
     global OUTBOX
-    OUTBOX.append(email.message_from_string(msgstring))
+    if isinstance(msgstring, (bytes, bytearray, memoryview)):
+        OUTBOX.append(email.message_from_bytes(bytes(msgstring)))
+    else:
+        OUTBOX.append(email.message_from_string(msgstring))
     return
 
 def setup_test_environment():
@@ -0,0 +1,59 @@
+"""
+Serialise messages for the wire.
+
+This lives apart from letter itself so that importing letter doesn't
+import the email package's generator, and the policy machinery that
+comes with it, until a message is first serialised.
+"""
+from email.generator import BytesGenerator
+
+
+class WireGenerator(BytesGenerator):
+    """
+    A BytesGenerator that writes every part straight into the one output
+    buffer.
+
+    The stock generator serialises each part into a buffer of its own
+    and copies that into its parent's, so that it can pick a boundary
+    that appears in none of them - holding several copies of a big
+    message at once.  We need every multipart to have its boundary set
+    already (see letter._flatten()).
+    """
+    block_size = 64 * 1024
+
+    def _write(self, msg):
+        meth = getattr(msg, '_write_headers', None)
+        if meth is None:
+            self._write_headers(msg)
+        else:
+            meth(self)
+        self._dispatch(msg)
+
+    def _handle_multipart(self, msg):
+        subparts = msg.get_payload()
+        if subparts is None:
+            subparts = []
+        elif isinstance(subparts, str):
+            self.write(subparts)
+            return
+        elif not isinstance(subparts, list):
+            subparts = [subparts]
+        boundary = msg.get_boundary()
+        if msg.preamble is not None:
+            self._write_lines(msg.preamble)
+            self.write(self._NL)
+        self.write('--' + boundary + self._NL)
+        for i, part in enumerate(subparts):
+            if i:
+                self.write(self._NL + '--' + boundary + self._NL)
+            self.clone(self._fp).flatten(part, unixfrom=False, linesep=self._NL)
+        self.write(self._NL + '--' + boundary + '--' + self._NL)
+        if msg.epilogue is not None:
+            self._write_lines(msg.epilogue)
+
+    def _write_lines(self, lines):
+        # Rather than splitting the whole payload into a list of lines.
+        if '\r' in lines:
+            return super(WireGenerator, self)._write_lines(lines)
+        for i in range(0, len(lines), self.block_size):
+            self.write(lines[i:i + self.block_size].replace('\n', self._NL))
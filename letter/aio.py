@@ -0,0 +1,666 @@
+"""
+Send letters without blocking the asyncio event loop.
+
+AsyncPostman mirrors the API of the blocking Postmen:
+
+>>> postie = AsyncPostman('templates', host='smtp.example.com', port=587,
+...                       user='me', pw='secret')
+>>> await postie.send('me@example.com', 'you@example.com', 'Hi', 'Hello!')
+>>> async with postie.template('welcome'):
+...     await postie.send('me@example.com', 'you@example.com', 'Hi', name='You')
+
+Requires Python 3.7+.
+"""
+import asyncio
+import base64
+import contextlib
+import smtplib
+import socket
+import ssl
+
+import letter
+from letter import instrument
+from letter.instrument import listeners as _listeners
+
+__all__ = [
+    'AsyncSMTP',
+    'AsyncSMTPMailer',
+    'AsyncPostman'
+    ]
+
+
+def _smtp_data(message):
+    """
+    Serialise MESSAGE as the bytes we send after an SMTP DATA command:
+    CRLF line endings and leading dots doubled, in a single buffer.
+
+    Arguments:
+    - `message`: email.message.Message
+
+    Return: bytes-like
+    Exceptions: None
+    """
+    return letter._smtp_bytes(letter._flatten(message))
+
+
+class AsyncSMTP(object):
+    """
+    A minimal ESMTP client speaking over asyncio streams.
+
+    Errors are raised as the same smtplib exceptions the blocking
+    mailers raise.
+    """
+    def __init__(self, host, port, timeout=30):
+        self.host    = host
+        self.port    = port
+        self.timeout = timeout
+        self.reader  = None
+        self.writer  = None
+        self.esmtp_features = {}
+
+    async def connect(self):
+        """
+        Open a connection, and read the server's greeting.
+
+        Return: None
+        Exceptions: smtplib.SMTPConnectError
+        """
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        code, msg = await self.getreply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, msg)
+
+    async def getreply(self):
+        """
+        Read a (possibly multi-line) reply from the server.
+
+        Return: (int, bytes)
+        Exceptions: smtplib.SMTPServerDisconnected
+        """
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            code = -1
+        return code, b'\n'.join(lines)
+
+    def putcmd(self, cmd):
+        """
+        Queue CMD to be written to the server.
+
+        Arguments:
+        - `cmd`: str
+
+        Return: None
+        Exceptions: None
+        """
+        self.writer.write(cmd.encode('ascii') + b'\r\n')
+
+    async def docmd(self, cmd):
+        """
+        Send CMD and return the server's reply.
+
+        Arguments:
+        - `cmd`: str
+
+        Return: (int, bytes)
+        Exceptions: smtplib.SMTPServerDisconnected
+        """
+        self.putcmd(cmd)
+        await self.writer.drain()
+        return await self.getreply()
+
+    async def ehlo(self, name=None):
+        """
+        Say EHLO, and remember which extensions the server supports.
+
+        Arguments:
+        - `name`: str
+
+        Return: (int, bytes)
+        Exceptions: smtplib.SMTPHeloError
+        """
+        code, msg = await self.docmd('EHLO {0}'.format(name or socket.getfqdn()))
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, msg)
+        self.esmtp_features = {}
+        for line in msg.decode('latin-1').split('\n')[1:]:
+            parts = line.split(None, 1)
+            if parts:
+                self.esmtp_features[parts[0].lower()] = parts[1] if len(parts) > 1 else ''
+        return code, msg
+
+    def has_extn(self, name):
+        """
+        Predicate function to determine whether the server supports the
+        extension NAME.
+
+        Arguments:
+        - `name`: str
+
+        Return: bool
+        Exceptions: None
+        """
+        return name.lower() in self.esmtp_features
+
+    async def starttls(self, context=None):
+        """
+        Upgrade our connection to TLS, and say EHLO again.
+
+        Arguments:
+        - `context`: ssl.SSLContext
+
+        Return: None
+        Exceptions: smtplib.SMTPNotSupportedError, smtplib.SMTPResponseException
+        """
+        if not self.has_extn('starttls'):
+            raise smtplib.SMTPNotSupportedError('STARTTLS extension not supported by server.')
+        code, msg = await self.docmd('STARTTLS')
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, msg)
+        if context is None:
+            context = ssl.create_default_context()
+        loop = asyncio.get_running_loop()
+        protocol = self.writer.transport.get_protocol()
+        transport = await loop.start_tls(self.writer.transport, protocol, context,
+                                         server_hostname=self.host)
+        self.writer = asyncio.StreamWriter(transport, protocol, self.reader, loop)
+        await self.ehlo()
+
+    async def login(self, user, pw):
+        """
+        Authenticate with AUTH PLAIN.
+
+        Arguments:
+        - `user`: str
+        - `pw`: str
+
+        Return: None
+        Exceptions: smtplib.SMTPAuthenticationError
+        """
+        token = base64.b64encode('\0{0}\0{1}'.format(user, pw).encode('utf-8'))
+        code, msg = await self.docmd('AUTH PLAIN ' + token.decode('ascii'))
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, msg)
+
+    async def sendmail(self, sender, recipients, data):
+        """
+        Send DATA, as prepared by _smtp_data, from SENDER to
+        RECIPIENTS.
+
+        If the server supports PIPELINING we send the whole envelope in
+        one go.
+
+        Arguments:
+        - `sender`: str
+        - `recipients`: [str]
+        - `data`: bytes-like
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPSenderRefused
+                    smtplib.SMTPRecipientsRefused
+                    smtplib.SMTPDataError
+        """
+        envelope = ['MAIL FROM:{0}'.format(smtplib.quoteaddr(sender))]
+        envelope.extend('RCPT TO:{0}'.format(smtplib.quoteaddr(r)) for r in recipients)
+        if self.has_extn('pipelining'):
+            for cmd in envelope:
+                self.putcmd(cmd)
+            await self.writer.drain()
+            replies = [await self.getreply() for cmd in envelope]
+        else:
+            replies = [await self.docmd(cmd) for cmd in envelope]
+
+        code, msg = replies[0]
+        if code != 250:
+            await self.rset()
+            raise smtplib.SMTPSenderRefused(code, msg, sender)
+        refused = dict((r, reply) for r, reply in zip(recipients, replies[1:])
+                       if reply[0] not in (250, 251))
+        if len(refused) == len(recipients):
+            await self.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, msg = await self.docmd('DATA')
+        if code != 354:
+            await self.rset()
+            raise smtplib.SMTPDataError(code, msg)
+        self.writer.write(data)
+        self.writer.write(letter._smtp_terminator(data))
+        await self.writer.drain()
+        code, msg = await self.getreply()
+        if code != 250:
+            await self.rset()
+            raise smtplib.SMTPDataError(code, msg)
+        return refused
+
+    async def rset(self):
+        return await self.docmd('RSET')
+
+    async def noop(self):
+        return await self.docmd('NOOP')
+
+    async def quit(self):
+        """
+        Say goodbye, and close our connection.
+
+        Return: None
+        Exceptions: None
+        """
+        try:
+            await self.docmd('QUIT')
+        except (smtplib.SMTPException, OSError, asyncio.TimeoutError):
+            pass
+        self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader, self.writer = None, None
+
+
+class AsyncSMTPMailer(letter.BaseSMTPMailer):
+    """
+    Use SMTP to deliver our messages from asyncio code.
+
+    We open at most MAX_CONNECTIONS sessions to our relay, sharing
+    them between however many deliveries are in flight.  Idle sessions
+    are checked with RSET before reuse, and retired after
+    MAX_MESSAGES messages.
+
+    If USER is set we authenticate, upgrading to TLS first unless
+    STARTTLS is False.
+
+    Transient failures are retried as letter.SMTPMailer retries them.
+    """
+    backoff     = 1
+    max_backoff = 30
+
+    def __init__(self, host, port, user=None, pw=None, starttls=True,
+                 max_connections=4, max_messages=100, timeout=30, max_attempts=3,
+                 retry_budget=60):
+        self.host            = host
+        self.port            = port
+        self.user            = user
+        self.pw              = pw
+        self.starttls        = starttls
+        self.max_connections = max_connections
+        self.max_messages    = max_messages
+        self.timeout         = timeout
+        self.max_attempts    = max_attempts
+        self.retry_budget    = retry_budget
+        self._idle  = []
+        self._sent  = {}
+        self._slots = None
+
+    async def connect(self):
+        """
+        Open a new session to our relay, authenticating if need be.
+
+        Return: AsyncSMTP
+        Exceptions: smtplib.SMTPException, OSError
+        """
+        start = instrument.clock() if _listeners else None
+        conn = AsyncSMTP(self.host, self.port, timeout=self.timeout)
+        await conn.connect()
+        if start is not None:
+            instrument.emit('connect', start)
+        try:
+            await conn.ehlo()
+            if self.user:
+                if self.starttls:
+                    start = instrument.clock() if _listeners else None
+                    await conn.starttls()
+                    if start is not None:
+                        instrument.emit('tls', start)
+                start = instrument.clock() if _listeners else None
+                await conn.login(self.user, self.pw)
+                if start is not None:
+                    instrument.emit('auth', start)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """
+        Check out a session for the duration of the block, waiting for
+        one to come free if MAX_CONNECTIONS are already in use.
+
+        Return: AsyncSMTP
+        Exceptions: smtplib.SMTPException, OSError
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        async with self._slots:
+            conn = None
+            while self._idle and conn is None:
+                conn = self._idle.pop()
+                try:
+                    if (await conn.rset())[0] != 250:
+                        raise smtplib.SMTPServerDisconnected()
+                except (smtplib.SMTPException, OSError, asyncio.TimeoutError):
+                    self._sent.pop(id(conn), None)
+                    conn.close()
+                    conn = None
+            if conn is None:
+                conn = await self.connect()
+            try:
+                yield conn
+            except BaseException as err:
+                if not letter._reusable(err):
+                    # Including cancellation - we can't know what state it left the session in.
+                    self._sent.pop(id(conn), None)
+                    conn.close()
+                else:
+                    self._idle.append(conn)
+                raise
+            sent = self._sent.get(id(conn), 0) + 1
+            if sent >= self.max_messages:
+                self._sent.pop(id(conn), None)
+                await conn.quit()
+            else:
+                self._sent[id(conn)] = sent
+                self._idle.append(conn)
+
+    async def _retry(self, fn, *args):
+        """
+        Await FN with ARGS, retrying transient failures as our retry
+        settings allow.
+
+        Return: whatever FN returns
+        Exceptions: whatever FN last raised
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.retry_budget
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args)
+            except Exception as err:
+                attempt += 1
+                if attempt >= self.max_attempts or not letter._transient(err):
+                    raise
+                delay = letter._backoff(attempt, self.backoff, self.max_backoff)
+                if loop.time() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def send(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+                   replyto=None, attach=None):
+        """
+        Send the message.
+
+        Arguments are as for letter.BaseSMTPMailer.send()
+
+        Return: dict - of refused recipients
+        Exceptions: NoContentError
+        """
+        msg, recipients = self.message(sender, to, subject, plain=plain, html=html,
+                                       cc=cc, bcc=bcc, replyto=replyto, attach=attach)
+        return await self.send_message(msg, recipients)
+
+    async def send_message(self, message, recipients):
+        """
+        Deliver MESSAGE, as built by message(), to RECIPIENTS.
+
+        As letter.BaseSMTPMailer.send_message(), more than MAX_RECIPIENTS
+        are split across transactions, and addresses message() could not
+        parse, or that we suppress, are reported as refused.
+
+        Return: dict - of refused recipients
+        Exceptions: smtplib.SMTPRecipientsRefused - if every recipient was refused
+        """
+        recipients, left_out = self._envelope(recipients,
+                                              getattr(message, 'letter_rejected', None))
+        if len(recipients) > self.max_recipients:
+            refused = await self.deliver_bulk(message, recipients)
+            if len(refused) == len(recipients):
+                raise smtplib.SMTPRecipientsRefused(dict(refused, **left_out))
+        else:
+            refused = await self.deliver(message, recipients)
+        return letter._merged(refused, left_out)
+
+    async def deliver(self, message, to):
+        """
+        Deliver our message
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - of refused recipients
+        Exceptions: smtplib.SMTPException
+        """
+        data = _smtp_data(message)
+        return await self._retry(self._deliver, message['From'], to, data)
+
+    async def _deliver(self, sender, to, data):
+        async with self.connection() as conn:
+            start = instrument.clock() if _listeners else None
+            refused = await conn.sendmail(sender, to, data)
+            if start is not None:
+                instrument.emit('send', start, len(data))
+            return refused
+
+    async def send_prepared(self, prepared, to, plain=None, html=None):
+        """
+        Send the letter.PreparedMessage PREPARED to TO, with the bodies
+        PLAIN and HTML.
+
+        Return: dict - of refused recipients
+        Exceptions: NoContentError, smtplib.SMTPException
+        """
+        chunks, recipients, rejected = prepared.render(to, plain=plain, html=html, wire=True)
+        recipients, left_out = self._envelope(recipients, rejected)
+        refused = await self._retry(self._deliver, prepared.sender, recipients,
+                                    b''.join(chunks))
+        return letter._merged(refused, left_out)
+
+    async def send_bulk(self, sender, recipients, subject, plain=None, html=None, to=None,
+                        replyto=None, attach=None):
+        """
+        Send one message to many RECIPIENTS.
+
+        Arguments are as for letter.BaseSMTPMailer.send_bulk()
+
+        Return: dict - of refused recipients
+        Exceptions: NoContentError
+        """
+        msg, _ = self.message(sender, to or 'undisclosed-recipients:;', subject,
+                              plain=plain, html=html, replyto=replyto, attach=attach)
+        recipients = letter.Recipients(bcc=recipients)
+        try:
+            envelope, left_out = self._envelope(recipients.envelope, recipients.rejected)
+        except smtplib.SMTPRecipientsRefused as err:
+            return err.recipients
+        refused = await self.deliver_bulk(msg, envelope)
+        refused.update(left_out)
+        return refused
+
+    async def deliver_bulk(self, message, to):
+        """
+        Deliver MESSAGE to everyone in TO, MAX_RECIPIENTS to a
+        transaction, over one session.
+
+        Return: dict - of refused recipients
+        Exceptions: smtplib.SMTPException
+        """
+        data = _smtp_data(message)
+        refused = {}
+        async with self.connection() as conn:
+            for i in range(0, len(to), self.max_recipients):
+                try:
+                    refused.update(await conn.sendmail(message['From'],
+                                                       to[i:i + self.max_recipients], data))
+                except smtplib.SMTPRecipientsRefused as err:
+                    refused.update(err.recipients)
+        return refused
+
+    async def close(self):
+        """
+        Close all idle sessions.
+
+        Return: None
+        Exceptions: None
+        """
+        idle, self._idle = self._idle, []
+        self._sent.clear()
+        for conn in idle:
+            await conn.quit()
+
+
+class _Template(object):
+    """
+    Async context manager that makes a template active on a Postman,
+    for the current asyncio context only.
+    """
+    def __init__(self, postie, name):
+        self.postie = postie
+        self.name   = name
+        self._token = None
+
+    async def __aenter__(self):
+        postie = self.postie
+        plain, html, jinja = postie.index.lookup(postie.tpls, self.name)
+        active = dict(letter._active.get())
+        active[postie] = (plain or jinja, html)
+        self._token = letter._active.set(active)
+
+    async def __aexit__(self, *exc):
+        letter._active.reset(self._token)
+
+
+class AsyncPostman(letter.BasePostman):
+    """
+    A Postman whose sends are coroutines, delivering over an
+    AsyncSMTPMailer.
+
+    Templates made active with `async with postie.template(...)` are
+    only active in the task that entered the block, so one AsyncPostman
+    may be shared between any number of concurrent tasks.
+
+    Extra keyword arguments are passed to AsyncSMTPMailer.
+    """
+    def __init__(self, templatedir=None, host='localhost', port=25, user=None, pw=None,
+                 **kwargs):
+        super(AsyncPostman, self).__init__(templatedir)
+        self.mailer = AsyncSMTPMailer(host, port, user=user, pw=pw, **kwargs)
+
+    async def send(self, *args, **kwargs):
+        """
+        Send a Letter - either MESSAGE, or the active template rendered
+        with KWARGS as the context.
+
+        Return: dict - of refused recipients
+        Exceptions: None
+        """
+        if self in letter._active.get():
+            return await self._sendtpl(*args, **kwargs)
+        return await self._send(*args, **kwargs)
+
+    async def _send(self, sender, to, subject, message, cc=None, bcc=None, attach=None,
+                    replyto=None):
+        """
+        Send a Letter (MESSAGE) from SENDER to TO, with the subject SUBJECT
+
+        Return: dict - of refused recipients
+        Exceptions: None
+        """
+        return await self.mailer.send(sender, to, subject, plain=message, cc=cc, bcc=bcc,
+                                      attach=attach, replyto=replyto)
+
+    async def _sendtpl(self, sender, to, subject, cc=None, bcc=None, attach=None,
+                       replyto=None, **kwargs):
+        """
+        Send a Letter from SENDER to TO, with the subject SUBJECT.
+        Use the current template, with KWARGS as the context.
+
+        Return: dict - of refused recipients
+        Exceptions: None
+        """
+        plain, html = self.body(**kwargs)
+        return await self.mailer.send(sender, to, subject, plain=plain, html=html, cc=cc,
+                                      bcc=bcc, replyto=replyto, attach=attach)
+
+    def template(self, name):
+        """
+        Set an active template to use with our Postman.
+
+        >>> async with postie.template('welcome'):
+        ...     await postie.send(...)
+
+        Arguments:
+        - `name`: str
+
+        Return: async context manager
+        Exceptions: None
+        """
+        return _Template(self, name)
+
+    async def send_template(self, name, sender, to, subject, /, cc=None, bcc=None,
+                            attach=None, replyto=None, **kwargs):
+        """
+        Send the template NAME, rendered with KWARGS as the context,
+        without touching the active template.  The first four arguments
+        are positional-only, so the context may use their names.
+
+        Return: dict - of refused recipients
+        Exceptions: None
+        """
+        async with self.template(name):
+            return await self._sendtpl(sender, to, subject, cc=cc, bcc=bcc, attach=attach,
+                                       replyto=replyto, **kwargs)
+
+    async def send_many(self, sender, subject, recipients, cc=None, bcc=None, attach=None,
+                        replyto=None, concurrency=None):
+        """
+        Send the current template to many recipients, each with their
+        own context, with up to CONCURRENCY deliveries in flight at once.
+        (By default, one per mailer connection.)
+
+        RECIPIENTS is an iterable of (to, context) pairs, which we
+        consume lazily.
+
+        Return: [letter.SendResult, ...] - in the order of RECIPIENTS
+        Exceptions: NoTemplateError
+        """
+        if not self.plain and not self.html:
+            raise letter.NoTemplateError()
+        prepared = None
+        if hasattr(type(self.mailer), 'send_prepared'):
+            prepared = self.mailer.prepare(sender, subject, cc=cc, bcc=bcc, replyto=replyto,
+                                           attach=attach)
+        recipients = enumerate(recipients)
+        results = {}
+
+        async def worker():
+            for i, (to, context) in recipients:
+                try:
+                    plain, html = self.body(**context)
+                    if prepared is not None:
+                        refused = await self.mailer.send_prepared(prepared, to, plain=plain,
+                                                                  html=html)
+                    else:
+                        refused = await self.mailer.send(sender, to, subject, plain=plain,
+                                                         html=html, cc=cc, bcc=bcc,
+                                                         replyto=replyto, attach=attach)
+                except Exception as err:
+                    results[i] = letter.SendResult(to, err, {})
+                else:
+                    results[i] = letter.SendResult(to, None, refused)
+
+        workers = concurrency or self.mailer.max_connections
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        return [results[i] for i in sorted(results)]
@@ -0,0 +1,198 @@
+"""
+Deliver letters in the background.
+
+A BackgroundMailer wraps any other mailer.  Sends are checked straight
+away (so mistakes are raised to the caller), then queued as compact
+MessageRecords for a pool of worker threads to build and deliver,
+returning a Future for the result.
+
+>>> mailer = BackgroundMailer(SMTPMailer('localhost', 25), workers=4)
+>>> future = mailer.send('me@example.com', 'you@example.com', 'Hi', plain='Hello!')
+>>> mailer.flush()
+
+Requires Python 3.4+.
+"""
+from concurrent.futures import Future
+import queue
+import threading
+import weakref
+
+from letter import BaseMailer, Error, MessageRecord
+
+__all__ = [
+    'QueueFullError',
+    'BackgroundMailer'
+    ]
+
+class QueueFullError(Error): pass
+
+_STOP = object()
+
+
+def _work(q):
+    """
+    Run queued calls from Q until told to stop, setting the result of
+    each one on its Future.
+
+    This deliberately doesn't hold a reference to the BackgroundMailer
+    that owns Q, so that it can be garbage collected.
+
+    Arguments:
+    - `q`: queue.Queue
+
+    Return: None
+    Exceptions: None
+    """
+    while True:
+        item = q.get()
+        try:
+            if item is _STOP:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+        finally:
+            q.task_done()
+
+
+def _shutdown(q, workers):
+    """
+    Stop WORKERS once they have delivered everything in Q.
+
+    Called by close(), when a BackgroundMailer is garbage collected, or
+    at interpreter exit - whichever comes first.
+
+    Arguments:
+    - `q`: queue.Queue
+    - `workers`: [threading.Thread]
+
+    Return: None
+    Exceptions: None
+    """
+    for worker in workers:
+        q.put(_STOP)
+    for worker in workers:
+        worker.join()
+
+
+class BackgroundMailer(BaseMailer):
+    """
+    Queue messages for delivery by WORKERS threads, through MAILER.
+
+    At most MAXSIZE messages wait in the queue.  When it is full, sends
+    block for up to TIMEOUT seconds (forever if None) waiting for space,
+    or if BLOCK is False, raise QueueFullError straight away.
+
+    Anything still queued is delivered before the interpreter exits.
+    """
+    def __init__(self, mailer, workers=2, maxsize=1000, block=True, timeout=None):
+        self.mailer  = mailer
+        self.block   = block
+        self.timeout = timeout
+        self.queue   = queue.Queue(maxsize)
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=_work, args=(self.queue,),
+                                      name='letter-worker-{0}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        self._finalizer = weakref.finalize(self, _shutdown, self.queue, list(self.workers))
+
+    def _put(self, fn, args, kwargs, callback=None):
+        """
+        Queue a call to FN for our workers.
+
+        Arguments:
+        - `fn`: callable
+        - `args`: tuple
+        - `kwargs`: dict
+        - `callback`: callable
+
+        Return: Future
+        Exceptions: QueueFullError
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        try:
+            self.queue.put((future, fn, args, kwargs), self.block, self.timeout)
+        except queue.Full:
+            raise QueueFullError()
+        return future
+
+    def send(self, *args, **kwargs):
+        """
+        Check the message, and queue it for delivery.
+
+        Arguments are as for our mailer's send(), plus an optional
+        CALLBACK which is called with the Future once delivery is done.
+
+        Return: Future
+        Exceptions: NoContentError, QueueFullError
+        """
+        callback = kwargs.pop('callback', None)
+        return self.submit_record(MessageRecord(*args, **kwargs), callback=callback)
+
+    def submit_record(self, record, callback=None):
+        """
+        Queue the MessageRecord RECORD for delivery.  Its MIME message
+        is built by the worker that delivers it.
+
+        Arguments:
+        - `record`: MessageRecord
+        - `callback`: callable
+
+        Return: Future
+        Exceptions: NoContentError, QueueFullError
+        """
+        self.mailer.sanity_check(record.sender, record.to, record.subject,
+                                 plain=record.plain, html=record.html)
+        return self._put(record.send, (self.mailer,), {}, callback=callback)
+
+    def submit(self, message, to, callback=None):
+        """
+        Queue an already built MESSAGE for delivery to TO.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+        - `callback`: callable
+
+        Return: Future
+        Exceptions: QueueFullError
+        """
+        return self._put(self.mailer.deliver, (message, to), {}, callback=callback)
+
+    def flush(self):
+        """
+        Wait until everything queued so far has been delivered.
+
+        Return: None
+        Exceptions: None
+        """
+        if self.workers:
+            self.queue.join()
+
+    def close(self):
+        """
+        Deliver everything queued, then stop our workers and close our
+        mailer.
+
+        Return: None
+        Exceptions: None
+        """
+        if not self._finalizer.alive:
+            return
+        self._finalizer()
+        self.workers = []
+        if hasattr(self.mailer, 'close'):
+            self.mailer.close()
+
+    join = close
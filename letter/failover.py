@@ -0,0 +1,275 @@
+"""
+Spread mail across several SMTP relays, and route around the ones
+that fail.
+
+>>> mailer = FailoverMailer([('smtp1.example.com', 25),
+...                          ('smtp2.example.com', 587, 'user', 'secret')])
+>>> postie = FailoverPostman('templates', [('smtp1.example.com', 25), ...])
+
+Each relay is (host, port) or (host, port, user, pw).  Sends go to
+relays in weighted round robin order, or to the one that has been
+quickest lately with strategy='latency'.  A relay that fails FAILURES
+times in a row is marked unhealthy and skipped, while a background
+timer probes it every PROBE_INTERVAL seconds until it answers again.
+A send that fails on one relay is tried on the next.
+"""
+import threading
+import time
+
+from letter import (BasePostman, BaseSMTPMailer, Error, SMTPAuthenticatedMailer,
+                    SMTPMailer, _merged, _transient)
+
+__all__ = [
+    'NoRelayError',
+    'Relay',
+    'FailoverMailer',
+    'FailoverPostman'
+    ]
+
+
+class NoRelayError(Error):
+    """
+    Raised when every relay failed a send - ERRORS maps each relay we
+    tried to what it raised.
+    """
+    def __init__(self, errors):
+        super(NoRelayError, self).__init__(errors)
+        self.errors = errors
+
+
+class Relay(object):
+    """
+    One relay, its mailer, and how well it has been doing.
+    """
+    def __init__(self, mailer, weight=1):
+        self.mailer   = mailer
+        self.weight   = weight
+        self.healthy  = True
+        self.failures = 0
+        self.latency  = None
+        self.current  = 0
+
+    def __repr__(self):
+        return '<Relay {0}:{1}>'.format(self.mailer.host, self.mailer.port)
+
+    def succeeded(self, seconds, alpha=0.3):
+        """
+        Note a delivery that took SECONDS.
+
+        Return: None
+        Exceptions: None
+        """
+        self.failures = 0
+        self.healthy = True
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency = alpha * seconds + (1 - alpha) * self.latency
+
+    def failed(self, threshold):
+        """
+        Note a failure, marking ourselves unhealthy after THRESHOLD in a
+        row.
+
+        Return: bool - whether we just became unhealthy
+        Exceptions: None
+        """
+        self.failures += 1
+        if self.healthy and self.failures >= threshold:
+            self.healthy = False
+            return True
+        return False
+
+    def probe(self):
+        """
+        Check whether our relay is answering.
+
+        Return: bool
+        Exceptions: None
+        """
+        try:
+            conn = self.mailer.connect()
+        except Exception:
+            return False
+        try:
+            return conn.noop()[0] == 250
+        except Exception:
+            return False
+        finally:
+            self.mailer.pool._close(conn)
+
+
+class FailoverMailer(BaseSMTPMailer):
+    """
+    Deliver through whichever of RELAYS is working.
+
+    WEIGHTS, if given, is the share of mail each relay should take in
+    round robin.  Other keyword arguments are passed to each relay's
+    SMTPMailer - each relay only tries a send once, as we retry on the
+    next relay instead.
+    """
+    stream_threshold = SMTPMailer.stream_threshold
+
+    def __init__(self, relays, weights=None, strategy='round-robin', failures=3,
+                 probe_interval=30, **kwargs):
+        if strategy not in ('round-robin', 'latency'):
+            raise ValueError('Unknown strategy: {0}'.format(strategy))
+        kwargs.setdefault('max_attempts', 1)
+        weights = weights or [1] * len(relays)
+        self.relays = []
+        for relay, weight in zip(relays, weights):
+            if len(relay) == 4:
+                mailer = SMTPAuthenticatedMailer(*relay, **kwargs)
+            else:
+                mailer = SMTPMailer(*relay, **kwargs)
+            self.relays.append(Relay(mailer, weight))
+        self.strategy       = strategy
+        self.failures       = failures
+        self.probe_interval = probe_interval
+        self._prober = None
+        self._lock   = threading.Lock()
+
+    def candidates(self):
+        """
+        Return our relays in the order a send should try them: healthy
+        relays by our strategy, then unhealthy ones as a last resort.
+
+        Return: [Relay, ...]
+        Exceptions: None
+        """
+        with self._lock:
+            healthy = [r for r in self.relays if r.healthy]
+            sick = [r for r in self.relays if not r.healthy]
+            if not healthy:
+                return sick
+            if self.strategy == 'latency':
+                # Relays we haven't timed yet go first, so they get timed.
+                healthy.sort(key=lambda r: -1 if r.latency is None else r.latency)
+            else:
+                # Smooth weighted round robin.
+                total = sum(r.weight for r in healthy)
+                for r in healthy:
+                    r.current += r.weight
+                first = max(healthy, key=lambda r: r.current)
+                first.current -= total
+                healthy.remove(first)
+                healthy.insert(0, first)
+            return healthy + sick
+
+    def _failover(self, method, *args):
+        """
+        Call METHOD with ARGS on each relay's mailer in turn until one
+        succeeds.
+
+        Permanent failures (5xx replies and the like) are raised straight
+        away, as another relay would say the same.
+
+        Return: whatever METHOD returns
+        Exceptions: NoRelayError, smtplib.SMTPException
+        """
+        errors = {}
+        for relay in self.candidates():
+            start = time.time()
+            try:
+                result = getattr(relay.mailer, method)(*args)
+            except Exception as err:
+                if not _transient(err):
+                    raise
+                errors[relay] = err
+                with self._lock:
+                    if relay.failed(self.failures):
+                        self._schedule()
+                continue
+            with self._lock:
+                relay.succeeded(time.time() - start)
+            return result
+        raise NoRelayError(errors)
+
+    def deliver(self, message, to):
+        """
+        Deliver our message through the first relay that will take it.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: NoRelayError, smtplib.SMTPException
+        """
+        return self._failover('deliver', message, to)
+
+    def deliver_bytes(self, sender, to, data):
+        """
+        As SMTPMailer.deliver_bytes(), through the first relay that will
+        take it.
+        """
+        return self._failover('deliver_bytes', sender, to, data)
+
+    def send_prepared(self, prepared, to, plain=None, html=None):
+        """
+        As SMTPMailer.send_prepared(), through the first relay that will
+        take it.
+
+        The message is assembled here, once, so that our suppression
+        list applies however many relays we try.
+        """
+        chunks, recipients, rejected = prepared.render(to, plain=plain, html=html)
+        recipients, left_out = self._envelope(recipients, rejected)
+        refused = self.deliver_bytes(prepared.sender, recipients, b''.join(chunks))
+        return _merged(refused, left_out)
+
+    def _schedule(self):
+        """
+        Start the prober, if it isn't running already.  Call with our
+        lock held.
+
+        Return: None
+        Exceptions: None
+        """
+        if self._prober is None and self.probe_interval:
+            self._prober = threading.Timer(self.probe_interval, self._probe)
+            self._prober.daemon = True
+            self._prober.start()
+
+    def _probe(self):
+        """
+        Probe each unhealthy relay, bringing back any that answer, and
+        carry on probing until they all have.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self._prober = None
+            sick = [r for r in self.relays if not r.healthy]
+        for relay in sick:
+            if relay.probe():
+                with self._lock:
+                    relay.healthy, relay.failures = True, 0
+        with self._lock:
+            if any(not r.healthy for r in self.relays):
+                self._schedule()
+
+    def close(self):
+        """
+        Stop probing, and close every relay's sessions.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            if self._prober is not None:
+                self._prober.cancel()
+                self._prober = None
+        for relay in self.relays:
+            relay.mailer.close()
+
+
+class FailoverPostman(BasePostman):
+    """
+    A Postman that sends through several relays - arguments after
+    TEMPLATEDIR are as for FailoverMailer.
+    """
+    def __init__(self, templatedir=None, relays=(), **kwargs):
+        super(FailoverPostman, self).__init__(templatedir)
+        self.mailer = FailoverMailer(relays, **kwargs)
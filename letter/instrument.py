@@ -0,0 +1,194 @@
+"""
+Find out where the time goes when sending mail.
+
+Postmen and mailers report how long each stage of a send took, and
+how many bytes it handled, to any listeners registered here:
+
+    lookup   finding a template's files
+    render   rendering a template
+    build    building the MIME message
+    connect  opening a connection to the relay
+    tls      upgrading it with STARTTLS
+    auth     logging in
+    send     the SMTP transaction itself, envelope and DATA
+
+A listener is any callable taking (stage, seconds, nbytes) - NBYTES is
+None for stages where it means nothing.
+
+>>> histogram = Histogram()
+>>> add_listener(histogram)
+>>> add_listener(LoggingListener(threshold=0.5))
+
+With no listeners registered nothing is timed at all.
+"""
+import bisect
+import threading
+import time
+
+__all__ = [
+    'add_listener',
+    'remove_listener',
+    'Histogram',
+    'LoggingListener'
+    ]
+
+# Mutated in place, so that modules may hold on to a reference and check
+# it cheaply before timing anything.
+listeners = []
+
+clock = time.perf_counter
+
+
+def add_listener(listener):
+    """
+    Start telling LISTENER about every stage of every send.
+
+    Arguments:
+    - `listener`: callable(stage, seconds, nbytes)
+
+    Return: None
+    Exceptions: None
+    """
+    if listener not in listeners:
+        listeners.append(listener)
+
+
+def remove_listener(listener):
+    """
+    Stop telling LISTENER about sends.
+
+    Arguments:
+    - `listener`: callable
+
+    Return: None
+    Exceptions: None
+    """
+    if listener in listeners:
+        listeners.remove(listener)
+
+
+def emit(stage, start, nbytes=None):
+    """
+    Tell our listeners that STAGE, begun at START (by our clock), has
+    just finished.
+
+    A listener that raises is logged, and does not affect the send.
+
+    Arguments:
+    - `stage`: str
+    - `start`: float
+    - `nbytes`: int or None
+
+    Return: None
+    Exceptions: None
+    """
+    seconds = clock() - start
+    for listener in list(listeners):
+        try:
+            listener(stage, seconds, nbytes)
+        except Exception:
+            import logging
+            logging.getLogger('letter').exception('Instrumentation listener %r failed',
+                                                  listener)
+
+
+class Histogram(object):
+    """
+    Collect the time taken by each stage into buckets.
+
+    Bucket boundaries run from 100 microseconds, doubling, to around
+    a minute.
+    """
+    bounds = [0.0001 * 2 ** i for i in range(20)]
+
+    def __init__(self):
+        self.stages = {}
+        self._lock  = threading.Lock()
+
+    def __call__(self, stage, seconds, nbytes):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = {
+                    'count': 0,
+                    'seconds': 0.0,
+                    'bytes': 0,
+                    'buckets': [0] * (len(self.bounds) + 1),
+                    }
+            record = self.stages[stage]
+            record['count'] += 1
+            record['seconds'] += seconds
+            record['bytes'] += nbytes or 0
+            record['buckets'][bisect.bisect_left(self.bounds, seconds)] += 1
+
+    def percentile(self, stage, pct):
+        """
+        Estimate the PCT percentile time taken by STAGE - this is the
+        upper bound of the bucket it falls in.
+
+        Arguments:
+        - `stage`: str
+        - `pct`: number
+
+        Return: float or None if we've seen no STAGE
+        Exceptions: None
+        """
+        with self._lock:
+            record = self.stages.get(stage)
+            if not record:
+                return None
+            wanted = record['count'] * pct / 100.0
+            seen = 0
+            for i, count in enumerate(record['buckets']):
+                seen += count
+                if count and seen >= wanted:
+                    return self.bounds[i] if i < len(self.bounds) else float('inf')
+
+    def summary(self):
+        """
+        Summarise every stage we've seen.
+
+        Return: dict of stage to dict
+        Exceptions: None
+        """
+        summary = {}
+        for stage in list(self.stages):
+            record = self.stages[stage]
+            summary[stage] = {
+                'count': record['count'],
+                'seconds': record['seconds'],
+                'bytes': record['bytes'],
+                'p50': self.percentile(stage, 50),
+                'p99': self.percentile(stage, 99),
+                }
+        return summary
+
+    def clear(self):
+        """
+        Forget everything we've seen.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            self.stages = {}
+
+
+class LoggingListener(object):
+    """
+    Log stages taking at least THRESHOLD seconds to LOGGER (the
+    'letter' logger by default) at LEVEL (DEBUG by default).
+    """
+    def __init__(self, logger=None, level=None, threshold=0):
+        import logging
+        self.logger    = logger or logging.getLogger('letter')
+        self.level     = logging.DEBUG if level is None else level
+        self.threshold = threshold
+
+    def __call__(self, stage, seconds, nbytes):
+        if seconds < self.threshold:
+            return
+        if nbytes is None:
+            self.logger.log(self.level, 'letter %s took %.2fms', stage, seconds * 1000)
+        else:
+            self.logger.log(self.level, 'letter %s took %.2fms (%d bytes)',
+                            stage, seconds * 1000, nbytes)
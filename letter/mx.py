@@ -0,0 +1,273 @@
+"""
+Deliver straight to each recipient domain's mail exchangers, rather
+than through a smarthost.
+
+>>> mailer = MXMailer()
+>>> mailer.send('me@example.com', ['you@example.org', 'them@example.net'], 'Hi', plain='Hai')
+
+Recipients are grouped by domain, and each domain's share sent as one
+transaction to its most preferred MX that will take it.  MX lookups are
+cached for as long as their TTL allows, and sessions to each exchanger
+are pooled.
+
+Looking up MX records needs dnspython.  Tests, or anything else that
+knows better, can pass a resolver of their own - any callable taking a
+domain and returning ([(preference, host, port), ...], ttl), or raising
+NoMXError if the domain takes no mail:
+
+>>> mailer = MXMailer(resolver=StaticResolver({'example.com': [('127.0.0.1', 2525)]}))
+"""
+import collections
+import email.utils
+import smtplib
+import ssl
+import threading
+import time
+
+from letter import BaseSMTPMailer, Error, SMTPMailer, _transient
+
+__all__ = [
+    'NoMXError',
+    'DNSResolver',
+    'StaticResolver',
+    'MXCache',
+    'MXMailer'
+    ]
+
+
+class NoMXError(Error):
+    """
+    The domain does not exist, or takes no mail.
+    """
+
+
+class DNSResolver(object):
+    """
+    Look up MX records with dnspython, falling back to the domain itself
+    when it has no MX records, as RFC 5321 says.
+    """
+    def __init__(self, port=25):
+        self.port = port
+
+    def __call__(self, domain):
+        import dns.exception
+        import dns.resolver
+        try:
+            answer = dns.resolver.resolve(domain, 'MX')
+        except dns.resolver.NXDOMAIN:
+            raise NoMXError(domain)
+        except dns.resolver.NoAnswer:
+            return [(0, domain, self.port)], 300
+        records = sorted((r.preference, str(r.exchange).rstrip('.'), self.port)
+                         for r in answer)
+        if records == [(0, '', self.port)]:
+            # A null MX - RFC 7505
+            raise NoMXError(domain)
+        return records, answer.rrset.ttl
+
+
+class StaticResolver(object):
+    """
+    Resolve domains from the dict HOSTS of domain to [(host, port), ...],
+    most preferred first.
+    """
+    def __init__(self, hosts, ttl=300):
+        self.hosts = hosts
+        self.ttl   = ttl
+
+    def __call__(self, domain):
+        if domain not in self.hosts:
+            raise NoMXError(domain)
+        return [(i, host, port) for i, (host, port) in enumerate(self.hosts[domain])], self.ttl
+
+
+class MXCache(object):
+    """
+    Remember RESOLVER's answers for as long as their TTL says - but at
+    least MIN_TTL and at most MAX_TTL seconds.  Domains that take no mail
+    are remembered for NEGATIVE_TTL seconds.
+    """
+    def __init__(self, resolver, min_ttl=60, max_ttl=3600, negative_ttl=300,
+                 clock=time.monotonic):
+        self.resolver     = resolver
+        self.min_ttl      = min_ttl
+        self.max_ttl      = max_ttl
+        self.negative_ttl = negative_ttl
+        self.clock        = clock
+        self._answers = {}
+        self._lock    = threading.Lock()
+
+    def get(self, domain):
+        """
+        Return the mail exchangers for DOMAIN, most preferred first.
+
+        Arguments:
+        - `domain`: str
+
+        Return: [(host, port), ...]
+        Exceptions: NoMXError, or whatever our resolver raises
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._answers.get(domain)
+        if entry is None or entry[0] <= now:
+            try:
+                records, ttl = self.resolver(domain)
+            except NoMXError as err:
+                entry = (now + self.negative_ttl, err)
+            else:
+                ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+                entry = (now + ttl, [(host, port) for pref, host, port in sorted(records)])
+            with self._lock:
+                self._answers[domain] = entry
+        if isinstance(entry[1], Exception):
+            raise entry[1]
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._answers.clear()
+
+
+class _MXSession(SMTPMailer):
+    """
+    An SMTPMailer for one mail exchanger, using STARTTLS when it is
+    offered.
+
+    Like other MTAs we don't verify the exchanger's certificate - this
+    keeps mail private from passive eavesdroppers, nothing more.
+    """
+    def __init__(self, host, port, starttls=True, **kwargs):
+        self.starttls = starttls
+        super(_MXSession, self).__init__(host, port, **kwargs)
+
+    def connect(self):
+        s = super(_MXSession, self).connect()
+        if self.starttls:
+            try:
+                s.ehlo()
+                if s.has_extn('starttls'):
+                    context = ssl.create_default_context()
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                    s.starttls(context=context)
+                    s.ehlo()
+            except Exception:
+                s.close()
+                raise
+        return s
+
+
+class MXMailer(BaseSMTPMailer):
+    """
+    Deliver to each recipient's mail exchangers directly.
+
+    RESOLVER defaults to looking up MX records in the DNS.  We keep up
+    to POOL_SIZE idle sessions to each exchanger; other keyword
+    arguments are passed to the SMTPMailer for each one.
+    """
+    stream_threshold = SMTPMailer.stream_threshold
+
+    def __init__(self, resolver=None, port=25, starttls=True, pool_size=1, **kwargs):
+        kwargs.setdefault('max_attempts', 1)
+        self.mx        = MXCache(resolver or DNSResolver(port))
+        self.starttls  = starttls
+        self.pool_size = pool_size
+        self.kwargs    = kwargs
+        self._sessions = {}
+        self._lock     = threading.Lock()
+
+    def group(self, to):
+        """
+        Group the addresses TO by domain.
+
+        Arguments:
+        - `to`: [str]
+
+        Return: OrderedDict of domain to [str]
+        Exceptions: None
+        """
+        domains = collections.OrderedDict()
+        for addr in to:
+            domain = email.utils.parseaddr(addr)[1].rpartition('@')[2].lower()
+            domains.setdefault(domain, []).append(addr)
+        return domains
+
+    def exchanger(self, host, port):
+        """
+        Return the mailer that delivers to the exchanger HOST:PORT.
+
+        Return: SMTPMailer
+        Exceptions: None
+        """
+        with self._lock:
+            mailer = self._sessions.get((host, port))
+            if mailer is None:
+                mailer = self._sessions[(host, port)] = _MXSession(
+                    host, port, starttls=self.starttls, pool_size=self.pool_size, **self.kwargs)
+            return mailer
+
+    def deliver_domain(self, message, domain, to):
+        """
+        Deliver MESSAGE to the addresses TO, all at DOMAIN, trying each
+        of its exchangers in turn until one answers.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `domain`: str
+        - `to`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: None
+        """
+        try:
+            exchangers = self.mx.get(domain)
+        except NoMXError:
+            return dict((addr, (550, b'5.1.2 Domain does not accept mail')) for addr in to)
+        except Exception as err:
+            return dict((addr, (451, '4.4.3 MX lookup failed: {0!r}'.format(err).encode('utf-8')))
+                        for addr in to)
+        reply = (451, b'4.4.1 No answer from any exchanger')
+        for host, port in exchangers:
+            try:
+                return self.exchanger(host, port).deliver(message, to)
+            except smtplib.SMTPRecipientsRefused as err:
+                return err.recipients
+            except smtplib.SMTPResponseException as err:
+                reply = (err.smtp_code, err.smtp_error)
+                if not _transient(err):
+                    break
+            except Exception as err:
+                if not _transient(err):
+                    raise
+        return dict((addr, reply) for addr in to)
+
+    def deliver(self, message, to):
+        """
+        Deliver our message to each recipient's domain.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - of refused recipients to (code, msg)
+        Exceptions: smtplib.SMTPRecipientsRefused - if every recipient was refused
+        """
+        refused = {}
+        for domain, addrs in self.group(to).items():
+            refused.update(self.deliver_domain(message, domain, addrs))
+        if to and len(refused) == len(to):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        return refused
+
+    def close(self):
+        """
+        Close every pooled session.
+
+        Return: None
+        Exceptions: None
+        """
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for mailer in sessions:
+            mailer.close()
@@ -0,0 +1,300 @@
+"""
+A durable outbox for letters.
+
+SpoolMailer writes each finished message to a spool directory on disk
+instead of delivering it, so that bursts of mail are accepted at disk
+speed and survive the process going away.  Outbox.drain() - or
+`python -m letter.outbox` - later delivers the spool through any other
+mailer, retrying failures with backoff.
+
+The spool is laid out like a maildir:
+
+    tmp/     messages being written
+    new/     messages waiting for delivery
+    cur/     messages being delivered right now
+    failed/  messages we have given up on
+
+Each message NAME sits next to NAME.json, which holds its envelope and
+retry state.
+
+Requires Python 3.
+"""
+import argparse
+import email
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+
+import letter
+
+__all__ = [
+    'Outbox',
+    'SpoolMailer'
+    ]
+
+
+def _text(msg):
+    return msg.decode('utf-8', 'replace') if isinstance(msg, bytes) else str(msg)
+
+
+class Outbox(object):
+    """
+    A spool directory of messages waiting to be delivered.
+    """
+    dirs = ('tmp', 'new', 'cur', 'failed')
+
+    def __init__(self, path):
+        self.path = path
+        for d in self.dirs:
+            os.makedirs(os.path.join(path, d), exist_ok=True)
+
+    def _path(self, where, name):
+        return os.path.join(self.path, where, name)
+
+    def _write(self, name, data):
+        """
+        Write DATA to tmp/NAME, and make sure it has hit the disk.
+
+        Arguments:
+        - `name`: str
+        - `data`: bytes
+
+        Return: None
+        Exceptions: OSError
+        """
+        with open(self._path('tmp', name), 'wb') as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _move(self, name, src, dest):
+        """
+        Move NAME, and its metadata, from the directory SRC to DEST.
+
+        Return: None
+        Exceptions: OSError
+        """
+        os.rename(self._path(src, name + '.json'), self._path(dest, name + '.json'))
+        os.rename(self._path(src, name), self._path(dest, name))
+
+    def _meta(self, where, name):
+        with open(self._path(where, name + '.json')) as fh:
+            return json.load(fh)
+
+    def _save_meta(self, where, name, meta):
+        self._write(name + '.json', json.dumps(meta).encode('utf-8'))
+        os.rename(self._path('tmp', name + '.json'), self._path(where, name + '.json'))
+
+    def put(self, message, to):
+        """
+        Atomically add MESSAGE, for delivery to TO, to the spool.
+
+        The metadata is in place before the message appears in new/,
+        so anything in new/ is always complete.
+
+        Arguments:
+        - `message`: email.message.Message
+        - `to`: [str]
+
+        Return: str - the name of the spooled message
+        Exceptions: OSError
+        """
+        name = '{0:.6f}.{1}.{2}'.format(time.time(), uuid.uuid4().hex, socket.gethostname())
+        meta = {
+            'sender': str(message['From']),
+            'to': list(to),
+            'attempts': 0,
+            'next_attempt': 0,
+            'last_error': None,
+            }
+        self._write(name, message.as_bytes())
+        self._save_meta('new', name, meta)
+        os.rename(self._path('tmp', name), self._path('new', name))
+        return name
+
+    def pending(self):
+        """
+        Return the names of messages waiting in new/, oldest first.
+
+        Return: [str]
+        Exceptions: None
+        """
+        return sorted(n for n in os.listdir(os.path.join(self.path, 'new'))
+                      if not n.endswith('.json'))
+
+    def failed(self):
+        """
+        Return the names of messages we have given up on.
+
+        Return: [str]
+        Exceptions: None
+        """
+        return sorted(n for n in os.listdir(os.path.join(self.path, 'failed'))
+                      if not n.endswith('.json'))
+
+    def recover(self):
+        """
+        Put any messages left in cur/ by a drain that died back in new/.
+
+        Only call this when no other drain is running on the spool.
+
+        Return: int - the number of messages recovered
+        Exceptions: OSError
+        """
+        names = [n for n in os.listdir(os.path.join(self.path, 'cur'))
+                 if not n.endswith('.json')]
+        for name in names:
+            self._move(name, 'cur', 'new')
+        return len(names)
+
+    def _defer(self, name, meta, error, max_attempts, backoff):
+        """
+        Put NAME, in cur/, back in new/ to be tried again later - or in
+        failed/, if it has had MAX_ATTEMPTS already.
+
+        Arguments:
+        - `name`: str
+        - `meta`: dict
+        - `error`: str
+        - `max_attempts`: int
+        - `backoff`: int
+
+        Return: None
+        Exceptions: OSError
+        """
+        meta['attempts'] += 1
+        meta['last_error'] = error
+        meta['next_attempt'] = time.time() + backoff * 2 ** (meta['attempts'] - 1)
+        self._save_meta('cur', name, meta)
+        self._move(name, 'cur', 'failed' if meta['attempts'] >= max_attempts else 'new')
+
+    def drain(self, mailer, max_attempts=10, backoff=60, limit=None):
+        """
+        Deliver waiting messages through MAILER.
+
+        Messages whose delivery fails are put back with their retry time
+        pushed out by BACKOFF seconds, doubling with each attempt, and
+        moved to failed/ after MAX_ATTEMPTS.  Messages are claimed by
+        renaming them into cur/, so several drains may share a spool.
+
+        If MAILER delivers a message but temporarily (4xx) refuses some
+        of its recipients, the message is put back for just those.  Any
+        it refuses permanently are recorded in the message's metadata
+        under 'refused'.
+
+        Arguments:
+        - `mailer`: a mailer with a deliver(message, to) method
+        - `max_attempts`: int
+        - `backoff`: int
+        - `limit`: int - the most messages to try this time
+
+        Return: (int, int) - messages delivered, and messages that failed
+        Exceptions: None
+        """
+        delivered, failed = 0, 0
+        now = time.time()
+        for name in self.pending():
+            if limit is not None and delivered + failed >= limit:
+                break
+            try:
+                if self._meta('new', name)['next_attempt'] > now:
+                    continue
+                self._move(name, 'new', 'cur')
+            except (OSError, ValueError):
+                # Someone else got there first.
+                continue
+            meta = self._meta('cur', name)
+            try:
+                with open(self._path('cur', name), 'rb') as fh:
+                    message = email.message_from_binary_file(fh)
+                refused = mailer.deliver(message, meta['to']) or {}
+            except Exception as err:
+                failed += 1
+                self._defer(name, meta, repr(err), max_attempts, backoff)
+                continue
+            delivered += 1
+            retry = [addr for addr in meta['to']
+                     if addr in refused and 400 <= refused[addr][0] < 500]
+            if refused:
+                meta.setdefault('refused', {}).update(
+                    (addr, [code, _text(msg)]) for addr, (code, msg) in refused.items()
+                    if addr not in retry)
+            if retry:
+                meta['to'] = retry
+                self._defer(name, meta, repr(dict((a, refused[a]) for a in retry)),
+                            max_attempts, backoff)
+            else:
+                os.remove(self._path('cur', name))
+                os.remove(self._path('cur', name + '.json'))
+        return delivered, failed
+
+
+class SpoolMailer(letter.BaseSMTPMailer):
+    """
+    Spool finished messages to the Outbox at PATH rather than delivering
+    them.
+    """
+    def __init__(self, path):
+        self.outbox = Outbox(path)
+
+    def deliver(self, message, to):
+        """
+        Spool our message
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: dict - always empty, as nothing has been refused yet
+        Exceptions: OSError
+        """
+        self.outbox.put(message, to)
+        return {}
+
+
+def main(argv=None):
+    """
+    Drain a spool directory through an SMTP relay.
+
+    Return: 0
+    Exceptions: None
+    """
+    parser = argparse.ArgumentParser(description='Deliver mail from a letter outbox')
+    parser.add_argument('spool', help='Spool directory')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=25)
+    parser.add_argument('--user', help='Authenticate as USER (password from $LETTER_SMTP_PW)')
+    parser.add_argument('--max-attempts', type=int, default=10)
+    parser.add_argument('--backoff', type=int, default=60)
+    parser.add_argument('--loop', action='store_true', help='Keep draining until killed')
+    parser.add_argument('--interval', type=float, default=5,
+                        help='Seconds between drains with --loop')
+    parser.add_argument('--recover', action='store_true',
+                        help='First put back messages left in cur/ by a drain that died - '
+                        'only when no other drain is running')
+    args = parser.parse_args(argv)
+
+    if args.user:
+        mailer = letter.SMTPAuthenticatedMailer(args.host, args.port, args.user,
+                                                os.environ.get('LETTER_SMTP_PW'))
+    else:
+        mailer = letter.SMTPMailer(args.host, args.port)
+    outbox = Outbox(args.spool)
+    if args.recover:
+        outbox.recover()
+    try:
+        while True:
+            outbox.drain(mailer, max_attempts=args.max_attempts, backoff=args.backoff)
+            if not args.loop:
+                break
+            time.sleep(args.interval)
+    finally:
+        mailer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
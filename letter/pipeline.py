@@ -0,0 +1,193 @@
+"""
+Render big sends on every core.
+
+Rendering templates and serialising MIME messages is CPU bound, so a
+single process can only send as fast as one core can render.  Here a
+pool of processes renders and serialises messages, and a few threads in
+this process deliver the finished bytes over our mailer's pooled SMTP
+sessions.
+
+>>> with postie.template('newsletter'):
+...     results = pipeline.send_many(postie, 'me@example.com', 'News', people)
+
+The mailer must be able to deliver_bytes() - SMTPMailer and its
+subclasses can.
+
+Requires Python 3.
+"""
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import itertools
+import os
+import threading
+
+import letter
+from letter import BasePostman, BaseSMTPMailer, NoTemplateError, SendResult
+
+__all__ = [
+    'send_many'
+    ]
+
+# Set up in each rendering process by _init()
+_postie = None
+_mailer = None
+
+
+def _init(plain, html, check_templates):
+    """
+    Set up a rendering process to render the templates PLAIN and HTML.
+
+    Arguments:
+    - `plain`: str or None
+    - `html`: str or None
+    - `check_templates`: bool
+
+    Return: None
+    Exceptions: None
+    """
+    global _postie, _mailer
+    _postie = BasePostman([])
+    _postie.plain, _postie.html = plain, html
+    _postie.check_templates = check_templates
+    _mailer = BaseSMTPMailer()
+
+
+def _render(batch, sender, subject, cc, bcc, attach, replyto):
+    """
+    Render and serialise a message for each (to, context) pair in BATCH.
+
+    Arguments:
+    - `batch`: [(str or [str], dict)]
+    - `sender`: str
+    - `subject`: str
+    - `cc`: str or [str]
+    - `bcc`: str or [str]
+    - `attach`: str or [str]
+    - `replyto`: str
+
+    Return: [([str], bytes, dict, None) or (None, None, None, Exception)] -
+            each message's recipients, data, malformed addresses left out
+            of it, and error
+    Exceptions: None
+    """
+    rendered = []
+    for to, context in batch:
+        try:
+            plain, html = _postie.body(**context)
+            msg, recipients = _mailer.message(sender, to, subject, plain=plain, html=html,
+                                              cc=cc, bcc=bcc, replyto=replyto, attach=attach)
+            rejected = dict(getattr(msg, 'letter_rejected', None) or {})
+            rendered.append((recipients, letter._flatten(msg).tobytes(), rejected, None))
+        except Exception as err:
+            rendered.append((None, None, None, err))
+    return rendered
+
+
+def _deliver(mailer, sender, to, data, rejected):
+    """
+    Deliver DATA from SENDER to TO through MAILER, leaving out anyone on
+    its suppression list.  They, and the malformed addresses REJECTED,
+    are reported as refused along with any the server refuses.
+
+    Arguments:
+    - `mailer`: SMTPMailer
+    - `sender`: str
+    - `to`: [str]
+    - `data`: bytes
+    - `rejected`: dict of str to (code, msg)
+
+    Return: dict - of refused recipients to (code, msg)
+    Exceptions: smtplib.SMTPException
+    """
+    to, left_out = mailer._envelope(to, rejected)
+    return letter._merged(mailer.deliver_bytes(sender, to, data), left_out)
+
+
+def send_many(postie, sender, subject, recipients, cc=None, bcc=None, attach=None,
+              replyto=None, processes=None, workers=2, batch_size=16, backlog=None):
+    """
+    Send POSTIE's current template to many recipients, each with their
+    own context, like BasePostman.send_many() - but rendered by
+    PROCESSES processes (one per core by default) and delivered by
+    WORKERS threads.
+
+    RECIPIENTS is consumed lazily, BATCH_SIZE at a time, with a few
+    batches per process in flight.  Rendering stops to let delivery
+    catch up whenever BACKLOG rendered messages (WORKERS * BATCH_SIZE
+    by default) are waiting for it, so that a big send never holds
+    much more than that in memory.  Results come back in the order of
+    RECIPIENTS, and a failure to render or deliver one message is
+    recorded in its result without stopping the rest.
+
+    Arguments:
+    - `postie`: BasePostman
+    - `sender`: unicode
+    - `subject`: unicode
+    - `recipients`: iterable of (str or [str], dict)
+    - `cc`: str or [str]
+    - `bcc`: str or [str]
+    - `attach`: str or [str]
+    - `replyto`: str
+    - `processes`: int
+    - `workers`: int
+    - `batch_size`: int
+    - `backlog`: int
+
+    Return: [SendResult, ...]
+    Exceptions: NoTemplateError
+    """
+    if not postie.plain and not postie.html:
+        raise NoTemplateError()
+    processes = processes or os.cpu_count() or 1
+    plain = postie.plain and str(postie.plain)
+    html = postie.html and str(postie.html)
+    recipients = iter(recipients)
+    rendering = collections.deque()
+    delivering = []
+    waiting = threading.BoundedSemaphore(backlog or workers * batch_size)
+    release = lambda future: waiting.release()
+
+    with ProcessPoolExecutor(processes, initializer=_init,
+                             initargs=(plain, html, postie.check_templates)) as renderers, \
+         ThreadPoolExecutor(workers) as deliverers:
+
+        def fill():
+            while len(rendering) < processes * 2:
+                batch = list(itertools.islice(recipients, batch_size))
+                if not batch:
+                    return
+                rendering.append(([to for to, context in batch],
+                                  renderers.submit(_render, batch, sender, subject,
+                                                   cc, bcc, attach, replyto)))
+
+        fill()
+        while rendering:
+            tos, future = rendering.popleft()
+            fill()
+            try:
+                rendered = future.result()
+            except Exception as err:
+                # The whole batch was lost, e.g. a rendering process died.
+                rendered = [(None, None, None, err)] * len(tos)
+            for to, (envelope, data, rejected, err) in zip(tos, rendered):
+                if err is None:
+                    waiting.acquire()
+                    delivery = deliverers.submit(_deliver, postie.mailer,
+                                                 sender, envelope, data, rejected)
+                    delivery.add_done_callback(release)
+                    delivering.append((to, delivery))
+                else:
+                    delivering.append((to, err))
+
+    results = []
+    for to, outcome in delivering:
+        if not isinstance(outcome, Exception):
+            try:
+                outcome = outcome.result()
+            except Exception as err:
+                outcome = err
+        if isinstance(outcome, Exception):
+            results.append(SendResult(to, outcome, {}))
+        else:
+            results.append(SendResult(to, None, outcome or {}))
+    return results
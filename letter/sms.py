@@ -1,29 +1,28 @@
 """
 Sending SMS with letter.
+
+Twilio is imported when the first TwillioPostie is made, not when this
+module is.
 """
-import twilio
-from twilio.rest import TwilioRestClient
 
 class TwillioPostie(object):
     """
     Render messages from templates and handle deliery.
     """
     def __init__(self, sid=None, token=None):
+        from twilio.rest import TwilioRestClient
         self.client = TwilioRestClient(sid, token)
 
     def send(self, to, from_, body):
         """
         Send BODY to TO from FROM as an SMS!
         """
-        try:
-            msg = self.client.sms.messages.create(
-                body=body,
-                to=to,
-                from_=from_
-                )
-            print msg.sid
-        except twilio.TwilioRestException as e:
-            raise
+        msg = self.client.sms.messages.create(
+            body=body,
+            to=to,
+            from_=from_
+            )
+        print(msg.sid)
 
 
 class SMS(object):
@@ -3,8 +3,6 @@ Sending messages on Social media services with letter.
 """
 import collections
 
-import tweepy
-
 from letter import Error
 
 __all__ = [
@@ -25,6 +23,7 @@ class TwitterPostie(object):
     Deliver messages via twitter
     """
     def __init__(self, consumer_key='', consumer_secret='', accounts={}):
+        import tweepy
         self.auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
         self.accounts = accounts
 
@@ -55,6 +54,7 @@ class TwitterPostie(object):
         if len(tweet) > 140:
             raise TweetTooLongError()
 
+        import tweepy
         self.auth.set_access_token(*self.accounts.get(from_))
         api = tweepy.API(self.auth)
         if dm:
@@ -0,0 +1,328 @@
+"""
+Keep mail away from addresses that shouldn't get it - ones that have
+hard-bounced, complained or unsubscribed.
+
+Give a mailer a suppression list, and its sends, bulk sends and
+prepared sends leave out anyone on it, reporting them as refused.
+That goes for AsyncSMTPMailer, FailoverMailer, MXMailer and
+ThrottledMailer too, and for pipeline.send_many():
+
+>>> mailer = SMTPMailer('localhost', 25)
+>>> mailer.suppressions = SQLiteSuppressionList('suppressed.db')
+>>> mailer.suppressions.add('gone@example.com', 'bounce')
+>>> mailer.send('me@example.com', ['you@example.com', 'gone@example.com'], 'Hi', plain='Hai')
+{'gone@example.com': (550, b'5.7.1 Recipient is on the suppression list')}
+
+Any object with a filter() method like SuppressionList's will do.
+
+SQLiteSuppressionList keeps a Bloom filter of its addresses in memory,
+so the great majority of recipients - who aren't suppressed - are
+cleared without touching the database.  The filter is saved alongside
+the list, so opening a big list doesn't mean reading all of it.
+
+Addresses are compared without regard to case.
+"""
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+
+__all__ = [
+    'BloomFilter',
+    'SuppressionList',
+    'MemorySuppressionList',
+    'SQLiteSuppressionList'
+    ]
+
+SUPPRESSED = (550, b'5.7.1 Recipient is on the suppression list')
+
+
+def _key(addr):
+    return addr.strip().lower()
+
+
+class BloomFilter(object):
+    """
+    A set of strings that may say something is in it when it isn't - at
+    most ERROR_RATE of the time, while it holds no more than CAPACITY
+    strings - but never the other way round.
+    """
+    def __init__(self, capacity=1000000, error_rate=0.001, bits=None, hashes=None):
+        capacity = max(capacity, 1)
+        if bits is None:
+            bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        if hashes is None:
+            hashes = max(1, int(round(bits / capacity * math.log(2))))
+        self.size   = bits
+        self.hashes = hashes
+        self.bits   = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """
+        Add KEY.
+
+        Arguments:
+        - `key`: str
+
+        Return: None
+        Exceptions: None
+        """
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class SuppressionList(object):
+    """
+    The interface suppression lists share.  Subclasses implement
+    add(), remove() and suppressed().
+    """
+    def add(self, addr, reason=None):
+        """
+        Suppress ADDR, because of REASON (e.g. 'bounce', 'unsubscribe').
+
+        Arguments:
+        - `addr`: str
+        - `reason`: str
+
+        Return: None
+        Exceptions: None
+        """
+        self.update([(addr, reason)])
+
+    def update(self, entries):
+        """
+        Suppress each (addr, reason) in ENTRIES.
+
+        Arguments:
+        - `entries`: iterable of (str, str)
+
+        Return: None
+        Exceptions: None
+        """
+        raise NotImplementedError()
+
+    def remove(self, addr):
+        """
+        Stop suppressing ADDR.
+
+        Arguments:
+        - `addr`: str
+
+        Return: None
+        Exceptions: None
+        """
+        raise NotImplementedError()
+
+    def suppressed(self, addrs):
+        """
+        Return the ones in ADDRS that we suppress.
+
+        Arguments:
+        - `addrs`: [str]
+
+        Return: set of str
+        Exceptions: None
+        """
+        raise NotImplementedError()
+
+    def __contains__(self, addr):
+        return bool(self.suppressed([addr]))
+
+    def filter(self, addrs):
+        """
+        Split ADDRS into those we may send to, and those we mayn't.
+
+        Arguments:
+        - `addrs`: [str]
+
+        Return: ([str], dict) - the addresses to send to, and each
+                suppressed address mapped to the (code, msg) a server
+                refusing it would give
+        Exceptions: None
+        """
+        suppressed = self.suppressed(addrs)
+        if not suppressed:
+            return list(addrs), {}
+        return ([a for a in addrs if a not in suppressed],
+                dict((a, SUPPRESSED) for a in addrs if a in suppressed))
+
+    def add_refused(self, refused, reason='bounce'):
+        """
+        Suppress every address in REFUSED, as returned by a send, that
+        was refused permanently (with a 5xx reply).
+
+        Arguments:
+        - `refused`: dict of str to (int, bytes)
+        - `reason`: str
+
+        Return: int - the number of addresses suppressed
+        Exceptions: None
+        """
+        entries = [(addr, reason) for addr, reply in refused.items()
+                   if 500 <= reply[0] < 600 and reply != SUPPRESSED]
+        if entries:
+            self.update(entries)
+        return len(entries)
+
+
+class MemorySuppressionList(SuppressionList):
+    """
+    A suppression list held in a set, for tests and small lists.
+    """
+    def __init__(self, addrs=()):
+        self._addrs = set(_key(a) for a in addrs)
+
+    def update(self, entries):
+        self._addrs.update(_key(addr) for addr, reason in entries)
+
+    def remove(self, addr):
+        self._addrs.discard(_key(addr))
+
+    def suppressed(self, addrs):
+        return set(a for a in addrs if _key(a) in self._addrs)
+
+
+class SQLiteSuppressionList(SuppressionList):
+    """
+    A suppression list stored in the SQLite database at PATH, with a
+    Bloom filter in front of it.
+
+    The filter is sized for CAPACITY addresses (or twice as many as we
+    already hold, if that is more) at ERROR_RATE, and is saved to the
+    database by save() and close().  If the list has changed since the
+    filter was saved, the filter is rebuilt when the list is opened.
+    """
+    batch_size = 500
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001):
+        self.path       = path
+        self.error_rate = error_rate
+        self._lock = threading.RLock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS suppressed ('
+                             'address TEXT PRIMARY KEY, reason TEXT, added REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        self.version = self._meta('version', 0)
+        self.bloom   = self._load_bloom()
+        if self.bloom is None:
+            count = self._db.execute('SELECT COUNT(*) FROM suppressed').fetchone()[0]
+            self.bloom = BloomFilter(max(capacity, count * 2), error_rate)
+            for (addr,) in self._db.execute('SELECT address FROM suppressed'):
+                self.bloom.add(addr)
+
+    def _meta(self, key, default=None):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _load_bloom(self):
+        """
+        Return the saved Bloom filter, if it is up to date with the list.
+
+        Return: BloomFilter or None
+        Exceptions: None
+        """
+        if self._meta('bloom_version') != self.version:
+            return None
+        bits = self._meta('bloom_bits')
+        if bits is None:
+            return None
+        bloom = BloomFilter(bits=self._meta('bloom_size'), hashes=self._meta('bloom_hashes'))
+        bloom.bits = bytearray(bits)
+        return bloom
+
+    def save(self):
+        """
+        Save our Bloom filter, so the next open needn't rebuild it.
+
+        Return: None
+        Exceptions: sqlite3.Error
+        """
+        with self._lock, self._db:
+            self._set_meta('bloom_bits', bytes(self.bloom.bits))
+            self._set_meta('bloom_size', self.bloom.size)
+            self._set_meta('bloom_hashes', self.bloom.hashes)
+            self._set_meta('bloom_version', self.version)
+
+    def close(self):
+        """
+        Save our Bloom filter, and close the database.
+
+        Return: None
+        Exceptions: sqlite3.Error
+        """
+        self.save()
+        self._db.close()
+
+    def _changed(self):
+        self.version += 1
+        self._set_meta('version', self.version)
+
+    def update(self, entries):
+        now = time.time()
+        rows = [(_key(addr), reason, now) for addr, reason in entries]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO suppressed (address, reason, added) '
+                                 'VALUES (?, ?, ?)', rows)
+            self._changed()
+            for row in rows:
+                self.bloom.add(row[0])
+
+    def remove(self, addr):
+        # The Bloom filter can't forget ADDR - it is just a false
+        # positive from now on, until the filter is next rebuilt.
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM suppressed WHERE address = ?', (_key(addr),))
+            self._changed()
+
+    def reason(self, addr):
+        """
+        Return why ADDR is suppressed, or None if it isn't.
+
+        Arguments:
+        - `addr`: str
+
+        Return: str or None
+        Exceptions: None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT reason FROM suppressed WHERE address = ?',
+                                   (_key(addr),)).fetchone()
+        return None if row is None else row[0]
+
+    def suppressed(self, addrs):
+        bloom = self.bloom
+        maybe = {}
+        for addr in addrs:
+            key = _key(addr)
+            if key in bloom:
+                maybe.setdefault(key, []).append(addr)
+        if not maybe:
+            return set()
+        found = set()
+        keys = list(maybe)
+        with self._lock:
+            for i in range(0, len(keys), self.batch_size):
+                batch = keys[i:i + self.batch_size]
+                sql = 'SELECT address FROM suppressed WHERE address IN ({0})'.format(
+                    ', '.join('?' * len(batch)))
+                for (key,) in self._db.execute(sql, batch):
+                    found.update(maybe[key])
+        return found
@@ -0,0 +1,277 @@
+"""
+Keep under our relays' sending limits.
+
+A ThrottledMailer wraps any other mailer, holding each send back until
+it fits within token bucket limits per relay host, per sender (the
+authenticated user, if there is one) and per recipient domain.  Each
+limit is a (messages, seconds) pair, and each kind takes any number of
+them:
+
+>>> mailer = ThrottledMailer(SMTPAuthenticatedMailer('smtp.gmail.com', 587, user, pw),
+...                          per_user=[(20, 60), (2000, 24 * 60 * 60)],
+...                          per_domain=[(10, 1)])
+
+Host and sender limits count messages, domain limits count recipients.
+"""
+import collections
+import email.utils
+import smtplib
+import threading
+import time
+
+from letter import BaseMailer, Error, _stringlist
+
+__all__ = [
+    'ThrottledError',
+    'TokenBucket',
+    'ThrottledMailer'
+    ]
+
+
+class ThrottledError(Error):
+    """
+    Raised instead of waiting, when a send would have to wait longer
+    than we're allowed to.  DELAY is how long it would have been.
+    """
+    def __init__(self, delay):
+        super(ThrottledError, self).__init__(delay)
+        self.delay = delay
+
+
+class TokenBucket(object):
+    """
+    Allow RATE events every PER seconds, in bursts of up to RATE.
+
+    Tokens may be taken on credit - the bucket goes negative, and later
+    takers see a longer delay - so that waiters are served in the order
+    they arrived.  Not thread safe by itself.
+    """
+    def __init__(self, rate, per=1.0, clock=time.monotonic):
+        self.capacity = float(rate)
+        self.fill     = rate / float(per)
+        self.tokens   = self.capacity
+        self.clock    = clock
+        self.stamp    = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.fill)
+        self.stamp = now
+
+    def delay(self, n=1):
+        """
+        Return how long we'd have to wait to take N tokens.
+
+        Arguments:
+        - `n`: int
+
+        Return: float - seconds
+        Exceptions: None
+        """
+        self._refill()
+        return max(0.0, (min(n, self.capacity) - self.tokens) / self.fill)
+
+    def take(self, n=1):
+        """
+        Take N tokens, on credit if need be.
+
+        Arguments:
+        - `n`: int
+
+        Return: None
+        Exceptions: None
+        """
+        self._refill()
+        self.tokens -= n
+
+    def drain(self):
+        """
+        Throw away any tokens we have, e.g. when the relay tells us
+        we're going too fast.
+
+        Return: None
+        Exceptions: None
+        """
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class ThrottledMailer(BaseMailer):
+    """
+    Send through MAILER no faster than the limits PER_HOST, PER_USER
+    and PER_DOMAIN allow - each a list of (messages, seconds).
+
+    Sends wait for their turn.  If BLOCK is False, or the wait would be
+    longer than TIMEOUT seconds, we raise ThrottledError instead.
+
+    When the relay answers with one of RATE_LIMITED_CODES we empty the
+    host and sender buckets, slowing down everything behind us.
+
+    Sends go through MAILER's send_message() where it has one, so its
+    suppression list - which SUPPRESSIONS gets and sets - still applies.
+    """
+    rate_limited_codes = (421, 450, 451, 454)
+
+    def __init__(self, mailer, per_host=(), per_user=(), per_domain=(), block=True,
+                 timeout=None, clock=time.monotonic, sleep=time.sleep):
+        self.mailer     = mailer
+        self.per_host   = list(per_host)
+        self.per_user   = list(per_user)
+        self.per_domain = list(per_domain)
+        self.block      = block
+        self.timeout    = timeout
+        self.clock      = clock
+        self.sleep      = sleep
+        self._buckets   = {}
+        self._lock      = threading.Lock()
+
+    @property
+    def suppressions(self):
+        """
+        Our mailer's suppression list - setting it sets our mailer's.
+        """
+        return getattr(self.mailer, 'suppressions', None)
+
+    @suppressions.setter
+    def suppressions(self, suppressions):
+        self.mailer.suppressions = suppressions
+
+    def _bucket(self, kind, key, i, limit):
+        bucket = self._buckets.get((kind, key, i))
+        if bucket is None:
+            rate, per = limit
+            bucket = self._buckets[(kind, key, i)] = TokenBucket(rate, per, clock=self.clock)
+        return bucket
+
+    def _sender(self, sender):
+        return getattr(self.mailer, 'user', None) or email.utils.parseaddr(sender)[1].lower()
+
+    def buckets(self, sender, to):
+        """
+        Return the buckets a send from SENDER to TO draws on, and how
+        many tokens it takes from each.
+
+        Arguments:
+        - `sender`: str
+        - `to`: [str]
+
+        Return: [(TokenBucket, int), ...]
+        Exceptions: None
+        """
+        wanted = []
+        host = getattr(self.mailer, 'host', None)
+        for i, limit in enumerate(self.per_host):
+            wanted.append((self._bucket('host', host, i, limit), 1))
+        user = self._sender(sender)
+        for i, limit in enumerate(self.per_user):
+            wanted.append((self._bucket('user', user, i, limit), 1))
+        if self.per_domain:
+            domains = collections.Counter(
+                email.utils.parseaddr(addr)[1].rpartition('@')[2].lower() for addr in to)
+            for domain, count in sorted(domains.items()):
+                for i, limit in enumerate(self.per_domain):
+                    wanted.append((self._bucket('domain', domain, i, limit), count))
+        return wanted
+
+    def throttle(self, sender, to):
+        """
+        Wait until a send from SENDER to TO is within our limits, and
+        count it against them.
+
+        Arguments:
+        - `sender`: str
+        - `to`: [str]
+
+        Return: float - how long we waited
+        Exceptions: ThrottledError
+        """
+        with self._lock:
+            wanted = self.buckets(sender, to)
+            delay = max([bucket.delay(n) for bucket, n in wanted] or [0.0])
+            if delay and (not self.block or
+                          (self.timeout is not None and delay > self.timeout)):
+                raise ThrottledError(delay)
+            for bucket, n in wanted:
+                bucket.take(n)
+        if delay:
+            self.sleep(delay)
+        return delay
+
+    def _slow_down(self, sender):
+        with self._lock:
+            host = getattr(self.mailer, 'host', None)
+            user = self._sender(sender)
+            for (kind, key, i), bucket in self._buckets.items():
+                if (kind, key) in (('host', host), ('user', user)):
+                    bucket.drain()
+
+    def _call(self, sender, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except smtplib.SMTPResponseException as err:
+            if err.smtp_code in self.rate_limited_codes:
+                self._slow_down(sender)
+            raise
+
+    def send(self, sender, to, subject, plain=None, html=None, cc=None, bcc=None,
+             replyto=None, attach=None):
+        """
+        Send the message, once our limits allow.
+
+        Arguments are as for our mailer's send().
+
+        Return: whatever our mailer's send() returns
+        Exceptions: ThrottledError, NoContentError, smtplib.SMTPException
+        """
+        if hasattr(self.mailer, 'send_message'):
+            msg, recipients = self.mailer.message(sender, to, subject, plain=plain, html=html,
+                                                  cc=cc, bcc=bcc, replyto=replyto,
+                                                  attach=attach)
+            return self.send_message(msg, recipients)
+        self.throttle(sender, _stringlist(to, cc, bcc))
+        return self._call(sender, self.mailer.send, sender, to, subject, plain=plain,
+                          html=html, cc=cc, bcc=bcc, replyto=replyto, attach=attach)
+
+    def send_message(self, message, recipients):
+        """
+        Send an already built MESSAGE to RECIPIENTS with our mailer's
+        send_message(), once our limits allow.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `recipients`: [str]
+
+        Return: whatever our mailer's send_message() returns
+        Exceptions: ThrottledError, smtplib.SMTPException
+        """
+        sender = str(message['From'])
+        self.throttle(sender, recipients)
+        return self._call(sender, self.mailer.send_message, message, recipients)
+
+    def deliver(self, message, to):
+        """
+        Deliver an already built MESSAGE to TO, once our limits allow.
+
+        Arguments:
+        - `message`: MIMEMultipart
+        - `to`: [str]
+
+        Return: whatever our mailer's deliver() returns
+        Exceptions: ThrottledError, smtplib.SMTPException
+        """
+        sender = str(message['From'])
+        self.throttle(sender, to)
+        return self._call(sender, self.mailer.deliver, message, to)
+
+    def session(self):
+        return self.mailer.session()
+
+    def close(self):
+        """
+        Close our mailer.
+
+        Return: None
+        Exceptions: None
+        """
+        if hasattr(self.mailer, 'close'):
+            self.mailer.close()
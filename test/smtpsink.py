@@ -0,0 +1,156 @@
+"""
+A small in-process SMTP server for tests to deliver to.
+
+It can be driven from asyncio code:
+
+>>> sink = SMTPSink()
+>>> await sink.start()
+
+Or used as a context manager, in which case it runs its own event
+loop in a background thread:
+
+>>> with SMTPSink() as sink:
+...     smtplib.SMTP(sink.host, sink.port).sendmail(...)
+"""
+import asyncio
+import base64
+import threading
+
+
+class SMTPSink(object):
+    """
+    Accept any mail sent to us, and remember it.
+
+    Recipients in REFUSE are rejected with a 550.
+
+    SCRIPT maps commands to lists of replies to give the next times we
+    see them, instead of handling them - e.g. {'RCPT': ['451 Later']}.
+    A 421 reply also hangs up.
+    """
+    def __init__(self, host='127.0.0.1', port=0, refuse=(), script=None):
+        self.host        = host
+        self.port        = port
+        self.refuse      = set(refuse)
+        self.script      = dict((verb, list(replies)) for verb, replies in (script or {}).items())
+        self.messages    = []
+        self.commands    = []
+        self.logins      = []
+        self.connections = 0
+        self.server      = None
+        self._loop       = None
+        self._thread     = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+
+        def reply(line):
+            writer.write(line.encode('ascii') + b'\r\n')
+
+        sender, rcpts = None, []
+        reply('220 sink ESMTP')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('ascii').rstrip('\r\n')
+                self.commands.append(line)
+                verb = line.split(' ', 1)[0].upper()
+                arg = line[len(verb) + 1:]
+                if self.script.get(verb):
+                    scripted = self.script[verb].pop(0)
+                    reply(scripted)
+                    await writer.drain()
+                    if scripted.startswith('421'):
+                        break
+                    continue
+                if verb == 'EHLO':
+                    reply('250-sink')
+                    reply('250-PIPELINING')
+                    reply('250-8BITMIME')
+                    reply('250 AUTH PLAIN')
+                elif verb == 'HELO':
+                    reply('250 sink')
+                elif verb == 'AUTH':
+                    parts = arg.split()
+                    if len(parts) == 1:
+                        reply('334 ')
+                        await writer.drain()
+                        token = (await reader.readline()).strip()
+                    else:
+                        token = parts[1]
+                    self.logins.append(base64.b64decode(token).split(b'\0')[1:])
+                    reply('235 Authentication successful')
+                elif verb == 'MAIL':
+                    sender, rcpts = arg.split(':', 1)[1].strip().strip('<>'), []
+                    reply('250 OK')
+                elif verb == 'RCPT':
+                    addr = arg.split(':', 1)[1].strip().strip('<>')
+                    if addr in self.refuse:
+                        reply('550 No such user')
+                    else:
+                        rcpts.append(addr)
+                        reply('250 OK')
+                elif verb == 'DATA':
+                    if not rcpts:
+                        reply('503 No valid recipients')
+                        continue
+                    reply('354 Go ahead')
+                    await writer.drain()
+                    data = []
+                    while True:
+                        chunk = await reader.readline()
+                        if chunk in (b'.\r\n', b''):
+                            break
+                        if chunk.startswith(b'.'):
+                            chunk = chunk[1:]
+                        data.append(chunk)
+                    self.messages.append((sender, rcpts, b''.join(data)))
+                    sender, rcpts = None, []
+                    reply('250 Queued')
+                elif verb == 'RSET':
+                    sender, rcpts = None, []
+                    reply('250 OK')
+                elif verb == 'NOOP':
+                    reply('250 OK')
+                elif verb == 'QUIT':
+                    reply('221 Bye')
+                    await writer.drain()
+                    break
+                else:
+                    reply('502 Command not implemented')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def dead_port():
+    "A port with nothing listening on it"
+    with SMTPSink() as sink:
+        pass
+    return sink.port
@@ -0,0 +1,248 @@
+"""
+Unittests for the letter.aio module
+"""
+import asyncio
+import email
+import smtplib
+import unittest
+
+import ffs
+
+from letter import aio, SendResult, NoTemplateError
+from test.smtpsink import SMTPSink
+
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class AsyncSMTPMailerTestCase(unittest.TestCase):
+
+    def test_send(self):
+        "Should deliver"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            await mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='.hai')
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        sender, rcpts, data = sink.messages[0]
+        self.assertEqual('bill@example.com', sender)
+        self.assertEqual(['larry@example.com'], rcpts)
+        msg = email.message_from_bytes(data)
+        self.assertEqual('Hi', msg['Subject'])
+        self.assertEqual('.hai', msg.get_payload()[0].get_payload())
+
+    def test_display_names(self):
+        "Should only put the addresses in the envelope"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            await mailer.send('Bill <bill@example.com>', 'Larry <larry@example.com>', 'Hi',
+                              plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        sender, rcpts, data = sink.messages[0]
+        self.assertEqual('bill@example.com', sender)
+        self.assertEqual(['larry@example.com'], rcpts)
+        self.assertIn('MAIL FROM:<bill@example.com>', sink.commands)
+
+    def test_login(self):
+        "Should authenticate"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port, user='larry', pw='secret',
+                                         starttls=False)
+            await mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        self.assertEqual([[b'larry', b'secret']], sink.logins)
+
+    def test_bounded_connections(self):
+        "Should share at most MAX_CONNECTIONS sessions between concurrent sends"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port, max_connections=2)
+            await asyncio.gather(*[
+                mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+                for i in range(10)])
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        self.assertEqual(10, len(sink.messages))
+        self.assertEqual(2, sink.connections)
+
+    def test_partial_refusal(self):
+        "Should report refused recipients"
+        async def go():
+            sink = await SMTPSink(refuse=['bad@example.com']).start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            refused = await mailer.send('bill@example.com',
+                                        ['larry@example.com', 'bad@example.com'],
+                                        'Hi', plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return refused
+        refused = run(go())
+        self.assertEqual(['bad@example.com'], list(refused))
+        self.assertEqual(550, refused['bad@example.com'][0])
+
+    def test_all_refused(self):
+        "Should raise"
+        async def go():
+            sink = await SMTPSink(refuse=['bad@example.com']).start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            try:
+                await mailer.send('bill@example.com', 'bad@example.com', 'Hi', plain='hai')
+            finally:
+                await mailer.close()
+                await sink.stop()
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            run(go())
+
+    def test_retry(self):
+        "Should retry temporary failures"
+        async def go():
+            sink = await SMTPSink(script={'RCPT': ['451 Greylisted']}).start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            mailer.backoff = 0.01
+            await mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual(1, sink.connections)
+
+    def test_send_bulk(self):
+        "Should batch recipients MAX_RECIPIENTS to a transaction"
+        async def go():
+            sink = await SMTPSink(refuse=['user1@example.com']).start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            mailer.max_recipients = 2
+            refused = await mailer.send_bulk(
+                'bill@example.com', ['user{0}@example.com'.format(i) for i in range(5)],
+                'News', plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return sink, refused
+        sink, refused = run(go())
+        self.assertEqual(['user1@example.com'], list(refused))
+        self.assertEqual(3, len(sink.messages))
+        self.assertEqual(1, sink.connections)
+
+    def test_rejected(self):
+        "Should report malformed addresses, on every path"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            prepared = mailer.prepare('bill@example.com', 'Hi')
+            refused = [
+                await mailer.send('bill@example.com', ['larry@example.com', 'bogus'], 'Hi',
+                                  plain='hai'),
+                await mailer.send_prepared(prepared, ['larry@example.com', 'bogus'],
+                                           plain='hai'),
+                await mailer.send_bulk('bill@example.com',
+                                       ['a@example.com', 'a@EXAMPLE.com', 'bogus'], 'Hi',
+                                       plain='hai')]
+            await mailer.close()
+            await sink.stop()
+            return sink, refused
+        sink, refused = run(go())
+        self.assertEqual([['bogus']] * 3, [list(r) for r in refused])
+        self.assertEqual(553, refused[0]['bogus'][0])
+        self.assertEqual([['larry@example.com'], ['larry@example.com'], ['a@example.com']],
+                         [m[1] for m in sink.messages])
+
+    def test_send_chunks(self):
+        "Should split sends to more than MAX_RECIPIENTS across transactions"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            mailer.max_recipients = 2
+            await mailer.send('bill@example.com',
+                              ['user{0}@example.com'.format(i) for i in range(5)], 'Hi',
+                              plain='hai')
+            await mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        self.assertEqual([2, 2, 1], [len(m[1]) for m in sink.messages])
+
+
+class AsyncPostmanTestCase(unittest.TestCase):
+
+    def test_send_template(self):
+        "Should render and deliver"
+        async def go():
+            sink = await SMTPSink().start()
+            postie = aio.AsyncPostman(TEMPLATES, host=sink.host, port=sink.port)
+            async with postie.template('greeting'):
+                await postie.send('bill@example.com', 'larry@example.com', 'Hi', name='Larry')
+            await postie.send('bill@example.com', 'larry@example.com', 'Hi', 'Plain')
+            await postie.mailer.close()
+            await sink.stop()
+            return sink
+        sink = run(go())
+        bodies = [email.message_from_bytes(m[2]).get_payload()[0].get_payload()
+                  for m in sink.messages]
+        self.assertEqual(['Hello Larry', 'Plain'], bodies)
+
+    def test_concurrent_templates(self):
+        "Should keep each task's template to itself"
+        async def go():
+            sink = await SMTPSink().start()
+            postie = aio.AsyncPostman(TEMPLATES, host=sink.host, port=sink.port)
+
+            async def send(name, to):
+                async with postie.template(name):
+                    await asyncio.sleep(0.01)
+                    await postie.send('bill@example.com', to, 'Hi', name='Larry')
+
+            await asyncio.gather(send('greeting', 'greeting@example.com'),
+                                 send('cool_email', 'cool@example.com'))
+            await postie.mailer.close()
+            await sink.stop()
+            return postie, sink
+        postie, sink = run(go())
+        bodies = dict((m[1][0], email.message_from_bytes(m[2]).get_payload()[0].get_payload())
+                      for m in sink.messages)
+        self.assertEqual({'greeting@example.com': 'Hello Larry',
+                          'cool@example.com': '<h1>Hai</h1>'}, bodies)
+        self.assertEqual((None, None), (postie.plain, postie.html))
+
+    def test_send_many(self):
+        "Should return results in order"
+        async def go():
+            sink = await SMTPSink(refuse=['bad@example.com']).start()
+            postie = aio.AsyncPostman(TEMPLATES, host=sink.host, port=sink.port)
+            people = [('person{0}@example.com'.format(i), {'name': str(i)}) for i in range(20)]
+            people[3] = ('bad@example.com', {'name': 'bad'})
+            async with postie.template('greeting'):
+                results = await postie.send_many('bill@example.com', 'Hi', people)
+            await postie.mailer.close()
+            await sink.stop()
+            return people, results, sink
+        people, results, sink = run(go())
+        self.assertEqual([p[0] for p in people], [r.to for r in results])
+        self.assertEqual([3], [i for i, r in enumerate(results) if not r.ok])
+        self.assertEqual(19, len(sink.messages))
+
+    def test_send_many_no_template(self):
+        "Should raise"
+        postie = aio.AsyncPostman(TEMPLATES)
+        with self.assertRaises(NoTemplateError):
+            run(postie.send_many('bill@example.com', 'Hi', []))
+
+
+if __name__ == '__main__':
+    unittest.main()
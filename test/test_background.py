@@ -0,0 +1,119 @@
+"""
+Unittests for the letter.background module
+"""
+import gc
+import smtplib
+import threading
+import unittest
+import weakref
+
+import ffs
+from mock import MagicMock, patch
+
+import letter
+from letter import background
+
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
+
+
+class BackgroundMailerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.inner = MagicMock(name='Mock Mailer')
+        self.inner.message.return_value = ('MSG', ['larry@example.com'])
+
+    def test_send(self):
+        "Should check the message now, and build and deliver it later"
+        gate = threading.Event()
+        self.inner.message.side_effect = lambda *a, **k: gate.wait(5) and ('MSG', a[1:2])
+        mailer = background.BackgroundMailer(self.inner)
+        future = mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+        self.assertEqual(1, self.inner.sanity_check.call_count)
+        self.assertFalse(future.done())
+        gate.set()
+        future.result(timeout=5)
+        self.assertEqual('hai', self.inner.message.call_args[1]['plain'])
+        self.inner.send_message.assert_called_once_with('MSG', ('larry@example.com',))
+        mailer.close()
+        self.inner.close.assert_called_once_with()
+
+    def test_send_no_content(self):
+        "Should raise in the caller"
+        mailer = background.BackgroundMailer(letter.BaseSMTPMailer())
+        with self.assertRaises(letter.NoContentError):
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi')
+        mailer.close()
+
+    def test_delivery_error(self):
+        "Should report failures on the future"
+        err = smtplib.SMTPServerDisconnected()
+        self.inner.send_message.side_effect = err
+        results = []
+        mailer = background.BackgroundMailer(self.inner)
+        future = mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai',
+                             callback=results.append)
+        mailer.flush()
+        self.assertIs(err, future.exception())
+        self.assertEqual([future], results)
+        mailer.close()
+
+    def test_queue_full(self):
+        "Should raise when we can't queue"
+        mailer = background.BackgroundMailer(self.inner, workers=0, maxsize=1, block=False)
+        mailer.submit('MSG', ['larry@example.com'])
+        with self.assertRaises(background.QueueFullError):
+            mailer.submit('MSG', ['larry@example.com'])
+
+    def test_close_flushes(self):
+        "Should deliver everything before stopping"
+        gate = threading.Event()
+        self.inner.deliver.side_effect = lambda *a: gate.wait(5)
+        mailer = background.BackgroundMailer(self.inner, workers=1)
+        futures = [mailer.submit('MSG', ['larry@example.com']) for i in range(5)]
+        gate.set()
+        mailer.close()
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(5, self.inner.deliver.call_count)
+
+
+    def test_garbage_collected(self):
+        "Should not be kept alive by its workers"
+        mailer = background.BackgroundMailer(self.inner)
+        workers = mailer.workers
+        ref = weakref.ref(mailer)
+        del mailer
+        gc.collect()
+        self.assertEqual(None, ref())
+        for worker in workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+
+
+class NonBlockingPostmanTestCase(unittest.TestCase):
+
+    def test_send(self):
+        "Should return a future"
+        with patch('smtplib.SMTP') as psmtp:
+            postie = letter.Postman(blocking=False, workers=3)
+            self.assertEqual(3, postie.mailer.mailer.pool.size)
+            future = postie.send('bill@example.com', 'larry@example.com', 'Hi', 'hai')
+            future.result(timeout=5)
+            self.assertEqual(1, psmtp.return_value.sendmail.call_count)
+            postie.mailer.close()
+
+    def test_send_many_reports_failures(self):
+        "Should wait for deliveries, and report their failures"
+        with patch('smtplib.SMTP') as psmtp:
+            psmtp.return_value.sendmail.side_effect = [
+                smtplib.SMTPRecipientsRefused({}), {}]
+            postie = letter.Postman(TEMPLATES, blocking=False, workers=1)
+            with postie.template('greeting'):
+                results = postie.send_many('bill@example.com', 'Hi',
+                                           [('larry@example.com', {}), ('bob@example.com', {})])
+            postie.mailer.close()
+        self.assertIsInstance(results[0].error, smtplib.SMTPRecipientsRefused)
+        self.assertFalse(results[0].ok)
+        self.assertTrue(results[1].ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
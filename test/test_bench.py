@@ -0,0 +1,30 @@
+"""
+Make sure the benchmarks in bench/ still run
+"""
+import json
+import unittest
+
+from six import StringIO
+from mock import patch
+
+from bench import run
+
+
+class BenchTestCase(unittest.TestCase):
+
+    def test_run(self):
+        "Should report every benchmark"
+        with patch.object(run, 'ATTACHMENT_SIZES', (1024,)):
+            report = run.run(iterations=3)
+        self.assertEqual(set(['find_tpl', 'body', 'mime', 'mime_attachment',
+                              'prepared_attachment', 'attachment_1024', 'deliver']),
+                         set(report['results']))
+        for result in report['results'].values():
+            self.assertTrue(result['ops_per_sec'] > 0)
+            self.assertTrue(result['p50_ms'] <= result['p99_ms'])
+
+    def test_main(self):
+        "Should print JSON"
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            run.main(['--iterations', '2', '--only', 'mime'])
+        self.assertEqual(['mime'], list(json.loads(out.getvalue())['results']))
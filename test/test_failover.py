@@ -0,0 +1,91 @@
+"""
+Unittests for the letter.failover module
+"""
+import smtplib
+import unittest
+
+from letter import failover
+from test.smtpsink import SMTPSink, dead_port
+
+
+class FailoverMailerTestCase(unittest.TestCase):
+
+    def send(self, mailer, n=1):
+        for i in range(n):
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+
+    def test_weighted_round_robin(self):
+        "Should share sends by weight"
+        with SMTPSink() as one, SMTPSink() as two:
+            mailer = failover.FailoverMailer([(one.host, one.port), (two.host, two.port)],
+                                             weights=[2, 1])
+            self.send(mailer, 6)
+            mailer.close()
+        self.assertEqual(4, len(one.messages))
+        self.assertEqual(2, len(two.messages))
+
+    def test_latency(self):
+        "Should prefer the quickest relay"
+        with SMTPSink() as one, SMTPSink() as two:
+            mailer = failover.FailoverMailer([(one.host, one.port), (two.host, two.port)],
+                                             strategy='latency')
+            mailer.relays[0].latency, mailer.relays[1].latency = 60, 30
+            self.send(mailer, 3)
+            mailer.close()
+        self.assertEqual(0, len(one.messages))
+        self.assertEqual(3, len(two.messages))
+        self.assertTrue(mailer.relays[1].latency < 30)
+
+    def test_failover(self):
+        "Should route around a dead relay, and stop trying it"
+        with SMTPSink() as sink:
+            mailer = failover.FailoverMailer([(sink.host, dead_port()), (sink.host, sink.port)],
+                                             failures=2, probe_interval=0)
+            self.send(mailer, 4)
+            mailer.close()
+        self.assertEqual(4, len(sink.messages))
+        dead = mailer.relays[0]
+        self.assertFalse(dead.healthy)
+        self.assertEqual(2, dead.failures)
+
+    def test_probe(self):
+        "Should bring a relay back once it answers"
+        with SMTPSink() as sink:
+            mailer = failover.FailoverMailer([(sink.host, sink.port)], failures=1,
+                                             probe_interval=0)
+            relay = mailer.relays[0]
+            relay.healthy = False
+            mailer._probe()
+            self.assertTrue(relay.healthy)
+            self.assertEqual(['noop', 'quit'], sink.commands[-2:])
+            mailer.close()
+
+    def test_probe_reschedules(self):
+        "Should keep probing a relay that is still down"
+        mailer = failover.FailoverMailer([('127.0.0.1', dead_port())], probe_interval=60)
+        mailer.relays[0].healthy = False
+        mailer._probe()
+        self.assertIsNotNone(mailer._prober)
+        mailer.close()
+        self.assertIsNone(mailer._prober)
+
+    def test_all_down(self):
+        "Should say what each relay did"
+        mailer = failover.FailoverMailer([('127.0.0.1', dead_port()),
+                                          ('127.0.0.1', dead_port())], probe_interval=0)
+        with self.assertRaises(failover.NoRelayError) as cm:
+            self.send(mailer)
+        self.assertEqual(2, len(cm.exception.errors))
+
+    def test_permanent(self):
+        "Should not try another relay for a 5xx"
+        with SMTPSink(script={'DATA': ['554 Spam']}) as one, SMTPSink() as two:
+            mailer = failover.FailoverMailer([(one.host, one.port), (two.host, two.port)])
+            with self.assertRaises(smtplib.SMTPDataError):
+                self.send(mailer)
+            mailer.close()
+        self.assertEqual([], two.messages)
+
+    def test_postman(self):
+        postie = failover.FailoverPostman('.', [('localhost', 25), ('localhost', 26)])
+        self.assertEqual([25, 26], [r.mailer.port for r in postie.mailer.relays])
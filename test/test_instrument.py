@@ -0,0 +1,94 @@
+"""
+Unittests for the letter.instrument module
+"""
+import logging
+import unittest
+
+import ffs
+from mock import MagicMock, patch
+
+import letter
+from letter import instrument
+from test.smtpsink import SMTPSink
+
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_summary(self):
+        "Should count, total and bucket each stage"
+        histogram = instrument.Histogram()
+        for i in range(99):
+            histogram('send', 0.001, 100)
+        histogram('send', 1.0, 100)
+        summary = histogram.summary()['send']
+        self.assertEqual(100, summary['count'])
+        self.assertEqual(10000, summary['bytes'])
+        self.assertAlmostEqual(1.099, summary['seconds'])
+        self.assertTrue(0.001 <= summary['p50'] < 0.002)
+        self.assertTrue(0.001 <= summary['p99'] < 0.002)
+        self.assertTrue(histogram.percentile('send', 100) >= 1.0)
+        self.assertEqual(None, histogram.percentile('connect', 50))
+
+    def test_clear(self):
+        histogram = instrument.Histogram()
+        histogram('render', 0.1, None)
+        histogram.clear()
+        self.assertEqual({}, histogram.summary())
+
+
+class LoggingListenerTestCase(unittest.TestCase):
+
+    def test_threshold(self):
+        "Should only log slow stages"
+        logger = MagicMock(name='Logger')
+        listener = instrument.LoggingListener(logger=logger, level=logging.WARNING,
+                                              threshold=0.5)
+        listener('connect', 0.1, None)
+        self.assertEqual(0, logger.log.call_count)
+        listener('send', 1, 2048)
+        logger.log.assert_called_once_with(logging.WARNING, 'letter %s took %.2fms (%d bytes)',
+                                           'send', 1000, 2048)
+
+
+class ListenerTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        del instrument.listeners[:]
+
+    def test_stages(self):
+        "Should report each stage of a templated send"
+        histogram = instrument.Histogram()
+        instrument.add_listener(histogram)
+        with SMTPSink() as sink:
+            postie = letter.SMTPPostman(templatedir=TEMPLATES, host=sink.host, port=sink.port)
+            with postie.template('greeting'):
+                postie.send('me@example.com', 'you@example.com', 'Hi', name='Larry')
+            postie.mailer.close()
+        summary = histogram.summary()
+        self.assertEqual(set(['lookup', 'render', 'build', 'connect', 'send']), set(summary))
+        self.assertEqual(len('Hello Larry'), summary['render']['bytes'])
+        self.assertEqual(len(sink.messages[0][2]), summary['send']['bytes'])
+
+    def test_no_listeners(self):
+        "Should not time anything"
+        with patch.object(instrument, 'clock') as pclock:
+            letter.BaseSMTPMailer().message('me@example.com', 'you@example.com', 'Hi',
+                                            plain='Hai')
+            self.assertEqual(0, pclock.call_count)
+
+    def test_broken_listener(self):
+        "Should not let a listener break sending"
+        instrument.add_listener(MagicMock(side_effect=ValueError))
+        msg, to = letter.BaseSMTPMailer().message('me@example.com', 'you@example.com', 'Hi',
+                                                  plain='Hai')
+        self.assertEqual(['you@example.com'], to)
+
+    def test_remove_listener(self):
+        listener = MagicMock()
+        instrument.add_listener(listener)
+        instrument.add_listener(listener)
+        self.assertEqual([listener], instrument.listeners)
+        instrument.remove_listener(listener)
+        self.assertEqual([], instrument.listeners)
@@ -1,7 +1,19 @@
 """
 Unittests for the letter packate
 """
+import base64
+import email
+from email.mime.text import MIMEText
+import os
+import re
+import shutil
+import smtplib
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
 
 from django.core import mail
@@ -12,7 +24,9 @@ from mock import MagicMock, patch
 if sys.version_info <  (2, 7): import unittest2 as unittest
 
 import letter
+from test.smtpsink import SMTPSink
 
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
 
 def setup_module():
     utils.setup_test_environment()
@@ -78,6 +92,678 @@ class BaseSMTPMailerTestCase(unittest.TestCase):
             mailer.send(None, None, None)
 
 
+class WireTestCase(unittest.TestCase):
+
+    def message(self):
+        msg, to = letter.BaseSMTPMailer().message(
+            'bill@example.com', 'larry@example.com', 'Hi', plain='.hai\r\nthere\n',
+            html=u'<p>\xe9</p>')
+        msg.preamble, msg.epilogue = 'Preamble', 'Epilogue\n'
+        return msg
+
+    def test_flatten(self):
+        "Should serialise just like the email package, with CRLFs"
+        msg = self.message()
+        expected = re.sub(br'(?:\r\n|\n|\r(?!\n))', b'\r\n', msg.as_bytes())
+        self.assertEqual(expected, letter._flatten(msg).tobytes())
+
+    def test_flatten_big(self):
+        "Should hold about one copy of the message at a time"
+        msg = self.message()
+        msg.attach(MIMEText(('x' * 70 + '\n') * 20000))
+        size = len(msg.as_bytes())
+        tracemalloc.start()
+        try:
+            letter._flatten(msg)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(peak < size * 1.5)
+
+    def test_smtp_chunks(self):
+        "Should stuff dots, without copying otherwise"
+        chunks = list(letter._smtp_chunks(self.message()))
+        self.assertEqual(1, len(chunks))
+        self.assertIsInstance(chunks[0], memoryview)
+        self.assertIn(b'\r\n..hai\r\nthere\r\n', chunks[0].tobytes())
+        data = b'Subject: Hi\r\n\r\nHai\r\n'
+        self.assertIs(data, letter._smtp_bytes(data))
+
+
+class PreparedMessageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'brochure.pdf')
+        with open(self.path, 'wb') as fh:
+            fh.write(b'%PDF' * 1000)
+        self.mailer = letter.BaseSMTPMailer()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_render(self):
+        "Should assemble the same message as message() does"
+        prepared = self.mailer.prepare('bill@example.com', 'Hi', cc='sergey@example.com',
+                                       replyto='noreply@example.com', attach=self.path)
+        chunks, recipients, rejected = prepared.render(['larry@example.com'], plain='.hai',
+                                                       html='<p>hai</p>')
+        msg, expected_recipients = self.mailer.message(
+            'bill@example.com', ['larry@example.com'], 'Hi', plain='.hai', html='<p>hai</p>',
+            cc='sergey@example.com', replyto='noreply@example.com', attach=self.path)
+        expected = letter._flatten(msg).tobytes()
+        expected = expected.replace(msg.get_boundary().encode('ascii'), b'BOUNDARY')
+        data = b''.join(chunks).replace(prepared._delimiter.strip()[2:], b'BOUNDARY')
+        self.assertEqual(expected, data)
+        self.assertEqual(expected_recipients, recipients)
+        self.assertEqual({}, rejected)
+
+    def test_render_wire(self):
+        "Should stuff dots in the bodies"
+        prepared = self.mailer.prepare('bill@example.com', 'Hi')
+        chunks, recipients, rejected = prepared.render('larry@example.com', plain='.hai',
+                                                       wire=True)
+        self.assertIn(b'\r\n..hai', b''.join(chunks))
+
+    def test_render_only_bodies(self):
+        "Should only serialise the bodies for each message"
+        prepared = self.mailer.prepare('bill@example.com', 'Hi', attach=self.path)
+        with patch.object(letter, '_flatten', wraps=letter._flatten) as pflatten:
+            prepared.render('larry@example.com', plain='hai', html='<p>hai</p>')
+            self.assertEqual(2, pflatten.call_count)
+
+    def test_no_content(self):
+        prepared = self.mailer.prepare('bill@example.com', 'Hi')
+        with self.assertRaises(letter.NoContentError):
+            prepared.render('larry@example.com')
+
+    def test_send_prepared(self):
+        "Should deliver"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            prepared = mailer.prepare('bill@example.com', 'Hi', bcc='audit@example.com',
+                                      attach=self.path)
+            for name in ['larry', 'sergey']:
+                mailer.send_prepared(prepared, name + '@example.com', plain='Hai ' + name)
+            mailer.close()
+        self.assertEqual(['sergey@example.com', 'audit@example.com'], sink.messages[1][1])
+        msg = email.message_from_bytes(sink.messages[1][2])
+        self.assertEqual('sergey@example.com', msg['To'])
+        text, attachment = msg.get_payload()
+        self.assertEqual('Hai sergey', text.get_payload())
+        self.assertEqual(b'%PDF' * 1000, attachment.get_payload(decode=True))
+
+    def test_send_prepared_rejected(self):
+        "Should report malformed addresses as refused"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            prepared = mailer.prepare('bill@example.com', 'Hi')
+            refused = mailer.send_prepared(prepared, ['larry@example.com', 'bogus'],
+                                           plain='hai')
+            with self.assertRaises(smtplib.SMTPRecipientsRefused) as cm:
+                mailer.send_prepared(prepared, 'bogus', plain='hai')
+            mailer.close()
+        self.assertEqual({'bogus': letter._BAD_ADDRESS}, refused)
+        self.assertEqual({'bogus': letter._BAD_ADDRESS}, cm.exception.recipients)
+        self.assertEqual(1, len(sink.messages))
+
+    def test_send_prepared_mocked(self):
+        "Should put the message as it is in the test outbox"
+        outbox = letter.setup_test_environment()
+        try:
+            mailer = letter.SMTPMailer('localhost', 25)
+            prepared = mailer.prepare('bill@example.com', 'Hi')
+            mailer.send_prepared(prepared, 'larry@example.com', plain='.hai')
+        finally:
+            letter.teardown_test_environment()
+        self.assertEqual(1, len(outbox))
+        self.assertEqual('larry@example.com', outbox[0]['To'])
+        self.assertEqual('.hai', outbox[0].get_payload()[0].get_payload())
+
+
+class RecipientsTestCase(unittest.TestCase):
+
+    def test_dedup(self):
+        "Should deliver to each address once, comparing domains without case"
+        rcpts = letter.Recipients(['Bill <bill@example.com>, larry@example.com'],
+                                  cc='Larry@EXAMPLE.com',
+                                  bcc=['bill@EXAMPLE.COM', 'audit@example.com'])
+        self.assertEqual(['Bill <bill@example.com>', 'larry@example.com'], rcpts.to)
+        self.assertEqual(['Larry@EXAMPLE.com'], rcpts.cc)
+        self.assertEqual(['audit@example.com'], rcpts.bcc)
+        self.assertEqual(['bill@example.com', 'larry@example.com', 'Larry@EXAMPLE.com',
+                          'audit@example.com'], rcpts.envelope)
+
+    def test_rejected(self):
+        "Should leave out malformed addresses, and say which"
+        rcpts = letter.Recipients(['larry@example.com', 'not an address'],
+                                  bcc=['x@', 'a@b@c'])
+        self.assertEqual(['larry@example.com'], rcpts.envelope)
+        self.assertEqual(['not an address', 'x@', 'a@b@c'], list(rcpts.rejected))
+        self.assertEqual(553, rcpts.rejected['x@'][0])
+
+    def test_group(self):
+        "Should keep groups in headers, and deliver to their members"
+        rcpts = letter.Recipients(['undisclosed-recipients:;', 'Team: a@example.com;'])
+        self.assertEqual(['undisclosed-recipients:;', 'Team: a@example.com;'], rcpts.to)
+        self.assertEqual(['a@example.com'], rcpts.envelope)
+
+    def test_chunks(self):
+        "Should split the envelope into transactions"
+        rcpts = letter.Recipients(bcc=['{0}@example.com'.format(i) for i in range(5)])
+        self.assertEqual([2, 2, 1], [len(c) for c in rcpts.chunks(2)])
+        self.assertEqual(5, len(rcpts))
+
+    def test_send(self):
+        "Should deliver once to each good address, in batches, and report the rest"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.max_recipients = 2
+            refused = mailer.send('bill@example.com', ['larry@example.com', 'oops'], 'Hi',
+                                  plain='hai', cc='sergey@example.com',
+                                  bcc=['LARRY@example.com', 'larry@Example.com'])
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                mailer.send('bill@example.com', 'oops', 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual(['oops'], list(refused))
+        self.assertEqual([['larry@example.com', 'sergey@example.com'], ['LARRY@example.com']],
+                         [m[1] for m in sink.messages])
+
+
+class MessageRecordTestCase(unittest.TestCase):
+
+    def test_message(self):
+        "Should build the same message as the mailer would"
+        to = ['larry@example.com']
+        record = letter.MessageRecord('bill@example.com', to, 'Hi', plain='hai',
+                                      bcc='audit@example.com', headers={'X-Campaign': 'spring'})
+        to.append('sergey@example.com')
+        msg, recipients = record.message(letter.BaseSMTPMailer())
+        self.assertEqual(['larry@example.com', 'audit@example.com'], recipients)
+        self.assertEqual('larry@example.com', msg['To'])
+        self.assertEqual('spring', msg['X-Campaign'])
+
+    def test_send(self):
+        "Should deliver through mailers that build MIME, and send through others"
+        mailer = MagicMock(name='Mock Mailer', spec=['message', 'send_message'])
+        mailer.message.return_value = (MagicMock(), ['larry@example.com'])
+        letter.MessageRecord('bill@example.com', 'larry@example.com', 'Hi', plain='hai').send(mailer)
+        self.assertEqual(1, mailer.send_message.call_count)
+        other = MagicMock(name='Mock Mailer', spec=['send'])
+        letter.MessageRecord('bill@example.com', ('larry@example.com',), 'Hi', plain='hai',
+                             attach=('/tmp/x',)).send(other)
+        args, kwargs = other.send.call_args
+        self.assertEqual(['larry@example.com'], args[1])
+        self.assertEqual(['/tmp/x'], kwargs['attach'])
+        with self.assertRaises(NotImplementedError):
+            letter.MessageRecord('bill@example.com', 'larry@example.com', 'Hi', plain='hai',
+                                 headers=[('X-Campaign', 'spring')]).send(other)
+
+    def test_compact(self):
+        "Should cost a small, fixed amount of memory per record"
+        addrs = ['user{0}@example.com'.format(i) for i in range(10000)]
+        body = 'Hello ' * 1000
+        tracemalloc.start()
+        try:
+            records = [letter.MessageRecord('bill@example.com', a, 'Hi', plain=body,
+                                            cc=['larry@example.com'])
+                       for a in addrs]
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(size / len(records), 200)
+        with self.assertRaises(AttributeError):
+            records[0].extra = True
+
+
+class AttachmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'report.pdf')
+        self.contents = os.urandom(300 * 1024 + 7)
+        with open(self.path, 'wb') as fh:
+            fh.write(self.contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_as_msg_stream(self):
+        "Should not read the file"
+        with patch.object(letter.ffs.Path, 'open') as popen:
+            part = letter.Attachment(self.path).as_msg(stream=True)
+            self.assertEqual(0, popen.call_count)
+        self.assertTrue(part.get_payload().startswith('letter-stream-'))
+        self.assertEqual('base64', part['Content-Transfer-Encoding'])
+        self.assertEqual('application/pdf', part.get_content_type())
+
+    def test_iter_base64(self):
+        "Should encode in chunks"
+        attachment = letter.Attachment(self.path)
+        chunks = list(attachment.iter_base64())
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(line) == 76 for line in b''.join(chunks).split(b'\r\n')[:-1]))
+        self.assertEqual(self.contents, base64.b64decode(b''.join(chunks)))
+
+    def test_deliver_streamed(self):
+        "Should deliver streamed attachments intact"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.stream_threshold = 1024
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='.hai',
+                        attach=self.path)
+            mailer.close()
+        sender, rcpts, data = sink.messages[0]
+        self.assertNotIn(b'letter-stream-', data)
+        msg = email.message_from_bytes(data)
+        text, attachment = msg.get_payload()
+        self.assertEqual('.hai', text.get_payload())
+        self.assertEqual(self.contents, attachment.get_payload(decode=True))
+        self.assertEqual('report.pdf', attachment.get_filename())
+
+    def test_deliver_streamed_test_environment(self):
+        "Should put streamed attachments in the test outbox intact"
+        outbox = letter.setup_test_environment()
+        try:
+            mailer = letter.SMTPMailer('localhost', 25)
+            mailer.stream_threshold = 1024
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='.hai',
+                        attach=self.path)
+        finally:
+            letter.teardown_test_environment()
+        text, attachment = outbox[0].get_payload()
+        self.assertEqual('.hai', text.get_payload())
+        self.assertEqual(self.contents, attachment.get_payload(decode=True))
+
+
+class AttachmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'brochure.pdf')
+        with open(self.path, 'wb') as fh:
+            fh.write(b'%PDF' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_encodes_once(self):
+        "Should only encode a file once"
+        cache = letter.AttachmentCache()
+        with patch.object(letter.Attachment, 'as_msg', autospec=True,
+                          side_effect=letter.Attachment.as_msg) as pas_msg:
+            first = cache.get(letter.Attachment(self.path))
+            second = cache.get(letter.Attachment(self.path))
+            self.assertEqual(1, pas_msg.call_count)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.as_string(), second.as_string())
+
+    def test_changed(self):
+        "Should re-encode a file that has changed"
+        cache = letter.AttachmentCache()
+        cache.get(letter.Attachment(self.path))
+        with open(self.path, 'wb') as fh:
+            fh.write(b'%PDF')
+        part = cache.get(letter.Attachment(self.path))
+        self.assertEqual(b'%PDF', part.get_payload(decode=True))
+        self.assertEqual(1, len(cache._parts))
+
+    def test_max_bytes(self):
+        "Should evict to stay under budget"
+        other = os.path.join(self.tmpdir, 'other.pdf')
+        with open(other, 'wb') as fh:
+            fh.write(b'%PDF' * 1000)
+        cache = letter.AttachmentCache(max_bytes=8000)
+        cache.get(letter.Attachment(self.path))
+        cache.get(letter.Attachment(other))
+        self.assertEqual([other], [k[0] for k in cache._parts])
+        self.assertTrue(cache.size <= 8000)
+
+    def test_shared_by_mailer(self):
+        "Should reuse encoded attachments between sends"
+        mailer = letter.BaseSMTPMailer()
+        with patch.object(letter.Attachment, 'as_msg', autospec=True,
+                          side_effect=letter.Attachment.as_msg) as pas_msg:
+            for to in ['larry@example.com', 'bill@example.com']:
+                msg, recipients = mailer.message('me@example.com', to, 'Hi', plain='hai',
+                                                 attach=self.path)
+            self.assertEqual(1, pas_msg.call_count)
+        self.assertEqual(b'%PDF' * 1000, msg.get_payload()[1].get_payload(decode=True))
+
+
+class SMTPConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = MagicMock(name='Mock SMTP')
+        self.conn.rset.return_value = (250, b'OK')
+        self.connect = MagicMock(name='Mock connect', return_value=self.conn)
+        self.pool = letter.SMTPConnectionPool(self.connect)
+
+    def test_reuse(self):
+        "Should reuse an idle session"
+        with self.pool.connection():
+            pass
+        with self.pool.connection():
+            pass
+        self.assertEqual(1, self.connect.call_count)
+        self.conn.rset.assert_called_once_with()
+
+    def test_unhealthy(self):
+        "Should reconnect if RSET fails"
+        self.conn.rset.return_value = (421, b'Closing')
+        with self.pool.connection():
+            pass
+        with self.pool.connection():
+            pass
+        self.assertEqual(2, self.connect.call_count)
+
+    def test_max_messages(self):
+        "Should retire sessions that have sent enough messages"
+        self.pool.max_messages = 2
+        for i in range(3):
+            with self.pool.connection():
+                pass
+        self.assertEqual(2, self.connect.call_count)
+        self.assertEqual(1, self.conn.quit.call_count)
+
+    def test_idle_timeout(self):
+        "Should close sessions that have been idle too long"
+        self.pool.idle_timeout = -1
+        with self.pool.connection():
+            pass
+        self.pool.prune()
+        self.assertEqual(1, self.conn.quit.call_count)
+
+    def test_idle_reaper(self):
+        "Should close idle sessions without waiting for the next acquire"
+        self.pool.idle_timeout = 0.05
+        with self.pool.connection():
+            pass
+        for i in range(100):
+            if self.conn.quit.called:
+                break
+            time.sleep(0.01)
+        self.assertEqual(1, self.conn.quit.call_count)
+        self.assertEqual([], self.pool._idle)
+        self.assertEqual(None, self.pool._reaper)
+
+    def test_close_cancels_reaper(self):
+        "Should stop watching once closed"
+        with self.pool.connection():
+            pass
+        reaper = self.pool._reaper
+        self.pool.close()
+        self.assertEqual(None, self.pool._reaper)
+        self.assertTrue(reaper.finished.is_set())
+
+    def test_broken(self):
+        "Should discard sessions that raised"
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            with self.pool.connection():
+                raise smtplib.SMTPServerDisconnected()
+        self.assertEqual([], self.pool._idle)
+
+
+class SMTPMailerTestCase(unittest.TestCase):
+
+    def test_deliver_reuses_connection(self):
+        "Should only connect once"
+        with patch('smtplib.SMTP') as psmtp:
+            psmtp.return_value.rset.return_value = (250, b'OK')
+            mailer = letter.SMTPMailer('localhost', 25)
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            psmtp.assert_called_once_with('localhost', 25)
+            self.assertEqual(2, psmtp.return_value.sendmail.call_count)
+            self.assertEqual(0, psmtp.return_value.quit.call_count)
+            mailer.close()
+            psmtp.return_value.quit.assert_called_once_with()
+
+    def test_authenticated_logs_in_once(self):
+        "Should only authenticate once"
+        with patch('smtplib.SMTP') as psmtp:
+            psmtp.return_value.rset.return_value = (250, b'OK')
+            mailer = letter.SMTPAuthenticatedMailer('localhost', 587, 'larry', 'secret')
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            psmtp.return_value.login.assert_called_once_with('larry', 'secret')
+            self.assertEqual(2, psmtp.return_value.sendmail.call_count)
+
+    def test_session(self):
+        "Should hold one connection for the whole session"
+        with patch('smtplib.SMTP') as psmtp:
+            mailer = letter.SMTPMailer('localhost', 25)
+            with mailer.session():
+                for i in range(3):
+                    mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+            psmtp.assert_called_once_with('localhost', 25)
+            self.assertEqual(0, psmtp.return_value.rset.call_count)
+            self.assertEqual(3, psmtp.return_value.sendmail.call_count)
+
+    def test_pipelining(self):
+        "Should send the envelope in one go if the relay pipelines"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            with patch.object(smtplib.SMTP, 'putcmd', autospec=True,
+                              side_effect=smtplib.SMTP.putcmd) as pputcmd:
+                mailer.send('bill@example.com', ['larry@example.com', 'sergey@example.com'],
+                            'Hi', plain='hai')
+                self.assertEqual(['ehlo'], [c[0][1] for c in pputcmd.call_args_list])
+            mailer.close()
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual(['larry@example.com', 'sergey@example.com'], sink.messages[0][1])
+
+    def test_send_bulk(self):
+        "Should send one DATA per MAX_RECIPIENTS recipients"
+        recipients = ['user{0}@example.com'.format(i) for i in range(5)]
+        with SMTPSink(refuse=['user1@example.com']) as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.max_recipients = 2
+            refused = mailer.send_bulk('bill@example.com', recipients, 'News', plain='hai')
+            mailer.close()
+        self.assertEqual(['user1@example.com'], list(refused))
+        self.assertEqual([['user0@example.com'],
+                          ['user2@example.com', 'user3@example.com'],
+                          ['user4@example.com']], [m[1] for m in sink.messages])
+        self.assertEqual(1, sink.connections)
+        msg = email.message_from_bytes(sink.messages[0][2])
+        self.assertEqual('undisclosed-recipients:;', msg['To'])
+
+    def test_send_bulk_all_refused(self):
+        "Should carry on after a batch that is refused outright"
+        with SMTPSink(refuse=['a@example.com', 'b@example.com']) as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.max_recipients = 2
+            refused = mailer.send_bulk('bill@example.com',
+                                       ['a@example.com', 'b@example.com', 'c@example.com'],
+                                       'News', plain='hai')
+            mailer.close()
+        self.assertEqual(set(['a@example.com', 'b@example.com']), set(refused))
+        self.assertEqual([['c@example.com']], [m[1] for m in sink.messages])
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def test_transient(self):
+        "Should retry 4xx replies and lost connections only"
+        self.assertTrue(letter._transient(smtplib.SMTPDataError(451, b'Later')))
+        self.assertTrue(letter._transient(smtplib.SMTPServerDisconnected()))
+        self.assertTrue(letter._transient(ConnectionRefusedError()))
+        self.assertTrue(letter._transient(
+            smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'Greylisted')})))
+        self.assertFalse(letter._transient(smtplib.SMTPDataError(554, b'No')))
+        self.assertFalse(letter._transient(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (450, b'Greylisted'), 'b@example.com': (550, b'No')})))
+        self.assertFalse(letter._transient(letter.NoContentError()))
+
+    def send(self, sink, **kwargs):
+        mailer = letter.SMTPMailer(sink.host, sink.port, **kwargs)
+        try:
+            return mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='hai')
+        finally:
+            mailer.close()
+
+    def test_retry(self):
+        "Should retry a temporary refusal over the same session"
+        with SMTPSink(script={'RCPT': ['451 Greylisted']}) as sink:
+            with patch('letter.time.sleep') as psleep:
+                self.send(sink)
+                self.assertEqual(1, psleep.call_count)
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual(1, sink.connections)
+
+    def test_retry_disconnect(self):
+        "Should retry over a new session after a 421"
+        with SMTPSink(script={'MAIL': ['421 Closing']}) as sink:
+            with patch('letter.time.sleep'):
+                self.send(sink)
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual(2, sink.connections)
+
+    def test_permanent(self):
+        "Should fail straight away"
+        with SMTPSink(script={'DATA': ['554 Spam']}) as sink:
+            with patch('letter.time.sleep') as psleep:
+                with self.assertRaises(smtplib.SMTPDataError):
+                    self.send(sink)
+                self.assertEqual(0, psleep.call_count)
+
+    def test_max_attempts(self):
+        "Should give up"
+        with SMTPSink(script={'DATA': ['452 Full'] * 3}) as sink:
+            with patch('letter.time.sleep') as psleep:
+                with self.assertRaises(smtplib.SMTPDataError):
+                    self.send(sink, max_attempts=2)
+                self.assertEqual(1, psleep.call_count)
+        self.assertEqual(['452 Full'], sink.script['DATA'])
+
+    def test_retry_budget(self):
+        "Should not wait past the budget"
+        with SMTPSink(script={'DATA': ['452 Full']}) as sink:
+            with patch('letter.time.sleep') as psleep:
+                with self.assertRaises(smtplib.SMTPDataError):
+                    self.send(sink, retry_budget=0)
+                self.assertEqual(0, psleep.call_count)
+
+
+class TemplateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'hai.txt')
+        with open(self.path, 'w') as fh:
+            fh.write('Hai {{ name }}')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def rewrite(self, contents):
+        with open(self.path, 'w') as fh:
+            fh.write(contents)
+        os.utime(self.path, (0, 0))
+
+    def test_render(self):
+        "Should render"
+        cache = letter.TemplateCache()
+        self.assertEqual('Hai Larry', cache.render(self.path, name='Larry'))
+
+    def test_compiles_once(self):
+        "Should not recompile a cached template"
+        cache = letter.TemplateCache()
+        with patch.object(letter.jinja2, 'Template', wraps=letter.jinja2.Template) as ptpl:
+            cache.render(self.path, name='Larry')
+            cache.render(self.path, name='Bill')
+            self.assertEqual(1, ptpl.call_count)
+
+    def test_no_check(self):
+        "Should ignore changes on disk"
+        cache = letter.TemplateCache()
+        cache.render(self.path, name='Larry')
+        self.rewrite('Bai {{ name }}')
+        self.assertEqual('Hai Larry', cache.render(self.path, name='Larry'))
+
+    def test_check(self):
+        "Should pick up changes on disk"
+        cache = letter.TemplateCache(check=True)
+        cache.render(self.path, name='Larry')
+        self.rewrite('Bai {{ name }}')
+        self.assertEqual('Bai Larry', cache.render(self.path, name='Larry'))
+
+    def test_postman_check_templates(self):
+        "Should respect CHECK_TEMPLATES set on a Postman instance"
+        postie = letter.Postman(self.tmpdir)
+        with postie.template('hai'):
+            self.assertEqual(('Hai Larry', None), postie.body(name='Larry'))
+            self.rewrite('Bai {{ name }}')
+            self.assertEqual(('Hai Larry', None), postie.body(name='Larry'))
+            postie.check_templates = True
+            self.assertEqual(('Bai Larry', None), postie.body(name='Larry'))
+
+    def test_evict(self):
+        "Should evict the least recently used template"
+        other = os.path.join(self.tmpdir, 'bai.txt')
+        with open(other, 'w') as fh:
+            fh.write('Bai')
+        cache = letter.TemplateCache(size=1)
+        cache.render(self.path, name='Larry')
+        cache.render(other)
+        self.assertEqual([other], list(cache._tpls))
+
+
+class TemplateIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = ffs.Path(tempfile.mkdtemp())
+        self.first, self.second = self.tmpdir + 'first', self.tmpdir + 'second'
+        os.mkdir(self.first)
+        os.mkdir(self.second)
+        for p in [self.first + 'hai.txt', self.second + 'hai.txt', self.second + 'hai.html']:
+            open(p, 'w').close()
+        self.index = letter.TemplateIndex()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        "Should find templates in the first directory that has them"
+        plain, html, jinja = self.index.lookup([self.first, self.second], 'hai')
+        self.assertEqual(self.first + 'hai.txt', plain)
+        self.assertEqual(self.second + 'hai.html', html)
+        self.assertEqual(None, jinja)
+
+    def test_lists_once(self):
+        "Should only list a directory once"
+        mockpath = MagicMock(name='MockPath')
+        mockpath.ls.return_value = ['that.jinja2', 'that.txt']
+        self.index.find([mockpath], 'that')
+        self.index.find([mockpath], 'that', extension='.txt')
+        mockpath.ls.assert_called_once_with()
+
+    def test_directory_changed(self):
+        "Should notice new templates"
+        self.assertEqual(None, self.index.find([self.first], 'bai'))
+        open(self.first + 'bai.jinja2', 'w').close()
+        os.utime(self.first, (0, 0))
+        self.assertEqual(self.first + 'bai.jinja2', self.index.find([self.first], 'bai'))
+
+    def test_stats_once_per_lookup(self):
+        "Should stat each directory once per lookup"
+        self.index.lookup([self.first, self.second], 'hai')
+        with patch.object(letter.os, 'stat', wraps=os.stat) as pstat:
+            self.index.lookup([self.first, self.second], 'hai')
+            self.assertEqual(2, pstat.call_count)
+
+    def test_subdirectory_changed(self):
+        "Should notice new templates in a subdirectory"
+        subdir = self.first + 'emails'
+        os.mkdir(subdir)
+        self.assertEqual(None, self.index.find([self.first], 'emails/bai'))
+        open(subdir + 'bai.jinja2', 'w').close()
+        os.utime(subdir, (0, 0))
+        self.assertEqual(subdir + 'bai.jinja2', self.index.find([self.first], 'emails/bai'))
+
+    def test_refresh(self):
+        "Should forget what we know"
+        mockpath = MagicMock(name='MockPath')
+        mockpath.ls.return_value = ['that.jinja2']
+        self.index.find([mockpath], 'that')
+        self.index.refresh()
+        self.index.find([mockpath], 'that')
+        self.assertEqual(2, mockpath.ls.call_count)
 
 
 class PostmanTestCase(unittest.TestCase):
@@ -99,6 +785,109 @@ class PostmanTestCase(unittest.TestCase):
         tpl = self.p._find_tpl('that')
         self.assertEqual(None, tpl)
 
+    def test_send_many(self):
+        "Should send one message per recipient, over one session"
+        self.p.tpls = [TEMPLATES]
+        self.p.mailer = MagicMock(name='Mock Mailer')
+        self.p.mailer.send.return_value = {}
+        recipients = [
+            ('larry@example.com', {'name': 'Larry'}),
+            ('bill@example.com', {'name': 'Bill'}),
+            ]
+        with self.p.template('greeting'):
+            results = self.p.send_many('me@example.com', 'Hi', recipients)
+        self.assertEqual(['larry@example.com', 'bill@example.com'], [r.to for r in results])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(1, self.p.mailer.session.call_count)
+        args, kwargs = self.p.mailer.send.call_args_list[1]
+        self.assertEqual('Hello Bill', kwargs['plain'])
+
+    def test_send_many_reports_failures(self):
+        "Should carry on past a failure"
+        self.p.tpls = [TEMPLATES]
+        self.p.mailer = MagicMock(name='Mock Mailer')
+        err = smtplib.SMTPRecipientsRefused({})
+        self.p.mailer.send.side_effect = [err, None]
+        recipients = [('larry@example.com', {}), ('bill@example.com', {})]
+        with self.p.template('greeting'):
+            results = self.p.send_many('me@example.com', 'Hi', recipients)
+        self.assertEqual([err, None], [r.error for r in results])
+        self.assertFalse(results[0].ok)
+
+    def test_send_many_partial_refusal(self):
+        "Should report addresses the server refused"
+        self.p.tpls = [TEMPLATES]
+        with SMTPSink(refuse=['bad@example.com']) as sink:
+            self.p.mailer = letter.SMTPMailer(sink.host, sink.port)
+            recipients = [(['larry@example.com', 'bad@example.com'], {'name': 'Larry'}),
+                          ('bill@example.com', {'name': 'Bill'})]
+            with self.p.template('greeting'):
+                results = self.p.send_many('me@example.com', 'Hi', recipients)
+            self.p.mailer.close()
+        self.assertEqual(['bad@example.com'], list(results[0].refused))
+        self.assertEqual(550, results[0].refused['bad@example.com'][0])
+        self.assertEqual(None, results[0].error)
+        self.assertFalse(results[0].ok)
+        self.assertTrue(results[1].ok)
+        self.assertEqual(2, len(sink.messages))
+
+    def test_send_many_test_environment(self):
+        "Should deliver into the test outbox"
+        self.p.tpls = [TEMPLATES]
+        outbox = letter.setup_test_environment()
+        try:
+            recipients = [('larry@example.com', {'name': 'Larry'}),
+                          ('bill@example.com', {'name': 'Bill'})]
+            with self.p.template('greeting'):
+                results = self.p.send_many('me@example.com', 'Hi', recipients)
+        finally:
+            letter.teardown_test_environment()
+        self.assertEqual([None, None], [r.error for r in results])
+        self.assertEqual(['larry@example.com', 'bill@example.com'], [m['To'] for m in outbox])
+        self.assertEqual('Hello Bill', outbox[1].get_payload()[0].get_payload())
+
+    def test_send_many_no_template(self):
+        "Should raise"
+        with self.assertRaises(letter.NoTemplateError):
+            self.p.send_many('me@example.com', 'Hi', [('larry@example.com', {})])
+
+    def test_template_per_thread(self):
+        "Threads sharing a Postman should each see their own template"
+        self.p.tpls = [TEMPLATES]
+        self.p.mailer = MagicMock(name='Mock Mailer')
+        barrier = threading.Barrier(2)
+
+        def send(name, to):
+            with self.p.template(name):
+                barrier.wait()
+                self.p.send('me@example.com', to, 'Hi', name='Larry', href='#', link='Hai')
+                barrier.wait()
+
+        threads = [threading.Thread(target=send, args=('greeting', 'greeting@example.com')),
+                   threading.Thread(target=send, args=('cool_email', 'cool@example.com'))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        bodies = dict((args[1], (kwargs['plain'], kwargs['html']))
+                      for args, kwargs in self.p.mailer.send.call_args_list)
+        self.assertEqual('Hello Larry', bodies['greeting@example.com'][0])
+        self.assertEqual(None, bodies['greeting@example.com'][1])
+        self.assertEqual(None, bodies['cool@example.com'][0])
+        self.assertIn('Hai', bodies['cool@example.com'][1])
+        self.assertEqual((None, None), (self.p.plain, self.p.html))
+
+    def test_send_template(self):
+        "Should bind a template for one call only"
+        self.p.tpls = [TEMPLATES]
+        self.p.mailer = MagicMock(name='Mock Mailer')
+        with self.p.template('cool_email'):
+            self.p.send_template('greeting', 'me@example.com', 'you@example.com', 'Hi',
+                                 name='Larry')
+            self.assertTrue(self.p.html.endswith('cool_email.html'))
+        args, kwargs = self.p.mailer.send.call_args
+        self.assertEqual('Hello Larry', kwargs['plain'])
+
 
 class DjangoPostmanTestCase(TestCase):
     def setUp(self):
@@ -125,6 +914,62 @@ class DjangoPostmanTestCase(TestCase):
 
         Message.send()
 
+    def test_session_one_connection(self):
+        "Should send every Letter in a session over one connection"
+        postie = letter.DjangoPostman()
+
+        class Message(letter.Letter):
+            Postie  = postie
+            To      = 'larry@example.com'
+            From    = 'bill@example.com'
+            Subject = 'Hi'
+            Body    = 'Hello Larry'
+
+        from django.core.mail import get_connection
+        with patch('django.core.mail.get_connection', wraps=get_connection) as connect:
+            with postie.session():
+                Message.send()
+                Message.send()
+        self.assertEqual(1, connect.call_count)
+        self.assertEqual(2, len(mail.outbox))
+
+    def test_send_many(self):
+        "Should send a batch over one connection"
+        postie = letter.DjangoPostman()
+        from django.core.mail import get_connection
+        with patch('django.core.mail.get_connection', wraps=get_connection) as connect:
+            with postie.template('emails/cool_email'):
+                results = postie.send_many('bill@example.com', 'Hi',
+                                           [('larry@example.com', {'href': 'a', 'link': 'b'}),
+                                            ('sergey@example.com', {'href': 'c', 'link': 'd'})])
+        self.assertEqual([True, True], [r.ok for r in results])
+        self.assertEqual(1, connect.call_count)
+        self.assertEqual([['larry@example.com'], ['sergey@example.com']],
+                         [m.to for m in mail.outbox])
+
+    def test_send_attachments(self):
+        "Should attach files, large ones encoded a chunk at a time"
+        tmpdir = tempfile.mkdtemp()
+        try:
+            small = os.path.join(tmpdir, 'small.bin')
+            large = os.path.join(tmpdir, 'large.bin')
+            with open(small, 'wb') as fh:
+                fh.write(b'\x00\xff' * 10)
+            with open(large, 'wb') as fh:
+                fh.write(os.urandom(200 * 1024))
+            mailer = letter.DjangoMailer()
+            mailer.stream_threshold = 100 * 1024
+            mailer.send('bill@example.com', 'larry@example.com', 'Hi', plain='Hai',
+                        attach=[small, large])
+            self.assertEqual(1, len(mailer.attachments._parts))
+        finally:
+            shutil.rmtree(tmpdir)
+        parsed = email.message_from_bytes(mail.outbox[0].message().as_bytes())
+        parts = [p for p in parsed.walk() if p.get_filename()]
+        self.assertEqual(['small.bin', 'large.bin'], [p.get_filename() for p in parts])
+        self.assertEqual(b'\x00\xff' * 10, parts[0].get_payload(decode=True))
+        self.assertEqual(200 * 1024, len(parts[1].get_payload(decode=True)))
+
 
 
 class TestLetterTestCase(unittest.TestCase):
@@ -270,6 +1115,48 @@ class TestLetterTestCase(unittest.TestCase):
         self.assertEqual(kwargs['attach'], None)
 
 
+class ImportTestCase(unittest.TestCase):
+    # `import letter` took about 44ms before its heavy imports were
+    # deferred, and about 14ms after - the budget leaves room for slow
+    # machines while still catching Jinja2 et al creeping back in.
+    budget_ms = 30
+    deferred  = ['email.generator', 'email.mime.multipart', 'email.policy', 'ffs', 'jinja2',
+                 'logging', 'mimetypes', 'smtplib', 'ssl', 'uuid']
+
+    def python(self, *args):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        return subprocess.run([sys.executable] + list(args), cwd=root, env=env, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def test_defers_heavy_imports(self):
+        "Should not import what a send may not need"
+        out = self.python('-c', 'import sys, letter; print("\\n".join(sys.modules))').stdout
+        loaded = set(out.split())
+        self.assertEqual([], [m for m in self.deferred if m in loaded])
+
+    def test_import_budget(self):
+        "Should import within budget"
+        # Warm the bytecode cache first, so we don't time compiling.
+        self.python('-c', 'import letter')
+        timings = []
+        for i in range(3):
+            err = self.python('-X', 'importtime', '-c', 'import letter').stderr
+            line = [l for l in err.splitlines() if l.endswith('| letter')][0]
+            timings.append(int(line.split('|')[1]) / 1000.0)
+        self.assertLess(min(timings), self.budget_ms)
+
+    def test_lazy_module(self):
+        "Should import on first use, and let tests patch through it"
+        self.assertIs(smtplib.SMTPDataError, letter.smtplib.SMTPDataError)
+        with patch.object(letter.jinja2, 'Template') as ptpl:
+            import jinja2
+            self.assertIs(ptpl, jinja2.Template)
+        self.assertIsNot(ptpl, jinja2.Template)
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+"""
+Unittests for the letter.mx module
+"""
+import smtplib
+import unittest
+
+from mock import MagicMock
+
+from letter import mx
+from test.smtpsink import SMTPSink, dead_port
+
+
+class MXCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.resolver = MagicMock(return_value=([(20, 'b.mx', 25), (10, 'a.mx', 25)], 120))
+        self.cache = mx.MXCache(self.resolver, clock=lambda: self.now)
+
+    def test_preference(self):
+        "Should put the most preferred exchanger first"
+        self.assertEqual([('a.mx', 25), ('b.mx', 25)], self.cache.get('example.com'))
+
+    def test_ttl(self):
+        "Should only ask again once the TTL is up"
+        self.cache.get('example.com')
+        self.now = 119
+        self.cache.get('example.com')
+        self.assertEqual(1, self.resolver.call_count)
+        self.now = 120
+        self.cache.get('example.com')
+        self.assertEqual(2, self.resolver.call_count)
+
+    def test_min_ttl(self):
+        "Should keep tiny TTLs for at least min_ttl"
+        self.resolver.return_value = ([(10, 'a.mx', 25)], 0)
+        self.cache.get('example.com')
+        self.now = 59
+        self.cache.get('example.com')
+        self.assertEqual(1, self.resolver.call_count)
+
+    def test_negative(self):
+        "Should remember domains that take no mail"
+        self.resolver.side_effect = mx.NoMXError('example.com')
+        for i in range(2):
+            with self.assertRaises(mx.NoMXError):
+                self.cache.get('example.com')
+        self.assertEqual(1, self.resolver.call_count)
+
+    def test_failure_not_cached(self):
+        "Should ask again after a lookup fails"
+        self.resolver.side_effect = [OSError('timeout'), ([(10, 'a.mx', 25)], 60)]
+        with self.assertRaises(OSError):
+            self.cache.get('example.com')
+        self.assertEqual([('a.mx', 25)], self.cache.get('example.com'))
+
+
+class MXMailerTestCase(unittest.TestCase):
+
+    def test_group(self):
+        "Should group recipients by domain"
+        mailer = mx.MXMailer(resolver=mx.StaticResolver({}))
+        self.assertEqual({'example.com': ['a@example.com', 'Bill <b@EXAMPLE.com>'],
+                          'example.org': ['c@example.org']},
+                         dict(mailer.group(['a@example.com', 'c@example.org',
+                                            'Bill <b@EXAMPLE.com>'])))
+
+    def test_one_session_per_domain(self):
+        "Should send each domain's recipients in one transaction"
+        with SMTPSink() as com, SMTPSink() as org:
+            mailer = mx.MXMailer(resolver=mx.StaticResolver({
+                'example.com': [(com.host, com.port)],
+                'example.org': [(org.host, org.port)]}))
+            mailer.send('bill@example.net', ['a@example.com', 'b@example.org', 'c@example.com'],
+                        'Hi', plain='hai')
+            mailer.send('bill@example.net', ['a@example.com'], 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual([['a@example.com', 'c@example.com'], ['a@example.com']],
+                         [m[1] for m in com.messages])
+        self.assertEqual([['b@example.org']], [m[1] for m in org.messages])
+        self.assertEqual(1, com.connections)
+
+    def test_next_exchanger(self):
+        "Should try the next exchanger when one doesn't answer"
+        with SMTPSink() as backup:
+            mailer = mx.MXMailer(resolver=mx.StaticResolver({
+                'example.com': [('127.0.0.1', dead_port()), (backup.host, backup.port)]}))
+            mailer.send('bill@example.net', 'a@example.com', 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual(1, len(backup.messages))
+
+    def test_refused(self):
+        "Should report refused recipients, and carry on with the others"
+        with SMTPSink(refuse=['b@example.com']) as sink:
+            mailer = mx.MXMailer(resolver=mx.StaticResolver({
+                'example.com': [(sink.host, sink.port)]}))
+            refused = mailer.send('bill@example.net', ['a@example.com', 'b@example.com',
+                                                       'c@nowhere.invalid'], 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual(['b@example.com', 'c@nowhere.invalid'], sorted(refused))
+        self.assertEqual(550, refused['c@nowhere.invalid'][0])
+        self.assertEqual([['a@example.com']], [m[1] for m in sink.messages])
+
+    def test_all_down(self):
+        "Should refuse with a 4xx when no exchanger answers"
+        mailer = mx.MXMailer(resolver=mx.StaticResolver({
+            'example.com': [('127.0.0.1', dead_port())]}))
+        with self.assertRaises(smtplib.SMTPRecipientsRefused) as cm:
+            mailer.send('bill@example.net', 'a@example.com', 'Hi', plain='hai')
+        self.assertEqual(451, cm.exception.recipients['a@example.com'][0])
+
+    def test_permanent(self):
+        "Should not try another exchanger for a 5xx"
+        with SMTPSink(script={'DATA': ['554 Spam']}) as one, SMTPSink() as two:
+            mailer = mx.MXMailer(resolver=mx.StaticResolver({
+                'example.com': [(one.host, one.port), (two.host, two.port)]}))
+            with self.assertRaises(smtplib.SMTPRecipientsRefused) as cm:
+                mailer.send('bill@example.net', 'a@example.com', 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual(554, cm.exception.recipients['a@example.com'][0])
+        self.assertEqual([], two.messages)
@@ -0,0 +1,132 @@
+"""
+Unittests for the letter.outbox module
+"""
+import os
+import shutil
+import smtplib
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from letter import outbox
+from test.smtpsink import SMTPSink
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mailer = outbox.SpoolMailer(self.tmpdir)
+        self.outbox = self.mailer.outbox
+        self.inner = MagicMock(name='Mock Mailer')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def spool(self):
+        self.mailer.send('bill@example.com', ['larry@example.com', 'bob@example.com'], 'Hi',
+                         plain='hai')
+
+    def test_spool(self):
+        "Should write complete messages to new/"
+        self.spool()
+        name, = self.outbox.pending()
+        self.assertEqual([], os.listdir(os.path.join(self.tmpdir, 'tmp')))
+        meta = self.outbox._meta('new', name)
+        self.assertEqual(['larry@example.com', 'bob@example.com'], meta['to'])
+        self.assertEqual(0, meta['attempts'])
+
+    def test_drain(self):
+        "Should deliver and remove spooled messages"
+        self.spool()
+        self.spool()
+        self.assertEqual((2, 0), self.outbox.drain(self.inner))
+        self.assertEqual(2, self.inner.deliver.call_count)
+        message, to = self.inner.deliver.call_args[0]
+        self.assertEqual('Hi', message['Subject'])
+        self.assertEqual(['larry@example.com', 'bob@example.com'], to)
+        for d in outbox.Outbox.dirs:
+            self.assertEqual([], os.listdir(os.path.join(self.tmpdir, d)))
+
+    def test_drain_failure(self):
+        "Should put failures back with a later retry time"
+        self.inner.deliver.side_effect = smtplib.SMTPServerDisconnected('Gone')
+        self.spool()
+        self.assertEqual((0, 1), self.outbox.drain(self.inner, backoff=60))
+        name, = self.outbox.pending()
+        meta = self.outbox._meta('new', name)
+        self.assertEqual(1, meta['attempts'])
+        self.assertIn('Gone', meta['last_error'])
+        # Not due yet
+        self.assertEqual((0, 0), self.outbox.drain(self.inner))
+        self.assertEqual(1, self.inner.deliver.call_count)
+
+    def test_drain_gives_up(self):
+        "Should move messages to failed/ after MAX_ATTEMPTS"
+        self.inner.deliver.side_effect = smtplib.SMTPServerDisconnected('Gone')
+        self.spool()
+        self.outbox.drain(self.inner, max_attempts=2, backoff=0)
+        self.outbox.drain(self.inner, max_attempts=2, backoff=0)
+        self.assertEqual([], self.outbox.pending())
+        self.assertEqual(1, len(self.outbox.failed()))
+
+    def test_drain_partial_refusal(self):
+        "Should put messages back for just the recipients refused for now"
+        self.inner.deliver.return_value = {'larry@example.com': (450, b'Busy')}
+        self.spool()
+        self.assertEqual((1, 0), self.outbox.drain(self.inner, backoff=0))
+        name, = self.outbox.pending()
+        meta = self.outbox._meta('new', name)
+        self.assertEqual(['larry@example.com'], meta['to'])
+        self.assertEqual(1, meta['attempts'])
+        self.assertIn('Busy', meta['last_error'])
+        self.inner.deliver.return_value = {}
+        self.assertEqual((1, 0), self.outbox.drain(self.inner))
+        self.assertEqual(['larry@example.com'], self.inner.deliver.call_args[0][1])
+        self.assertEqual([], self.outbox.pending())
+
+    def test_drain_permanent_refusal(self):
+        "Should record recipients refused for good, and not retry them"
+        self.inner.deliver.return_value = {'larry@example.com': (450, b'Busy'),
+                                           'bob@example.com': (550, b'No such user')}
+        self.spool()
+        self.outbox.drain(self.inner, backoff=0)
+        name, = self.outbox.pending()
+        meta = self.outbox._meta('new', name)
+        self.assertEqual(['larry@example.com'], meta['to'])
+        self.assertEqual({'bob@example.com': [550, 'No such user']}, meta['refused'])
+
+    def test_recover(self):
+        "Should put messages abandoned in cur/ back"
+        self.spool()
+        name, = self.outbox.pending()
+        self.outbox._move(name, 'new', 'cur')
+        self.assertEqual(1, self.outbox.recover())
+        self.assertEqual([name], self.outbox.pending())
+
+    def test_main(self):
+        "Should drain through SMTP"
+        self.spool()
+        with SMTPSink() as sink:
+            self.assertEqual(0, outbox.main([self.tmpdir, '--host', sink.host,
+                                             '--port', str(sink.port)]))
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual(['larry@example.com', 'bob@example.com'], sink.messages[0][1])
+        self.assertEqual([], self.outbox.pending())
+
+    def test_main_leaves_cur(self):
+        "Should leave other drains' messages in cur/ alone unless asked"
+        self.spool()
+        name, = self.outbox.pending()
+        self.outbox._move(name, 'new', 'cur')
+        with SMTPSink() as sink:
+            args = [self.tmpdir, '--host', sink.host, '--port', str(sink.port)]
+            outbox.main(args)
+            self.assertEqual(0, len(sink.messages))
+            outbox.main(args + ['--recover'])
+        self.assertEqual(1, len(sink.messages))
+        self.assertEqual([], os.listdir(os.path.join(self.tmpdir, 'cur')))
+
+
+if __name__ == '__main__':
+    unittest.main()
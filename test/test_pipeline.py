@@ -0,0 +1,92 @@
+"""
+Unittests for the letter.pipeline module
+"""
+from concurrent.futures import ThreadPoolExecutor
+import email
+import time
+import unittest
+
+import ffs
+from mock import patch
+
+import letter
+from letter import pipeline
+from test.smtpsink import SMTPSink
+
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
+
+
+class Unprintable(object):
+    def __str__(self):
+        raise ValueError('Unprintable')
+
+
+class SlowMailer(letter.BaseSMTPMailer):
+    def deliver_bytes(self, sender, to, data):
+        time.sleep(0.005)
+        return {}
+
+
+class QueueWatcher(ThreadPoolExecutor):
+    longest = 0
+
+    def submit(self, *args, **kwargs):
+        QueueWatcher.longest = max(QueueWatcher.longest, self._work_queue.qsize())
+        return super(QueueWatcher, self).submit(*args, **kwargs)
+
+
+class SendManyTestCase(unittest.TestCase):
+
+    def test_send_many(self):
+        "Should render in other processes, and report results in order"
+        people = [('user{0}@example.com'.format(i), {'name': 'User {0}'.format(i)})
+                  for i in range(20)]
+        people[3] = ('user3@example.com', {'name': Unprintable()})
+        with SMTPSink(refuse=['user5@example.com']) as sink:
+            postie = letter.SMTPPostman(templatedir=TEMPLATES, host=sink.host, port=sink.port)
+            with postie.template('greeting'):
+                results = pipeline.send_many(postie, 'me@example.com', 'Hi', people,
+                                             processes=2, batch_size=3)
+            postie.mailer.close()
+        self.assertEqual([p[0] for p in people], [r.to for r in results])
+        self.assertIsInstance(results[3].error, ValueError)
+        self.assertIsInstance(results[5].error, letter.smtplib.SMTPRecipientsRefused)
+        self.assertEqual(18, len([r for r in results if r.ok]))
+        self.assertEqual(18, len(sink.messages))
+        bodies = dict((m[1][0], email.message_from_bytes(m[2]).get_payload()[0].get_payload())
+                      for m in sink.messages)
+        self.assertEqual('Hello User 7', bodies['user7@example.com'])
+
+    def test_rejected(self):
+        "Should report malformed addresses as refused"
+        people = [(['larry@example.com', 'bogus'], {'name': 'Larry'}), ('bogus', {'name': 'Bo'})]
+        with SMTPSink() as sink:
+            postie = letter.SMTPPostman(templatedir=TEMPLATES, host=sink.host, port=sink.port)
+            with postie.template('greeting'):
+                results = pipeline.send_many(postie, 'me@example.com', 'Hi', people,
+                                             processes=1)
+            postie.mailer.close()
+        self.assertEqual({'bogus': letter._BAD_ADDRESS}, results[0].refused)
+        self.assertEqual(None, results[0].error)
+        self.assertEqual({'bogus': letter._BAD_ADDRESS}, results[1].error.recipients)
+        self.assertEqual(1, len(sink.messages))
+
+    def test_backlog(self):
+        "Should stop rendering while BACKLOG messages wait for delivery"
+        people = [('user{0}@example.com'.format(i), {'name': 'User {0}'.format(i)})
+                  for i in range(60)]
+        postie = letter.SMTPPostman(templatedir=TEMPLATES)
+        postie.mailer = SlowMailer()
+        QueueWatcher.longest = 0
+        with patch.object(pipeline, 'ThreadPoolExecutor', QueueWatcher):
+            with postie.template('greeting'):
+                results = pipeline.send_many(postie, 'me@example.com', 'Hi', people,
+                                             processes=2, workers=1, batch_size=10, backlog=4)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertTrue(0 < QueueWatcher.longest <= 4)
+
+    def test_no_template(self):
+        "Should insist on a template"
+        postie = letter.SMTPPostman(templatedir=TEMPLATES)
+        with self.assertRaises(letter.NoTemplateError):
+            pipeline.send_many(postie, 'me@example.com', 'Hi', [])
@@ -0,0 +1,179 @@
+"""
+Unittests for the letter.suppress module
+"""
+import asyncio
+import os
+import shutil
+import smtplib
+import tempfile
+import unittest
+
+import ffs
+from mock import patch
+
+import letter
+from letter import aio, failover, pipeline, suppress, throttle
+from test.smtpsink import SMTPSink
+
+TEMPLATES = ffs.Path(__file__).parent + 'templates/emails'
+
+
+class BloomFilterTestCase(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        "Should always find what was added"
+        bloom = suppress.BloomFilter(1000, 0.01)
+        keys = ['{0}@example.com'.format(i) for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_error_rate(self):
+        "Should rarely find what wasn't added"
+        bloom = suppress.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('{0}@example.com'.format(i))
+        false = sum('{0}@example.org'.format(i) in bloom for i in range(10000))
+        self.assertLess(false, 300)
+
+
+class SQLiteSuppressionListTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'suppressed.db')
+        self.suppressions = suppress.SQLiteSuppressionList(self.path, capacity=100)
+
+    def tearDown(self):
+        self.suppressions.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_filter(self):
+        "Should split off suppressed addresses, whatever their case"
+        self.suppressions.add('Gone@Example.com', 'bounce')
+        ok, suppressed = self.suppressions.filter(['larry@example.com', 'gone@example.com'])
+        self.assertEqual(['larry@example.com'], ok)
+        self.assertEqual({'gone@example.com': suppress.SUPPRESSED}, suppressed)
+        self.assertEqual('bounce', self.suppressions.reason('GONE@example.com'))
+
+    def test_remove(self):
+        "Should stop suppressing, despite the Bloom filter"
+        self.suppressions.add('gone@example.com')
+        self.suppressions.remove('gone@example.com')
+        self.assertTrue('gone@example.com' in self.suppressions.bloom)
+        self.assertFalse('gone@example.com' in self.suppressions)
+
+    def test_reopen(self):
+        "Should load the saved Bloom filter rather than rebuild it"
+        self.suppressions.add('gone@example.com')
+        self.suppressions.close()
+        with patch.object(suppress.BloomFilter, 'add') as padd:
+            self.suppressions = suppress.SQLiteSuppressionList(self.path)
+            self.assertEqual(0, padd.call_count)
+        self.assertTrue('gone@example.com' in self.suppressions)
+
+    def test_reopen_stale(self):
+        "Should rebuild the Bloom filter if the list changed after it was saved"
+        self.suppressions.save()
+        self.suppressions.add('gone@example.com')
+        self.suppressions._db.close()
+        self.suppressions = suppress.SQLiteSuppressionList(self.path)
+        self.assertTrue('gone@example.com' in self.suppressions)
+
+    def test_add_refused(self):
+        "Should suppress permanent refusals only"
+        added = self.suppressions.add_refused({'gone@example.com': (550, b'No such user'),
+                                               'busy@example.com': (451, b'Later')})
+        self.assertEqual(1, added)
+        self.assertEqual(set(['gone@example.com']),
+                         self.suppressions.suppressed(['gone@example.com', 'busy@example.com']))
+
+
+class MailerTestCase(unittest.TestCase):
+
+    def test_send(self):
+        "Should not deliver to suppressed addresses, and report them"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            refused = mailer.send('bill@example.com', ['larry@example.com', 'gone@example.com'],
+                                  'Hi', plain='hai')
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                mailer.send('bill@example.com', 'GONE@example.com', 'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual({'gone@example.com': suppress.SUPPRESSED}, refused)
+        self.assertEqual([['larry@example.com']], [m[1] for m in sink.messages])
+
+    def test_batch_sends(self):
+        "Should filter bulk and prepared sends"
+        with SMTPSink() as sink:
+            mailer = letter.SMTPMailer(sink.host, sink.port)
+            mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            refused = mailer.send_bulk('bill@example.com', ['larry@example.com',
+                                                            'gone@example.com'],
+                                       'Hi', plain='hai')
+            prepared = mailer.prepare('bill@example.com', 'Hi', bcc='gone@example.com')
+            mailer.send_prepared(prepared, 'sergey@example.com', plain='hai')
+            mailer.close()
+        self.assertEqual(['gone@example.com'], list(refused))
+        self.assertEqual([['larry@example.com'], ['sergey@example.com']],
+                         [m[1] for m in sink.messages])
+
+    def test_async(self):
+        "Should filter async sends, bulk sends and prepared sends"
+        async def go():
+            sink = await SMTPSink().start()
+            mailer = aio.AsyncSMTPMailer(sink.host, sink.port)
+            mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            to = ['larry@example.com', 'gone@example.com']
+            prepared = mailer.prepare('bill@example.com', 'Hi')
+            refused = [await mailer.send('bill@example.com', to, 'Hi', plain='hai'),
+                       await mailer.send_prepared(prepared, to, plain='hai'),
+                       await mailer.send_bulk('bill@example.com', to, 'Hi', plain='hai')]
+            await mailer.close()
+            await sink.stop()
+            return sink, refused
+        sink, refused = asyncio.run(go())
+        self.assertEqual([{'gone@example.com': suppress.SUPPRESSED}] * 3, refused)
+        self.assertEqual([['larry@example.com']] * 3, [m[1] for m in sink.messages])
+
+    def test_throttled(self):
+        "Should filter sends through a ThrottledMailer"
+        with SMTPSink() as sink:
+            mailer = throttle.ThrottledMailer(letter.SMTPMailer(sink.host, sink.port),
+                                              per_user=[(20, 60)])
+            mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            refused = mailer.send('bill@example.com', ['larry@example.com', 'gone@example.com'],
+                                  'Hi', plain='hai')
+            mailer.close()
+        self.assertEqual({'gone@example.com': suppress.SUPPRESSED}, refused)
+        self.assertEqual([['larry@example.com']], [m[1] for m in sink.messages])
+
+    def test_failover_send_many(self):
+        "Should filter prepared sends through a FailoverMailer"
+        with SMTPSink() as sink:
+            postie = failover.FailoverPostman(TEMPLATES, relays=[(sink.host, sink.port)])
+            postie.mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            with postie.template('greeting'):
+                results = postie.send_many('bill@example.com', 'Hi',
+                                           [('larry@example.com', {'name': 'Larry'}),
+                                            ('gone@example.com', {'name': 'Gone'})])
+            postie.mailer.close()
+        self.assertTrue(results[0].ok)
+        self.assertEqual({'gone@example.com': suppress.SUPPRESSED}, results[1].error.recipients)
+        self.assertEqual([['larry@example.com']], [m[1] for m in sink.messages])
+
+    def test_pipeline(self):
+        "Should filter sends rendered in other processes"
+        with SMTPSink() as sink:
+            postie = letter.SMTPPostman(templatedir=TEMPLATES, host=sink.host, port=sink.port)
+            postie.mailer.suppressions = suppress.MemorySuppressionList(['gone@example.com'])
+            with postie.template('greeting'):
+                results = pipeline.send_many(
+                    postie, 'bill@example.com', 'Hi',
+                    [(['larry@example.com', 'gone@example.com'], {'name': 'Larry'})],
+                    processes=1)
+            postie.mailer.close()
+        self.assertEqual({'gone@example.com': suppress.SUPPRESSED}, results[0].refused)
+        self.assertEqual([['larry@example.com']], [m[1] for m in sink.messages])
+
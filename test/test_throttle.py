@@ -0,0 +1,129 @@
+"""
+Unittests for the letter.throttle module
+"""
+import smtplib
+import unittest
+
+from mock import MagicMock
+
+import letter
+from letter import throttle
+
+
+class Clock(object):
+    "A clock that only moves when something sleeps"
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class RecordingMailer(letter.BaseSMTPMailer):
+    host = 'smtp.example.com'
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    def deliver(self, message, to):
+        self.sent.append((self.clock(), to))
+        return {}
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_bucket(self):
+        clock = Clock()
+        bucket = throttle.TokenBucket(2, per=10, clock=clock)
+        self.assertEqual(0, bucket.delay())
+        bucket.take()
+        bucket.take()
+        self.assertEqual(5, bucket.delay())
+        bucket.take()
+        self.assertEqual(10, bucket.delay())
+        clock.now += 10
+        self.assertEqual(0, bucket.delay())
+        bucket.drain()
+        self.assertEqual(5, bucket.delay())
+
+
+class ThrottledMailerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.inner = RecordingMailer(self.clock)
+
+    def mailer(self, **kwargs):
+        return throttle.ThrottledMailer(self.inner, clock=self.clock, sleep=self.clock.sleep,
+                                        **kwargs)
+
+    def send(self, mailer, to):
+        return mailer.send('bill@example.com', to, 'Hi', plain='hai')
+
+    def test_per_host(self):
+        "Should wait for tokens rather than fail"
+        mailer = self.mailer(per_host=[(2, 1)])
+        for i in range(4):
+            self.send(mailer, 'larry@example.com')
+        self.assertEqual([1000, 1000, 1000.5, 1001], [t for t, to in self.inner.sent])
+
+    def test_several_limits(self):
+        "Should honour every limit"
+        mailer = self.mailer(per_user=[(10, 1), (3, 60)])
+        for i in range(4):
+            self.send(mailer, 'larry@example.com')
+        self.assertEqual([20], self.clock.slept)
+
+    def test_per_domain(self):
+        "Should count recipients against their own domain"
+        mailer = self.mailer(per_domain=[(2, 1)])
+        self.send(mailer, ['a@example.com', 'b@example.com', 'c@example.org'])
+        self.send(mailer, 'd@example.org')
+        self.assertEqual([], self.clock.slept)
+        self.send(mailer, 'Eve <e@Example.com>')
+        self.assertEqual([0.5], self.clock.slept)
+
+    def test_no_block(self):
+        "Should raise rather than wait"
+        mailer = self.mailer(per_host=[(1, 1)], block=False)
+        self.send(mailer, 'larry@example.com')
+        with self.assertRaises(throttle.ThrottledError) as cm:
+            self.send(mailer, 'larry@example.com')
+        self.assertEqual(1, cm.exception.delay)
+        self.assertEqual(1, len(self.inner.sent))
+
+    def test_timeout(self):
+        mailer = self.mailer(per_host=[(1, 10)], timeout=5)
+        self.send(mailer, 'larry@example.com')
+        with self.assertRaises(throttle.ThrottledError):
+            self.send(mailer, 'larry@example.com')
+
+    def test_rate_limited(self):
+        "Should slow down when the relay says so"
+        mailer = self.mailer(per_host=[(10, 1)])
+        self.inner.deliver = MagicMock(side_effect=smtplib.SMTPDataError(421, b'Slow down'))
+        with self.assertRaises(smtplib.SMTPDataError):
+            self.send(mailer, 'larry@example.com')
+        self.inner.deliver = MagicMock(return_value={})
+        self.send(mailer, 'larry@example.com')
+        self.assertEqual([0.1], self.clock.slept)
+
+    def test_send_message(self):
+        "Should go through our mailer's send_message(), chunking and reporting bad addresses"
+        self.inner.max_recipients = 2
+        mailer = self.mailer(per_host=[(10, 1)])
+        refused = self.send(mailer, ['a@example.com', 'b@example.com', 'c@example.com', 'bogus'])
+        self.assertEqual([['a@example.com', 'b@example.com'], ['c@example.com']],
+                         [to for t, to in self.inner.sent])
+        self.assertEqual(['bogus'], list(refused))
+        self.assertEqual(553, refused['bogus'][0])
+
+    def test_gmail(self):
+        postie = letter.GmailPostman(user='larry', pw='secret', per_minute=20, per_day=500)
+        self.assertIsInstance(postie.mailer, throttle.ThrottledMailer)
+        self.assertEqual([(20, 60), (500, 86400)], postie.mailer.per_user)